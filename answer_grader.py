@@ -0,0 +1,277 @@
+import asyncio
+import re
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+from text_matcher import normalize_text
+from metrics import registry
+
+# Локальная проверка ответов на упражнения до обращения к модели
+ANSWER_GRADER_SETTINGS = {
+    "cache_size": 2000,         # Оценок в LRU-кеше (упражнение, нормализованный ответ)
+    "typo_min_length": 5,       # Опечатку (одна буква) прощаем только в словах не короче этого
+    "local_types": ("word_replacement",), # Упражнения с одним правильным ответом; остальные проверяет модель
+}
+
+ACCEPT = "accept"
+REJECT = "reject"
+UNCERTAIN = "uncertain"
+
+GRADES_TOTAL = registry.counter("answer_grades_total", "Exercise answer grades by tier and verdict")
+
+_WORD = re.compile(r"[a-z0-9а-яё]+(?:'[a-z]+)?")
+# Строки упражнения в формате get_exercise_prompt; значение может стоять и на следующей строке
+_EXPECTED_ANSWER = re.compile(r"ПРАВИЛЬНЫЙ ОТВЕТ\s*:[ \t]*\n?[ \t]*([^\n]+)", re.IGNORECASE)
+_TASK_LINE = re.compile(r"ЗАДАНИЕ\s*:[ \t]*\n?[ \t]*([^\n]+)", re.IGNORECASE)
+
+# Сокращения раскрываются, чтобы "I'm going" и "I am going" совпадали
+CONTRACTIONS = {
+    "i'm": "i am", "you're": "you are", "he's": "he is", "she's": "she is", "it's": "it is",
+    "we're": "we are", "they're": "they are", "that's": "that is", "there's": "there is",
+    "what's": "what is", "let's": "let us", "i've": "i have", "you've": "you have",
+    "we've": "we have", "they've": "they have", "i'll": "i will", "you'll": "you will",
+    "we'll": "we will", "they'll": "they will", "i'd": "i would", "you'd": "you would",
+    "don't": "do not", "doesn't": "does not", "didn't": "did not", "isn't": "is not",
+    "aren't": "are not", "wasn't": "was not", "weren't": "were not", "haven't": "have not",
+    "hasn't": "has not", "hadn't": "had not", "won't": "will not", "wouldn't": "would not",
+    "can't": "can not", "cannot": "can not", "couldn't": "could not", "shouldn't": "should not",
+}
+
+# Неправильные формы -> начальная форма (правильные формы снимаются окончаниями в lemma_key)
+IRREGULAR_FORMS = {
+    "am": "be", "is": "be", "are": "be", "was": "be", "were": "be", "been": "be", "being": "be",
+    "has": "have", "had": "have", "having": "have",
+    "does": "do", "did": "do", "done": "do", "doing": "do",
+    "goes": "go", "went": "go", "gone": "go", "going": "go",
+    "got": "get", "gotten": "get", "made": "make", "took": "take", "taken": "take",
+    "came": "come", "saw": "see", "seen": "see", "knew": "know", "known": "know",
+    "gave": "give", "given": "give", "found": "find", "thought": "think", "told": "tell",
+    "said": "say", "bought": "buy", "brought": "bring", "ate": "eat", "eaten": "eat",
+    "drank": "drink", "drunk": "drink", "wrote": "write", "written": "write",
+    "spoke": "speak", "spoken": "speak", "left": "leave", "felt": "feel", "met": "meet",
+    "paid": "pay", "sat": "sit", "stood": "stand", "ran": "run", "swam": "swim",
+    "began": "begin", "begun": "begin", "slept": "sleep", "kept": "keep", "sent": "send",
+    "spent": "spend", "built": "build", "taught": "teach", "caught": "catch", "flew": "fly",
+    "children": "child", "men": "man", "women": "woman", "people": "person",
+    "feet": "foot", "teeth": "tooth", "mice": "mouse",
+}
+
+
+class LocalGrade(NamedTuple):
+    verdict: str  # ACCEPT, REJECT или UNCERTAIN (решает модель)
+    feedback: str # Объяснение на русском для карточки упражнения
+
+
+def tokenize(text: str) -> List[str]:
+    """Нижний регистр, без знаков препинания, с раскрытыми сокращениями"""
+    lowered = normalize_text(text or "", normalize=False).replace("’", "'").replace("`", "'")
+    tokens = []
+    for word in _WORD.findall(lowered):
+        tokens.extend(CONTRACTIONS.get(word, word).split())
+    return tokens
+
+
+def lemma_key(word: str) -> str:
+    """
+    Грубая лемма для сравнения без учета формы слова: таблица неправильных форм и отбрасывание
+    окончаний -s/-es/-ies/-ed/-ing и конечной -e. Применяется к обеим сторонам сравнения,
+    поэтому ключ не обязан быть настоящим словом ("making" и "make" -> "mak").
+    """
+    word = IRREGULAR_FORMS.get(word, word)
+    if len(word) > 4 and word.endswith(("ies", "ied")):
+        word = word[:-3] + "y"
+    elif len(word) > 4 and word.endswith(("ing", "ed")):
+        word = word[:-3] if word.endswith("ing") else word[:-2]
+        if len(word) > 2 and word[-1] == word[-2] and word[-1] not in "lsz":
+            word = word[:-1] # running -> run, stopped -> stop
+    elif len(word) > 3 and word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        word = word[:-2]
+    elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    if len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+
+def _char_distance(a: str, b: str) -> int:
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def is_typo(a: str, b: str) -> bool:
+    """Одна лишняя/пропущенная/замененная буква в длинном слове ("scool" - "school").
+    Разные формы одного слова ("lives" - "lived") опечаткой не считаются."""
+    if a == b:
+        return True
+    if min(len(a), len(b)) < ANSWER_GRADER_SETTINGS["typo_min_length"] or abs(len(a) - len(b)) > 1:
+        return False
+    return lemma_key(a) != lemma_key(b) and _char_distance(a, b) <= 1
+
+
+def expected_answer(exercise: Dict) -> str:
+    """Строка "ПРАВИЛЬНЫЙ ОТВЕТ:" из текста упражнения; "" - если ее нет"""
+    content = (exercise.get("content") or "").replace("\\n", "\n")
+    match = _EXPECTED_ANSWER.search(content)
+    return match.group(1).strip() if match else ""
+
+
+def task_sentence(exercise: Dict) -> str:
+    """Строка "ЗАДАНИЕ:" (для word_replacement - предложение с ошибкой); "" - если ее нет"""
+    content = (exercise.get("content") or "").replace("\\n", "\n")
+    match = _TASK_LINE.search(content)
+    return match.group(1).strip() if match else ""
+
+
+def is_near_exact(expected: List[str], tokens: List[str]) -> bool:
+    """Те же слова в том же порядке, допускаются только опечатки (is_typo)"""
+    return len(expected) == len(tokens) and all(is_typo(a, b) for a, b in zip(expected, tokens))
+
+
+def grade_locally(exercise: Dict, user_answer: str) -> LocalGrade:
+    """
+    Первый уровень проверки. Локально решаются только однозначные случаи для упражнений
+    с одним правильным ответом (ANSWER_GRADER_SETTINGS["local_types"]): ответ совпадает со строкой
+    "ПРАВИЛЬНЫЙ ОТВЕТ:" точно или с опечатками - верно; ответ повторяет предложение с ошибкой - неверно.
+    Все остальное (переводы, свободные тексты, другие формулировки) - UNCERTAIN, решает модель.
+    """
+    tokens = tokenize(user_answer)
+    if not tokens:
+        return LocalGrade(REJECT, "Ответ пустой.")
+    if exercise.get("exercise_type", "") not in ANSWER_GRADER_SETTINGS["local_types"]:
+        return LocalGrade(UNCERTAIN, "")
+
+    expected_text = expected_answer(exercise)
+    expected = tokenize(expected_text)
+    if not expected:
+        return LocalGrade(UNCERTAIN, "")
+
+    if tokens == expected:
+        return LocalGrade(ACCEPT, "Отлично! Ответ полностью совпадает с правильным.")
+    if is_near_exact(expected, tokens):
+        return LocalGrade(ACCEPT, f"Верно! Проверьте написание: правильно '{expected_text}'.")
+
+    for wrong_text in (task_sentence(exercise), exercise.get("original_error", "")):
+        wrong = tokenize(wrong_text)
+        if wrong and wrong != expected and tokens == wrong:
+            return LocalGrade(REJECT, "В ответе осталась ошибка из задания.")
+    return LocalGrade(UNCERTAIN, "")
+
+
+class AnswerGrader:
+    """
+    Проверка ответов в два уровня: grade_locally, а к модели - только UNCERTAIN.
+    Оценки кешируются по (exercise_id, нормализованный ответ); одновременные проверки одного
+    и того же ответа ждут один запрос к модели. Неоднозначные ответы пачки (grade_many) уходят
+    одним вызовом batch_model_check, без него - model_check по одному, параллельно.
+    """
+
+    def __init__(self, model_check: Callable[[Dict, str], Awaitable[Dict]],
+                 batch_model_check: Callable[[List[Tuple[Dict, str]]], Awaitable[List[Dict]]] = None,
+                 cache_size: int = None):
+        self.model_check = model_check
+        self.batch_model_check = batch_model_check
+        self.cache_size = cache_size or ANSWER_GRADER_SETTINGS["cache_size"]
+        self.cache: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._checks: Set[asyncio.Task] = set() # Идущие проверки моделью (ссылки, чтобы их не собрал GC)
+
+    @staticmethod
+    def cache_key(exercise: Dict, user_answer: str) -> Tuple[str, str]:
+        return exercise.get("exercise_id", ""), " ".join(tokenize(user_answer))
+
+    def cached(self, exercise: Dict, user_answer: str) -> Optional[Dict]:
+        key = self.cache_key(exercise, user_answer)
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+        return result
+
+    def remember(self, exercise: Dict, user_answer: str, result: Dict):
+        if result.get("error"): # Сбой проверки не кешируется - следующая попытка спросит модель снова
+            return
+        self.cache[self.cache_key(exercise, user_answer)] = result
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def grade_without_model(self, exercise: Dict, user_answer: str) -> Optional[Dict]:
+        """Оценка из кеша или локальная; None - ответ неоднозначный, нужна модель"""
+        result = self.cached(exercise, user_answer)
+        if result is not None:
+            GRADES_TOTAL.inc(tier="cache", verdict="correct" if result["is_correct"] else "incorrect")
+            return result
+
+        local = grade_locally(exercise, user_answer)
+        if local.verdict == UNCERTAIN:
+            return None
+        result = {
+            "is_correct": local.verdict == ACCEPT,
+            "feedback": local.feedback,
+            "correct_answer": expected_answer(exercise),
+            "tier": "local",
+        }
+        GRADES_TOTAL.inc(tier="local", verdict=local.verdict)
+        self.remember(exercise, user_answer, result)
+        return result
+
+    async def grade(self, exercise: Dict, user_answer: str) -> Dict:
+        """Результат в формате проверки моделью: is_correct, feedback, correct_answer (+ tier)"""
+        return (await self.grade_many([(exercise, user_answer)]))[0]
+
+    async def grade_many(self, items: List[Tuple[Dict, str]]) -> List[Dict]:
+        """Оценки пачки ответов (упражнение, ответ) в порядке items"""
+        results: List[Optional[Dict]] = [None] * len(items)
+        waiting: List[Tuple[int, asyncio.Future]] = [] # Ответ уже проверяется (в том числе в этой же пачке)
+        to_model: Dict[Tuple[str, str], Tuple[Dict, str]] = {}
+        loop = asyncio.get_running_loop()
+        for index, (exercise, user_answer) in enumerate(items):
+            result = self.grade_without_model(exercise, user_answer)
+            if result is not None:
+                results[index] = result
+                continue
+            key = self.cache_key(exercise, user_answer)
+            if key not in self._pending:
+                self._pending[key] = loop.create_future()
+                to_model[key] = (exercise, user_answer)
+            waiting.append((index, self._pending[key]))
+
+        if to_model:
+            # Проверка идет в своей задаче: отмена этого вызова (ушли с экрана) не отменяет ее
+            # для других ждущих того же ответа
+            check = loop.create_task(self._grade_with_model(to_model))
+            self._checks.add(check)
+            check.add_done_callback(self._checks.discard)
+        for index, future in waiting:
+            results[index] = await asyncio.shield(future)
+        return results
+
+    async def _grade_with_model(self, to_model: Dict[Tuple[str, str], Tuple[Dict, str]]):
+        """Проверяет неоднозначные ответы моделью и завершает их future в self._pending (результатом или ошибкой)"""
+        keys = list(to_model)
+        pairs = [to_model[key] for key in keys]
+        futures = [self._pending[key] for key in keys]
+        try:
+            if self.batch_model_check is not None:
+                graded = await self.batch_model_check(pairs)
+            else:
+                graded = await asyncio.gather(*(self.model_check(exercise, answer) for exercise, answer in pairs))
+            for (exercise, user_answer), future, result in zip(pairs, futures, graded):
+                result = {**result, "tier": "model"}
+                GRADES_TOTAL.inc(tier="model", verdict="correct" if result.get("is_correct") else "incorrect")
+                self.remember(exercise, user_answer, result)
+                future.set_result(result)
+        except asyncio.CancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception() # Ожидающих может не быть - без предупреждения "exception was never retrieved"
+        finally:
+            for key in keys:
+                del self._pending[key]
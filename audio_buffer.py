@@ -0,0 +1,100 @@
+import io
+import struct
+from typing import Tuple, Union
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class PcmBuffer:
+    """Preallocated, growable byte buffer for recorded PCM chunks (no per-chunk allocations)"""
+
+    def __init__(self, capacity: int = 1 << 20):
+        self._data = bytearray(capacity)
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, chunk: BytesLike):
+        end = self._length + len(chunk)
+        if end > len(self._data):
+            self._grow(end)
+        self._data[self._length:end] = chunk
+        self._length = end
+
+    def _grow(self, min_capacity: int):
+        grown = bytearray(max(min_capacity, len(self._data) * 2))
+        grown[:self._length] = memoryview(self._data)[:self._length]
+        self._data = grown
+
+    def clear(self):
+        """Forgets the contents but keeps the allocated memory for the next recording"""
+        self._length = 0
+
+    def view(self) -> memoryview:
+        """
+        Zero-copy view of the recorded bytes. Release it (use `with`) before the next
+        append: a bytearray with exported views can't be resized.
+        """
+        return memoryview(self._data)[:self._length]
+
+
+def wav_header(data_size: int, sample_rate: int, channels: int, sample_width: int = 2) -> bytes:
+    """Canonical 44-byte PCM WAV header"""
+    byte_rate = sample_rate * channels * sample_width
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, block_align, sample_width * 8,
+        b"data", data_size
+    )
+
+
+def encode_wav(pcm: BytesLike, sample_rate: int, channels: int, sample_width: int = 2,
+               name: str = "speech.wav") -> io.BytesIO:
+    """
+    Builds a WAV file in memory. The returned BytesIO has a `name`, so it can be passed
+    straight to `audio.transcriptions.create(file=...)` without touching the disk.
+    """
+    wav_file = io.BytesIO()
+    wav_file.write(wav_header(len(pcm), sample_rate, channels, sample_width))
+    wav_file.write(pcm)
+    wav_file.seek(0)
+    wav_file.name = name
+    return wav_file
+
+
+def convert_pcm16(pcm: BytesLike, sample_rate: int, channels: int,
+                  target_rate: int = None, target_channels: int = None) -> Tuple[BytesLike, int, int]:
+    """
+    Downmixes int16 PCM to fewer channels and/or downsamples it to `target_rate`.
+    Returns (pcm, sample_rate, channels); the input is returned as is when nothing changes.
+    """
+    target_rate = target_rate or sample_rate
+    target_channels = target_channels or channels
+    if target_rate >= sample_rate and target_channels >= channels:
+        return pcm, sample_rate, channels
+
+    import numpy as np
+
+    samples = np.frombuffer(pcm, dtype=np.int16).reshape(-1, channels).astype(np.float32)
+    if target_channels < channels:
+        samples = samples.mean(axis=1, keepdims=True)
+        channels = 1
+
+    if target_rate < sample_rate:
+        ratio = sample_rate / target_rate
+        window = int(round(ratio))
+        if window > 1:
+            # Box filter against aliasing before dropping samples
+            kernel = np.ones(window, dtype=np.float32) / window
+            samples = np.stack([np.convolve(samples[:, c], kernel, mode="same") for c in range(channels)], axis=1)
+        source_positions = np.arange(0, len(samples), ratio)
+        samples = np.stack(
+            [np.interp(source_positions, np.arange(len(samples)), samples[:, c]) for c in range(channels)], axis=1
+        )
+        sample_rate = target_rate
+
+    converted = np.clip(np.round(samples), -32768, 32767).astype(np.int16)
+    return converted.tobytes(), sample_rate, channels
@@ -0,0 +1,205 @@
+import io
+import queue
+import threading
+import wave
+from typing import Iterator, Optional
+
+import pyaudio
+
+
+class AudioSink:
+    """
+    Persistent PyAudio output stream fed from a queue by a single writer thread.
+    The stream stays open between writes, so consecutive PCM pieces play back to back
+    without gaps or per-reply process/device setup.
+    With max_queued_seconds the queue is bounded and write() blocks while it is full,
+    so only call it from a worker thread then.
+    """
+
+    def __init__(self, audio: pyaudio.PyAudio, sample_rate: int, channels: int = 1,
+                 sample_width: int = 2, chunk_seconds: float = 0.1, max_queued_seconds: float = None):
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        # Writes are split into small pieces so flush() takes effect within one piece
+        self.chunk_bytes = int(sample_rate * chunk_seconds) * channels * sample_width
+        max_pieces = max(1, round(max_queued_seconds / chunk_seconds)) if max_queued_seconds else 0
+        self.queue: queue.Queue = queue.Queue(maxsize=max_pieces)
+        self._generation = 0 # Bumped by flush(); pieces queued under an older generation are dropped
+        self._stream = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    break
+                generation, pcm = item
+                if generation != self._generation:
+                    continue
+                if self._stream is None:
+                    self._stream = self.audio.open(
+                        format=self.audio.get_format_from_width(self.sample_width),
+                        channels=self.channels,
+                        rate=self.sample_rate,
+                        output=True
+                    )
+                self._stream.write(pcm)
+            except Exception as e:
+                print(f"Error writing audio: {e}")
+            finally:
+                self.queue.task_done()
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+
+    def write(self, pcm: bytes):
+        """Queues PCM for playback right after whatever is already queued"""
+        if self._closed or not pcm:
+            return
+        self._ensure_thread()
+        generation = self._generation
+        for offset in range(0, len(pcm), self.chunk_bytes):
+            if generation != self._generation:
+                return # Flushed while waiting for room in the queue
+            self.queue.put((generation, pcm[offset:offset + self.chunk_bytes]))
+
+    def flush(self):
+        """Drops everything queued; the piece being written finishes (at most chunk_seconds)"""
+        self._generation += 1
+
+    @property
+    def is_playing(self) -> bool:
+        return self.queue.unfinished_tasks > 0
+
+    def wait_idle(self):
+        """Blocks until everything queued has been played (or dropped)"""
+        self.queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        if self._thread and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=2.0)
+
+
+def decode_audio(data: bytes, response_format: str, sample_rate: int, channels: int = 1) -> Iterator[bytes]:
+    """
+    Decodes a TTS clip to int16 PCM at the sink's rate/channels, piece by piece, so playback
+    can start before the whole clip is decoded. "pcm" passes through, a matching WAV is read
+    with the stdlib, anything else (mp3, opus, aac, flac) goes through PyAV in-process.
+    """
+    if response_format == "pcm":
+        yield data
+        return
+    if response_format == "wav":
+        with wave.open(io.BytesIO(data)) as wav:
+            if (wav.getframerate(), wav.getnchannels(), wav.getsampwidth()) == (sample_rate, channels, 2):
+                yield wav.readframes(wav.getnframes())
+                return
+
+    try:
+        import av
+    except ImportError:
+        raise RuntimeError(f"Playing {response_format} audio requires PyAV (pip install av)")
+
+    resampler = av.AudioResampler(format="s16", layout="mono" if channels == 1 else "stereo", rate=sample_rate)
+    with av.open(io.BytesIO(data)) as container:
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                yield resampled.to_ndarray().tobytes()
+    for resampled in resampler.resample(None):
+        yield resampled.to_ndarray().tobytes()
+
+
+class PlaybackEngine:
+    """
+    In-process player: encoded clips are decoded on a worker thread into a bounded AudioSink,
+    so there is no process spawn per reply and at most max_queued_seconds of PCM sits ahead
+    of the device. Clips play in order; flush() drops everything queued or being decoded
+    (barge-in). write/flush/wait_idle match AudioSink, so StreamingSpeaker can use either.
+    """
+
+    def __init__(self, audio: pyaudio.PyAudio, sample_rate: int, channels: int = 1,
+                 max_queued_seconds: float = 2.0, max_pending_clips: int = 32):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sink = AudioSink(audio, sample_rate, channels, max_queued_seconds=max_queued_seconds)
+        self.queue: queue.Queue = queue.Queue(maxsize=max_pending_clips) # (generation, data, format)
+        self._generation = 0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    break
+                generation, data, response_format = item
+                for pcm in decode_audio(data, response_format, self.sample_rate, self.channels):
+                    if generation != self._generation:
+                        break
+                    self.sink.write(pcm)
+            except Exception as e:
+                print(f"Error playing audio: {e}")
+            finally:
+                self.queue.task_done()
+
+    def play(self, data: bytes, response_format: str = "pcm"):
+        """Queues a clip after whatever is already playing (never blocks the caller)"""
+        if self._closed or not data:
+            return
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait((self._generation, data, response_format))
+        except queue.Full:
+            print("Playback queue is full, dropping audio")
+
+    def write(self, pcm: bytes):
+        self.play(pcm, "pcm")
+
+    def flush(self):
+        """Stops playback: queued clips, the clip being decoded and queued PCM are dropped"""
+        self._generation += 1
+        self.sink.flush()
+
+    @property
+    def is_playing(self) -> bool:
+        return self.queue.unfinished_tasks > 0 or self.sink.is_playing
+
+    def wait_idle(self):
+        """Blocks until everything queued has been played (or dropped)"""
+        self.queue.join()
+        self.sink.wait_idle()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        if self._thread and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=2.0)
+        self.sink.close()
@@ -0,0 +1,284 @@
+"""
+Сквозной бенчмарк задержек на локальном FakeOpenAIServer (без сети и ключа API).
+
+    python benchmark.py                              # все сценарии, профиль default
+    python benchmark.py --scenario chat --requests 200 --concurrency 20 --profile flaky
+    python benchmark.py --json results.json          # результаты для сравнения между версиями
+    python benchmark.py --trace spans.jsonl          # плюс трассировка: время по этапам хода (tracing.py)
+    python benchmark.py --metrics metrics.json       # плюс снимок метрик процесса (metrics.py)
+
+Для каждого сценария печатаются p50/p95/p99 задержки, пропускная способность и число запросов
+к каждому эндпоинту. Все файлы (логи диалогов, кеш TTS) пишутся во временную папку.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_openai import FAKE_OPENAI_PROFILES, FakeOpenAIServer
+from model_gateway import ModelGateway
+from dialog_manager import DialogManager
+from templates import templates
+from tracing import tracer
+from metrics import registry
+
+BENCHMARK_SCENARIOS = ("chat", "help", "practice", "stt")
+
+USER_MESSAGES = (
+    "Hello, I goes to the restaurant yesterday and want a table for two.",
+    "Can I have the menu please? I am very hungry.",
+    "What do you recommend for the main course?",
+    "I would like a steak, medium rare, and a glass of water.",
+)
+
+
+class HeadlessPage:
+    """То, что ChatScreen использует у ft.Page, без окна и клиента Flet"""
+
+    def __init__(self):
+        self.window = SimpleNamespace(width=1000, height=800)
+
+    def update(self, *controls):
+        pass
+
+    def run_task(self, handler, *args):
+        return asyncio.get_running_loop().create_task(handler(*args))
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] if ordered else 0.0
+
+
+def scenario_role(scenario_key) -> str:
+    return templates[scenario_key]["description"]
+
+
+def seed_dialogs(dialog_manager: DialogManager, scenario_key, count: int = 3):
+    """Новые диалоги, чтобы анализ перед упражнениями каждый раз находил непроанализированные реплики"""
+    for _ in range(count):
+        messages = [{"role": "system", "content": "benchmark"}]
+        for text in USER_MESSAGES:
+            messages.append({"role": "user", "content": f"{text} ({uuid.uuid4().hex[:6]})"})
+            messages.append({"role": "assistant", "content": "Of course, here you are."})
+        dialog_manager.save_dialog(str(uuid.uuid4()), scenario_role(scenario_key), "medium", messages)
+
+
+async def make_chat(gateway: ModelGateway, concurrency: int, scenario_key, workdir: str) -> Callable[[int], Awaitable]:
+    from main_flet import ChatScreen # Flet нужен для контролов пузырей, но не окно
+
+    dialog_manager = DialogManager(logs_dir=os.path.join(workdir, "chat_logs"))
+    screens: asyncio.Queue = asyncio.Queue()
+    for _ in range(concurrency):
+        screen = ChatScreen(HeadlessPage(), None, scenario_key, scenario_role(scenario_key), "medium", "text",
+                            gateway, dialog_manager)
+        screen.chat_container = SimpleNamespace(controls=[])
+        screens.put_nowait(screen)
+
+    async def call(i: int):
+        screen = await screens.get() # Одна сессия - один ход за раз
+        try:
+            await screen.process_text_message(USER_MESSAGES[i % len(USER_MESSAGES)])
+        finally:
+            screens.put_nowait(screen)
+    return call
+
+
+async def make_help(gateway: ModelGateway, concurrency: int, scenario_key, workdir: str) -> Callable[[int], Awaitable]:
+    from help_system_flet import HelpSystem
+
+    help_system = HelpSystem(gateway, DialogManager(logs_dir=os.path.join(workdir, "help_logs")))
+    history = [
+        {"role": "assistant", "content": "Good evening! Welcome to our restaurant. Do you have a reservation?"},
+        {"role": "user", "content": USER_MESSAGES[0]},
+        {"role": "assistant", "content": "Certainly. Would you like to sit by the window or near the bar?"},
+    ]
+
+    async def call(i: int):
+        await help_system.generate_help_content(history, scenario_role(scenario_key), "medium")
+    return call
+
+
+async def make_practice(gateway: ModelGateway, concurrency: int, scenario_key, workdir: str) -> Callable[[int], Awaitable]:
+    from exercise_generator import ErrorAnalysisAndPracticeSystem
+
+    dialog_manager = DialogManager(gateway, logs_dir=os.path.join(workdir, "practice_logs"))
+    practice = ErrorAnalysisAndPracticeSystem(dialog_manager, client=gateway)
+
+    async def call(i: int):
+        seed_dialogs(dialog_manager, scenario_key)
+        await practice.run_full_error_analysis_and_practice()
+    return call
+
+
+async def make_stt(gateway: ModelGateway, concurrency: int, scenario_key, workdir: str) -> Callable[[int], Awaitable]:
+    import numpy as np
+    from voice_handler import VoiceHandler
+
+    handlers: asyncio.Queue = asyncio.Queue()
+    for _ in range(concurrency):
+        handlers.put_nowait(VoiceHandler(gateway))
+    probe = await handlers.get()
+    handlers.put_nowait(probe)
+    rate = probe.sample_rate
+    t = np.arange(rate * 2) / rate
+    speech = (np.sin(2 * np.pi * 220 * t) * 6000).astype(np.int16)
+    silence = np.zeros(rate, dtype=np.int16)
+    recording = np.concatenate([silence, speech, silence]).astype(np.int16).tobytes()
+    chunk_bytes = probe.chunk_size * probe.channels * probe.sample_width
+
+    async def call(i: int):
+        handler = await handlers.get()
+        try:
+            # Запись "проигрывается" через тот же буфер и VAD, что и с микрофона
+            handler.audio_buffer.clear()
+            handler.vad.reset()
+            for offset in range(0, len(recording), chunk_bytes):
+                chunk = recording[offset:offset + chunk_bytes]
+                handler.audio_buffer.append(chunk)
+                handler.vad.process(chunk)
+            await handler.transcribe_audio()
+        finally:
+            handlers.put_nowait(handler)
+    return call
+
+
+SCENARIO_FACTORIES = {
+    "chat": make_chat,
+    "help": make_help,
+    "practice": make_practice,
+    "stt": make_stt,
+}
+
+
+async def run_scenario(name: str, server: FakeOpenAIServer, gateway: ModelGateway, requests: int,
+                       concurrency: int, scenario_key, workdir: str, verbose: bool) -> Dict:
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            call = await SCENARIO_FACTORIES[name](gateway, concurrency, scenario_key, workdir)
+    except ImportError as e:
+        return {"scenario": name, "skipped": f"missing dependency: {e.name}"}
+
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    requests_before = Counter(server.requests)
+
+    async def timed(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await call(i)
+            except Exception as e:
+                errors += 1
+                if verbose:
+                    print(f"{name} #{i}: {type(e).__name__}: {e}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with output:
+        await asyncio.gather(*[timed(i) for i in range(requests)])
+        # Фоновые задачи хода (сводка, анализ ошибок) - часть нагрузки сценария
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        if pending:
+            await asyncio.wait(pending, timeout=30)
+    elapsed = time.perf_counter() - started
+
+    api_requests = Counter(server.requests)
+    api_requests.subtract(requests_before)
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "api_requests": {endpoint: count for endpoint, count in api_requests.items() if count},
+    }
+
+
+def print_stage_summary():
+    print(f"\n{'span':<36}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, stats in tracer.stage_summary().items():
+        print(f"{name:<36}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}")
+
+
+def print_report(results: List[Dict]):
+    print(f"\n{'scenario':<10}{'n':>6}{'conc':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>8}  api requests")
+    for result in results:
+        if "skipped" in result:
+            print(f"{result['scenario']:<10}  skipped ({result['skipped']})")
+            continue
+        api = ", ".join(f"{endpoint} {count}" for endpoint, count in sorted(result["api_requests"].items()))
+        print(f"{result['scenario']:<10}{result['requests']:>6}{result['concurrency']:>6}{result['errors']:>5}"
+              f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+              f"{result['throughput_rps']:>8.1f}  {api}")
+
+
+async def main(args):
+    if args.trace:
+        tracer.configure(enabled=True, sample_rate=1.0, export_path=args.trace, buffer_size=100000)
+    server = FakeOpenAIServer(args.profile).start()
+    gateway = ModelGateway(api_key="benchmark", base_url=server.base_url)
+    scenario_key = next(iter(templates))
+    scenarios = BENCHMARK_SCENARIOS if args.scenario == "all" else (args.scenario,)
+
+    results = []
+    cwd = os.getcwd()
+    # Логи диалогов каждого сценария - в своей папке внутри workdir; tts_cache и прочее - в самом workdir
+    with tempfile.TemporaryDirectory(prefix="benchmark_", ignore_cleanup_errors=True) as workdir:
+        os.chdir(workdir)
+        try:
+            for name in scenarios:
+                requests = args.requests if name != "practice" else max(1, args.requests // 10)
+                results.append(await run_scenario(name, server, gateway, requests, args.concurrency, scenario_key,
+                                                  workdir, args.verbose))
+        finally:
+            os.chdir(cwd)
+            await gateway.aclose()
+            server.stop()
+
+    print(f"Profile: {args.profile}, server {server.base_url}")
+    print_report(results)
+    print(f"API responses by status: {dict(server.responses)}")
+    if args.trace:
+        tracer.flush()
+        print_stage_summary()
+    if args.metrics:
+        registry.dump_json(args.metrics)
+        print(f"Metrics snapshot: {args.metrics}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"profile": args.profile, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark against a local fake OpenAI server")
+    parser.add_argument("--scenario", choices=BENCHMARK_SCENARIOS + ("all",), default="all")
+    parser.add_argument("--requests", type=int, default=50, help="Calls per scenario (practice runs a tenth of it)")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--profile", choices=tuple(FAKE_OPENAI_PROFILES), default="default")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--trace", help="Enable tracing and write spans (JSONL) to this file")
+    parser.add_argument("--metrics", help="Write a metrics registry snapshot (JSON) to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep application output")
+    args = parser.parse_args()
+    args.json = os.path.abspath(args.json) if args.json else None
+    args.trace = os.path.abspath(args.trace) if args.trace else None
+    args.metrics = os.path.abspath(args.metrics) if args.metrics else None
+    asyncio.run(main(args))
@@ -0,0 +1,243 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+import openai
+
+from metrics import registry
+
+# Политика вызовов по классам приоритета (PRIORITY_CLASSES из model_scheduler.py)
+CALL_POLICY_SETTINGS = {
+    "policies": {
+        # deadline - на весь вызов вместе с повторами; hedge - дублировать медленный запрос
+        "interactive": {"deadline": 25.0, "max_attempts": 3, "base_delay": 0.3, "max_delay": 2.0, "hedge": True},
+        "help":        {"deadline": 30.0, "max_attempts": 3, "base_delay": 0.5, "max_delay": 4.0, "hedge": False},
+        "voice":       {"deadline": 20.0, "max_attempts": 2, "base_delay": 0.3, "max_delay": 1.0, "hedge": False},
+        "background":  {"deadline": 180.0, "max_attempts": 5, "base_delay": 2.0, "max_delay": 30.0, "hedge": False},
+        "batch":       {"deadline": 300.0, "max_attempts": 5, "base_delay": 2.0, "max_delay": 30.0, "hedge": False},
+    },
+    # Дубль запроса уходит, если ответа нет дольше p95 последних задержек (не раньше hedge_min_delay)
+    "hedge_percentile": 95,
+    "hedge_min_samples": 20,     # Пока замеров меньше, порог - hedge_initial_delay
+    "hedge_initial_delay": 4.0,
+    "hedge_min_delay": 0.5,
+    "hedge_budget_ratio": 0.1,   # Не больше 10% вызовов с дублем
+    "latency_window": 200,
+    # Предохранитель: после failure_threshold сбоев подряд вызовы сразу отклоняются на open_seconds.
+    # Свой для каждой пары (операция, приоритет): сбои фоновых задач на лимитах не отключают интерактивный чат
+    "breaker_failure_threshold": 5,
+    "breaker_open_seconds": 20.0,
+}
+
+# Ошибки, после которых имеет смысл повторить запрос
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+POLICY_RETRIES = registry.counter("model_retries_total", "Retried model call attempts by operation, priority and error")
+POLICY_HEDGES = registry.counter("model_hedged_total", "Calls that sent a hedge request")
+POLICY_REJECTED = registry.counter("model_circuit_rejected_total", "Calls rejected by an open circuit breaker")
+
+
+class CircuitOpenError(Exception):
+    """API недавно сбоило подряд - вызов отклонен без запроса"""
+
+
+class DeadlineExceededError(Exception):
+    """Вызов не уложился в deadline своей политики"""
+
+
+class CircuitBreaker:
+    """closed -> open после failure_threshold сбоев подряд -> half-open (один пробный вызов) через open_seconds"""
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.open_seconds:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half-open" and self._probe_in_flight):
+            raise CircuitOpenError("Model API is temporarily unavailable")
+        if state == "half-open":
+            self._probe_in_flight = True
+
+    def release_probe(self):
+        """Вызов закончился без вердикта о здоровье API (отмена, ошибка запроса, а не сервиса)"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Скользящее окно задержек успешных вызовов"""
+
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+
+def retry_delay(attempt: int, base_delay: float, max_delay: float, error: Exception = None) -> float:
+    """Экспоненциальная задержка с полным джиттером; Retry-After из ответа 429 имеет приоритет"""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), max_delay)
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def is_retryable(error: Exception) -> bool:
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class CallPolicy:
+    """
+    Повторы, дедлайны, дублирование медленных запросов и предохранитель для вызовов модели.
+    call() получает фабрику попыток: каждая попытка - отдельный запрос (и отдельный слот планировщика).
+    Предохранитель и окно задержек - свои для каждой операции (chat, speech, transcription) и приоритета.
+    """
+
+    def __init__(self, settings: Dict = None):
+        self.settings = {**CALL_POLICY_SETTINGS, **(settings or {})}
+        self.policies = {**CALL_POLICY_SETTINGS["policies"], **self.settings["policies"]}
+        self.breakers: Dict[tuple, CircuitBreaker] = {}
+        self.latencies: Dict[tuple, LatencyTracker] = {}
+        self.calls = 0
+        self.hedged = 0
+
+    def breaker(self, operation: str, priority: str) -> CircuitBreaker:
+        key = (operation, priority)
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(
+                self.settings["breaker_failure_threshold"], self.settings["breaker_open_seconds"]
+            )
+        return self.breakers[key]
+
+    def tracker(self, operation: str, priority: str) -> LatencyTracker:
+        key = (operation, priority)
+        if key not in self.latencies:
+            self.latencies[key] = LatencyTracker(self.settings["latency_window"])
+        return self.latencies[key]
+
+    def hedge_delay(self, operation: str, priority: str) -> float:
+        tracker = self.tracker(operation, priority)
+        if len(tracker.samples) < self.settings["hedge_min_samples"]:
+            return self.settings["hedge_initial_delay"]
+        return max(self.settings["hedge_min_delay"], tracker.percentile(self.settings["hedge_percentile"]))
+
+    async def call(self, operation: str, priority: str, attempt: Callable[[], Awaitable],
+                   deadline: float = None, hedge: bool = None):
+        policy = self.policies[priority]
+        deadline = deadline or policy["deadline"]
+        hedge = policy["hedge"] if hedge is None else hedge
+        breaker = self.breaker(operation, priority)
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            POLICY_REJECTED.inc(operation=operation, priority=priority)
+            raise
+        self.calls += 1
+        started = time.monotonic()
+
+        try:
+            async with asyncio.timeout(deadline):
+                for attempt_number in range(policy["max_attempts"]):
+                    try:
+                        attempt_started = time.monotonic()
+                        if hedge:
+                            result = await self._hedged(operation, priority, attempt)
+                        else:
+                            result = await attempt()
+                    except asyncio.CancelledError:
+                        breaker.release_probe()
+                        raise
+                    except Exception as e:
+                        if not is_retryable(e):
+                            breaker.release_probe()
+                            raise
+                        breaker.record_failure()
+                        if attempt_number + 1 >= policy["max_attempts"]:
+                            raise
+                        breaker.before_call() # Открылся из-за этой серии сбоев - дальше не пробуем
+                        delay = retry_delay(attempt_number, policy["base_delay"], policy["max_delay"], e)
+                        POLICY_RETRIES.inc(operation=operation, priority=priority, error=type(e).__name__)
+                        print(f"⚠️ {operation} ({priority}): {type(e).__name__}, повтор через {delay:.1f} с")
+                        await asyncio.sleep(delay)
+                        continue
+                    breaker.record_success()
+                    self.tracker(operation, priority).add(time.monotonic() - attempt_started)
+                    return result
+        except TimeoutError:
+            breaker.record_failure()
+            raise DeadlineExceededError(
+                f"{operation} ({priority}) exceeded {deadline:.1f} s deadline after {time.monotonic() - started:.1f} s"
+            )
+
+    async def _hedged(self, operation: str, priority: str, attempt: Callable[[], Awaitable]):
+        """Первая попытка, а если она не ответила за hedge_delay - еще одна; побеждает первый успешный ответ"""
+        loop = asyncio.get_running_loop()
+        primary = loop.create_task(attempt())
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay(operation, priority))
+        if done or self.hedged >= self.calls * self.settings["hedge_budget_ratio"]:
+            return await primary
+
+        self.hedged += 1
+        POLICY_HEDGES.inc(operation=operation, priority=priority)
+        print(f"⏱️ {operation} ({priority}): ответа нет дольше порога, отправлен дубль запроса")
+        tasks = [primary, loop.create_task(attempt())]
+        pending = set(tasks)
+        winner = None
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = task
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            losers = [task for task in tasks if task is not winner]
+            for task in losers:
+                task.cancel()
+            for result in await asyncio.gather(*losers, return_exceptions=True):
+                close = getattr(result, "close", None) # Успевший ответить проигравший поток закрывается
+                if close and asyncio.iscoroutinefunction(close):
+                    await close()
@@ -0,0 +1,155 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from metrics import BACKGROUND_TASKS
+
+# Окно контекста для запросов к модели в чате
+CONTEXT_WINDOW_SETTINGS = {
+    "keep_last_turns": 6,         # Сколько последних ходов (реплика пользователя + ответ) всегда идут дословно
+    "summarize_batch_turns": 4,   # Сколько ходов сверх keep_last_turns копится до обновления сводки
+    "max_prompt_tokens": 3000,    # Бюджет на весь запрос (system + сводка + реплики), по оценке estimate_tokens
+    "summary_max_tokens": 250,    # Ограничение длины сводки
+    "summary_model": "gpt-4o-mini",
+}
+
+# Служебные токены на одно сообщение (роль, разделители) в формате chat
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Локальная оценка количества токенов без токенизатора:
+    ~4 символа ASCII на токен, не-ASCII (кириллица, эмодзи) - ~2 символа на токен
+    """
+    if not text:
+        return 0
+    if text.isascii():
+        return (len(text) + 3) // 4
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return (len(text) - non_ascii + 3) // 4 + (non_ascii + 1) // 2
+
+
+def estimate_message_tokens(message: Dict) -> int:
+    return estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextWindow:
+    """
+    Собирает сообщения для запроса к модели из полной истории диалога:
+    системный промпт + сводка старых ходов + последние ходы дословно, в пределах бюджета токенов.
+    Полная история (ChatScreen.messages) не меняется - она нужна для сохранения и анализа ошибок.
+
+    Сводка обновляется в фоне (after_turn), когда накапливается summarize_batch_turns ходов
+    сверх keep_last_turns; пока она считается, несведенные реплики идут в запрос дословно.
+    """
+
+    def __init__(self, client, settings: Optional[Dict] = None):
+        self.client = client
+        self.settings = {**CONTEXT_WINDOW_SETTINGS, **(settings or {})}
+        self.summary = ""
+        self.summarized_upto = 1 # Индекс в истории: сообщения [1, summarized_upto) уже в сводке
+        self._summary_task: Optional[asyncio.Task] = None
+
+    def reset(self):
+        """Сбрасывает сводку (новый системный промпт / новый диалог)"""
+        if self._summary_task and not self._summary_task.done():
+            self._summary_task.cancel()
+        self._summary_task = None
+        self.summary = ""
+        self.summarized_upto = 1
+
+    def summary_message(self) -> Optional[Dict]:
+        if not self.summary:
+            return None
+        return {"role": "system", "content": f"Summary of the earlier part of this conversation: {self.summary}"}
+
+    def build(self, messages: List[Dict]) -> List[Dict]:
+        """
+        Сообщения для запроса: messages[0] (системный промпт), сводка и дословный хвост истории.
+        Если хвост не помещается в бюджет, самые старые реплики отбрасываются.
+        """
+        if not messages:
+            return []
+        if self.summarized_upto > len(messages):
+            self.reset() # История начата заново
+
+        head = [messages[0]]
+        summary_message = self.summary_message()
+        if summary_message:
+            head.append(summary_message)
+        tail = messages[self.summarized_upto:]
+
+        budget = self.settings["max_prompt_tokens"] - sum(estimate_message_tokens(m) for m in head)
+        tail_tokens = [estimate_message_tokens(m) for m in tail]
+        total = sum(tail_tokens)
+        start = 0
+        # Последнее сообщение (текущая реплика пользователя) отправляется всегда
+        while total > budget and start < len(tail) - 1:
+            total -= tail_tokens[start]
+            start += 1
+        return head + tail[start:]
+
+    def after_turn(self, messages: List[Dict]):
+        """
+        Вызывается из event loop после ответа модели. Если несведенных ходов стало больше порога,
+        запускает обновление сводки в фоне (не на пути ответа пользователю).
+        """
+        if not self.client or (self._summary_task and not self._summary_task.done()):
+            return
+        scheduler = getattr(self.client, "scheduler", None)
+        if scheduler and scheduler.under_pressure("background"):
+            return # Лимиты API под нагрузкой: сводка обновится на следующем ходу, большей пачкой
+        keep_messages = self.settings["keep_last_turns"] * 2
+        batch_messages = self.settings["summarize_batch_turns"] * 2
+        summarize_upto = len(messages) - keep_messages
+        if summarize_upto - self.summarized_upto < batch_messages:
+            return
+        to_summarize = messages[self.summarized_upto:summarize_upto]
+        self._summary_task = asyncio.get_running_loop().create_task(
+            self._update_summary(to_summarize, summarize_upto)
+        )
+
+    async def _update_summary(self, to_summarize: List[Dict], summarize_upto: int):
+        dialog_text = "\n".join(f"{m['role']}: {m['content']}" for m in to_summarize if m["role"] != "system")
+        previous = self.summary or "(no summary yet)"
+        prompt = (
+            "Update the running summary of a role-play conversation between an English learner (user) "
+            "and an AI playing a role (assistant). Keep names, places, facts, decisions and open questions "
+            "the assistant must remember to stay in character. Be concise, plain prose, English only.\n\n"
+            f"Current summary:\n{previous}\n\nNew messages:\n{dialog_text}"
+        )
+        try:
+            with BACKGROUND_TASKS.track_inprogress(kind="context_summary"):
+                response = await self.client.chat(
+                    operation="context_summary",
+                    purpose="background",
+                    model=self.settings["summary_model"],
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.2,
+                    max_tokens=self.settings["summary_max_tokens"]
+                )
+            summary = (response.choices[0].message.content or "").strip()
+        except Exception as e:
+            print(f"⚠️ Не удалось обновить сводку диалога: {e}")
+            return
+        if summary:
+            self.summary = summary
+            self.summarized_upto = summarize_upto
+            print(f"📝 Сводка диалога обновлена: {summarize_upto - 1} сообщений, ~{estimate_tokens(summary)} токенов")
+
+
+# Оценка размера запроса на длинном диалоге: полная история против окна
+if __name__ == '__main__':
+    history = [{"role": "system", "content": "You are a waiter at a restaurant in London, UK. " * 10}]
+    for turn in range(1, 61):
+        history.append({"role": "user", "content": f"Turn {turn}: could I get another portion of the soup and some bread, please?"})
+        history.append({"role": "assistant", "content": f"Of course! Here is your soup number {turn}. Would you like anything else with it? " * 3})
+
+    window = ContextWindow(client=None)
+    window.summary = "The user ordered soup several times and asked for bread. " * 4
+    window.summarized_upto = len(history) - 2 * CONTEXT_WINDOW_SETTINGS["keep_last_turns"]
+    full_tokens = sum(estimate_message_tokens(m) for m in history)
+    window_messages = window.build(history)
+    window_tokens = sum(estimate_message_tokens(m) for m in window_messages)
+    print(f"Полная история: {len(history)} сообщений, ~{full_tokens} токенов")
+    print(f"Окно контекста: {len(window_messages)} сообщений, ~{window_tokens} токенов")
@@ -0,0 +1,630 @@
+import os
+import json
+import sqlite3
+import datetime
+import threading
+from collections import deque
+from typing import Dict, Any, Iterator, List, Optional
+
+# Хранилище по умолчанию: "jsonl" (файлы в dialog_logs/) или "sqlite" (dialog_logs/dialogs.db)
+STORAGE_BACKEND = os.environ.get("SPIKLY_STORAGE_BACKEND", "jsonl")
+
+# Журнал изменений профиля ошибок уплотняется в user_error_profile.json,
+# когда в нем становится больше строк, чем записей в профиле (но не раньше этого порога)
+PROFILE_JOURNAL_COMPACT_MIN = 200
+
+
+def _matches(entry: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    return all(entry.get(key) == value for key, value in filters.items())
+
+
+class DialogStorage:
+    """Интерфейс хранилища DialogManager: журналы событий, диалоги и профиль ошибок"""
+
+    # Потоки событий, которые пишет DialogManager
+    STREAMS = ("errors", "help_requests", "aggressive_incidents", "user_errors_raw", "coins", "analyzed_messages", "exercise_links")
+
+    def append(self, stream: str, entry: Dict[str, Any]):
+        """Добавляет одну запись в конец потока"""
+        raise NotImplementedError
+
+    def iter_entries(self, stream: str, **filters) -> Iterator[Dict[str, Any]]:
+        """Отдает записи потока по порядку, не загружая его целиком; filters - равенство полей записи"""
+        raise NotImplementedError
+
+    def count(self, stream: str, **filters) -> int:
+        """Возвращает количество записей в потоке"""
+        return sum(1 for _ in self.iter_entries(stream, **filters))
+
+    def tail(self, stream: str, limit: int, **filters) -> List[Dict[str, Any]]:
+        """Последние limit записей потока (в порядке добавления)"""
+        return list(deque(self.iter_entries(stream, **filters), maxlen=limit))
+
+    def save_dialog(self, dialog_data: Dict[str, Any], keep_last: int = 3):
+        """Сохраняет диалог и оставляет только keep_last последних"""
+        raise NotImplementedError
+
+    def recent_dialogs(self, limit: int) -> List[Dict[str, Any]]:
+        """Последние диалоги, новые первыми"""
+        raise NotImplementedError
+
+    def dialog_stats(self) -> Dict[str, Any]:
+        """Количество диалогов и распределения по сценариям и сложности"""
+        raise NotImplementedError
+
+    def load_error_profile(self) -> Dict[str, Dict]:
+        """Загружает профиль ошибок пользователя (error_key -> данные ошибки)"""
+        raise NotImplementedError
+
+    def save_error_profile(self, error_profile: Dict[str, Dict]):
+        """Сохраняет профиль ошибок пользователя"""
+        raise NotImplementedError
+
+    def save_error_profile_entries(self, changed: Dict[str, Dict], error_profile: Dict[str, Dict]):
+        """
+        Сохраняет только измененные записи профиля (changed); error_profile - профиль целиком,
+        нужен хранилищам без частичной записи и для периодического уплотнения
+        """
+        self.save_error_profile(error_profile)
+
+
+class JsonlStorage(DialogStorage):
+    """
+    Append-only хранилище: один файл <stream>.jsonl на поток, одна JSON-запись на строку.
+    Запись - O(1) дозапись в конец файла, чтение - потоковое.
+    """
+
+    def __init__(self, logs_dir: str):
+        self.logs_dir = logs_dir
+        self.error_profile_file = os.path.join(self.logs_dir, "user_error_profile.json")
+        # Изменения профиля дописываются сюда построчно и периодически сворачиваются в error_profile_file
+        self.error_profile_journal = os.path.join(self.logs_dir, "user_error_profile.journal.jsonl")
+        self._journal_lines = 0
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {} # Кеш количества записей, заполняется при первом обращении
+        if not os.path.exists(self.logs_dir):
+            os.makedirs(self.logs_dir)
+        if not os.path.exists(self.error_profile_file):
+            with open(self.error_profile_file, 'w', encoding='utf-8') as f:
+                json.dump({}, f)
+            print(f"Created log file: {self.error_profile_file}")
+
+    def stream_path(self, stream: str) -> str:
+        return os.path.join(self.logs_dir, f"{stream}.jsonl")
+
+    def append(self, stream: str, entry: Dict[str, Any]):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.stream_path(stream), 'a', encoding='utf-8') as f:
+                f.write(line)
+            if stream in self._counts:
+                self._counts[stream] += 1
+
+    def iter_entries(self, stream: str, **filters) -> Iterator[Dict[str, Any]]:
+        path = self.stream_path(stream)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя строка (например, после падения процесса) не должна ломать чтение
+                    print(f"Warning: skipping corrupted line {line_number} in {path}")
+                    continue
+                if _matches(entry, filters):
+                    yield entry
+
+    def count(self, stream: str, **filters) -> int:
+        if filters:
+            return super().count(stream, **filters)
+        with self._lock:
+            if stream not in self._counts:
+                self._counts[stream] = sum(1 for _ in self.iter_entries(stream))
+            return self._counts[stream]
+
+    def _dialog_files(self) -> List[tuple]:
+        """(mtime, путь, имя файла) для всех dialog_*.json, новые первыми"""
+        dialog_files = []
+        for filename in os.listdir(self.logs_dir):
+            if filename.startswith("dialog_") and filename.endswith(".json"):
+                file_path = os.path.join(self.logs_dir, filename)
+                dialog_files.append((os.path.getmtime(file_path), file_path, filename))
+        dialog_files.sort(reverse=True)
+        return dialog_files
+
+    def save_dialog(self, dialog_data: Dict[str, Any], keep_last: int = 3):
+        timestamp_str_file = datetime.datetime.fromisoformat(dialog_data["timestamp_iso"]).strftime("%Y%m%d_%H%M%S")
+        filename = f"dialog_{timestamp_str_file}_{dialog_data['dialog_id']}.json"
+        with open(os.path.join(self.logs_dir, filename), 'w', encoding='utf-8') as f:
+            json.dump(dialog_data, f, ensure_ascii=False, indent=2)
+
+        # Удаляем файлы старше keep_last последних
+        for _, file_path, filename in self._dialog_files()[keep_last:]:
+            try:
+                os.remove(file_path)
+                print(f"Deleted old dialog: {filename}")
+            except Exception as e:
+                print(f"Error deleting dialog {file_path}: {e}")
+
+    def recent_dialogs(self, limit: int) -> List[Dict[str, Any]]:
+        dialogs = []
+        for _, file_path, filename in self._dialog_files()[:limit]:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    dialog_data = json.load(f)
+                    dialogs.append(dialog_data)
+                    print(f"📁 Загружен диалог: {filename} ({len(dialog_data.get('messages', []))} сообщений)")
+            except Exception as e:
+                print(f"❌ Ошибка загрузки диалога {filename}: {e}")
+        return dialogs
+
+    def dialog_stats(self) -> Dict[str, Any]:
+        stats = {"total_dialogs": 0, "scenarios_used": {}, "difficulty_distribution": {}}
+        for _, file_path, filename in self._dialog_files():
+            stats["total_dialogs"] += 1
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    scenario = data.get("scenario", "unknown")
+                    difficulty = data.get("difficulty", "unknown")
+                    stats["scenarios_used"][scenario] = stats["scenarios_used"].get(scenario, 0) + 1
+                    stats["difficulty_distribution"][difficulty] = stats["difficulty_distribution"].get(difficulty, 0) + 1
+            except Exception as e:
+                print(f"Error reading dialog {filename}: {e}")
+        return stats
+
+    def load_error_profile(self) -> Dict[str, Dict]:
+        error_profile = {}
+        if os.path.exists(self.error_profile_file):
+            try:
+                with open(self.error_profile_file, 'r', encoding='utf-8') as f:
+                    error_profile = json.load(f)
+            except json.JSONDecodeError:
+                print(f"Warning: {self.error_profile_file} is corrupted. Initializing new profile.")
+
+        # Поверх снимка применяются изменения из журнала: каждая строка - запись профиля целиком
+        journal_lines = 0
+        if os.path.exists(self.error_profile_journal):
+            with open(self.error_profile_journal, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        change = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"Warning: skipping corrupted line in {self.error_profile_journal}")
+                        continue
+                    error_profile[change["error_key"]] = change["data"]
+                    journal_lines += 1
+        self._journal_lines = journal_lines
+        return error_profile
+
+    def save_error_profile(self, error_profile: Dict[str, Dict]):
+        with self._lock:
+            # Снимок пишется во временный файл и подменяется атомарно, после этого журнал уже не нужен
+            tmp_file = self.error_profile_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(error_profile, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_file, self.error_profile_file)
+            open(self.error_profile_journal, 'w').close()
+            self._journal_lines = 0
+
+    def save_error_profile_entries(self, changed: Dict[str, Dict], error_profile: Dict[str, Dict]):
+        lines = "".join(
+            json.dumps({"error_key": error_key, "data": data}, ensure_ascii=False) + "\n"
+            for error_key, data in changed.items()
+        )
+        with self._lock:
+            with open(self.error_profile_journal, 'a', encoding='utf-8') as f:
+                f.write(lines)
+            self._journal_lines += len(changed)
+            needs_compaction = self._journal_lines > max(PROFILE_JOURNAL_COMPACT_MIN, len(error_profile))
+        if needs_compaction:
+            self.save_error_profile(error_profile)
+
+
+class SqliteStorage(DialogStorage):
+    """
+    Хранилище в одной SQLite базе (WAL) для многих учеников на одном хосте.
+    Статистика, последние диалоги и выборки ошибок - индексированные запросы вместо обхода dialog_logs/.
+    Каждая запись потока хранится целиком в колонке data, индексируемые поля вынесены в отдельные колонки.
+    """
+
+    # Поток -> (таблица, {поле записи: колонка}). Остальные потоки лежат в общей таблице events.
+    STREAM_TABLES = {
+        "errors": ("errors", {"type": "error_type"}),
+        "help_requests": ("help_requests", {"type": "request_type", "dialog_id": "dialog_id"}),
+    }
+    EVENT_COLUMNS = {"dialog_id": "dialog_id", "error_type": "error_type"}
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS dialogs (
+            dialog_id TEXT PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            scenario TEXT,
+            difficulty TEXT,
+            message_count INTEGER,
+            duration_minutes REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_dialogs_timestamp ON dialogs(timestamp);
+
+        CREATE TABLE IF NOT EXISTS messages (
+            dialog_id TEXT NOT NULL REFERENCES dialogs(dialog_id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT,
+            PRIMARY KEY (dialog_id, position)
+        );
+
+        CREATE TABLE IF NOT EXISTS errors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            error_type TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_errors_type ON errors(error_type, id);
+        CREATE INDEX IF NOT EXISTS idx_errors_timestamp ON errors(timestamp);
+
+        CREATE TABLE IF NOT EXISTS help_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            dialog_id TEXT,
+            request_type TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_help_requests_dialog ON help_requests(dialog_id);
+        CREATE INDEX IF NOT EXISTS idx_help_requests_timestamp ON help_requests(timestamp);
+        CREATE INDEX IF NOT EXISTS idx_help_requests_type ON help_requests(request_type, id);
+
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            stream TEXT NOT NULL,
+            timestamp TEXT,
+            dialog_id TEXT,
+            error_type TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_events_stream ON events(stream, id);
+        CREATE INDEX IF NOT EXISTS idx_events_dialog ON events(dialog_id);
+        CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp);
+
+        CREATE TABLE IF NOT EXISTS error_profile (
+            error_key TEXT PRIMARY KEY,
+            error_type TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_error_profile_type ON error_profile(error_type);
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        # Соединение разделяется между event loop и рабочими потоками (asyncio.to_thread), поэтому под замком
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(self.SCHEMA)
+
+    def _stream_query(self, stream: str, filters: Dict[str, Any]):
+        """Таблица, WHERE и параметры для потока; поля без колонки фильтруются в Python"""
+        if stream in self.STREAM_TABLES:
+            table, columns = self.STREAM_TABLES[stream]
+            clauses, params = [], []
+        else:
+            table, columns = "events", self.EVENT_COLUMNS
+            clauses, params = ["stream = ?"], [stream]
+        leftover = {}
+        for key, value in filters.items():
+            if key in columns:
+                clauses.append(f"{columns[key]} = ?")
+                params.append(value)
+            else:
+                leftover[key] = value
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return table, where, params, leftover
+
+    def append(self, stream: str, entry: Dict[str, Any]):
+        data = json.dumps(entry, ensure_ascii=False)
+        with self._lock, self._conn:
+            if stream == "errors":
+                self._conn.execute(
+                    "INSERT INTO errors (timestamp, error_type, data) VALUES (?, ?, ?)",
+                    (entry.get("timestamp"), entry.get("type"), data)
+                )
+            elif stream == "help_requests":
+                self._conn.execute(
+                    "INSERT INTO help_requests (timestamp, dialog_id, request_type, data) VALUES (?, ?, ?, ?)",
+                    (entry.get("timestamp"), entry.get("dialog_id"), entry.get("type"), data)
+                )
+            else:
+                self._conn.execute(
+                    "INSERT INTO events (stream, timestamp, dialog_id, error_type, data) VALUES (?, ?, ?, ?, ?)",
+                    (stream, entry.get("timestamp"), entry.get("dialog_id"), entry.get("error_type"), data)
+                )
+
+    def iter_entries(self, stream: str, **filters) -> Iterator[Dict[str, Any]]:
+        table, where, params, leftover = self._stream_query(stream, filters)
+        with self._lock:
+            cursor = self._conn.execute(f"SELECT data FROM {table}{where} ORDER BY id", params)
+        while True:
+            # Читаем пачками, чтобы не держать весь поток в памяти и не занимать соединение надолго
+            with self._lock:
+                rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            for (data,) in rows:
+                entry = json.loads(data)
+                if _matches(entry, leftover):
+                    yield entry
+
+    def count(self, stream: str, **filters) -> int:
+        table, where, params, leftover = self._stream_query(stream, filters)
+        if leftover:
+            return super().count(stream, **filters)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {table}{where}", params).fetchone()[0]
+
+    def tail(self, stream: str, limit: int, **filters) -> List[Dict[str, Any]]:
+        table, where, params, leftover = self._stream_query(stream, filters)
+        if leftover:
+            return super().tail(stream, limit, **filters)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT data FROM {table}{where} ORDER BY id DESC LIMIT ?", params + [limit]
+            ).fetchall()
+        return [json.loads(data) for (data,) in reversed(rows)]
+
+    def save_dialog(self, dialog_data: Dict[str, Any], keep_last: int = 3):
+        dialog_id = dialog_data["dialog_id"]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dialogs (dialog_id, timestamp, scenario, difficulty, message_count, duration_minutes) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (dialog_id, dialog_data["timestamp_iso"], dialog_data.get("scenario"), dialog_data.get("difficulty"),
+                 dialog_data.get("message_count"), dialog_data.get("duration_minutes"))
+            )
+            self._conn.execute("DELETE FROM messages WHERE dialog_id = ?", (dialog_id,))
+            self._conn.executemany(
+                "INSERT INTO messages (dialog_id, position, role, content) VALUES (?, ?, ?, ?)",
+                [(dialog_id, position, msg["role"], msg["content"]) for position, msg in enumerate(dialog_data.get("messages", []))]
+            )
+            # Как и файловое хранилище, оставляем только keep_last последних диалогов
+            deleted = self._conn.execute(
+                "DELETE FROM dialogs WHERE dialog_id NOT IN "
+                "(SELECT dialog_id FROM dialogs ORDER BY timestamp DESC LIMIT ?)",
+                (keep_last,)
+            ).rowcount
+        if deleted:
+            print(f"Deleted {deleted} old dialog(s)")
+
+    def recent_dialogs(self, limit: int) -> List[Dict[str, Any]]:
+        dialogs = []
+        with self._lock:
+            dialog_rows = self._conn.execute(
+                "SELECT dialog_id, timestamp, scenario, difficulty, message_count, duration_minutes "
+                "FROM dialogs ORDER BY timestamp DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+            for dialog_id, timestamp, scenario, difficulty, message_count, duration_minutes in dialog_rows:
+                messages = [
+                    {"role": role, "content": content}
+                    for role, content in self._conn.execute(
+                        "SELECT role, content FROM messages WHERE dialog_id = ? ORDER BY position", (dialog_id,)
+                    )
+                ]
+                dialogs.append({
+                    "dialog_id": dialog_id,
+                    "timestamp_iso": timestamp,
+                    "scenario": scenario,
+                    "difficulty": difficulty,
+                    "messages": messages,
+                    "message_count": message_count,
+                    "duration_minutes": duration_minutes
+                })
+                print(f"📁 Загружен диалог: {dialog_id} ({len(messages)} сообщений)")
+        return dialogs
+
+    def dialog_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM dialogs").fetchone()[0]
+            scenarios = self._conn.execute(
+                "SELECT COALESCE(scenario, 'unknown'), COUNT(*) FROM dialogs GROUP BY 1"
+            ).fetchall()
+            difficulties = self._conn.execute(
+                "SELECT COALESCE(difficulty, 'unknown'), COUNT(*) FROM dialogs GROUP BY 1"
+            ).fetchall()
+        return {
+            "total_dialogs": total,
+            "scenarios_used": dict(scenarios),
+            "difficulty_distribution": dict(difficulties)
+        }
+
+    def load_error_profile(self) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT error_key, data FROM error_profile").fetchall()
+        return {error_key: json.loads(data) for error_key, data in rows}
+
+    def save_error_profile(self, error_profile: Dict[str, Dict]):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM error_profile")
+            self._conn.executemany(
+                "INSERT INTO error_profile (error_key, error_type, data) VALUES (?, ?, ?)",
+                [(key, data.get("error_type"), json.dumps(data, ensure_ascii=False)) for key, data in error_profile.items()]
+            )
+
+    def save_error_profile_entries(self, changed: Dict[str, Dict], error_profile: Dict[str, Dict]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO error_profile (error_key, error_type, data) VALUES (?, ?, ?)",
+                [(key, data.get("error_type"), json.dumps(data, ensure_ascii=False)) for key, data in changed.items()]
+            )
+
+
+def create_storage(logs_dir: str, backend: Optional[str] = None) -> DialogStorage:
+    """Создает хранилище выбранного типа (по умолчанию STORAGE_BACKEND)"""
+    backend = backend or STORAGE_BACKEND
+    if backend == "sqlite":
+        db_path = os.path.join(logs_dir, "dialogs.db")
+        is_new = not os.path.exists(db_path)
+        storage = SqliteStorage(db_path)
+        if is_new and has_jsonl_data(logs_dir):
+            # Новая база рядом с JSONL-логами: переносим их один раз, иначе история и профиль ошибок потеряются
+            copy_storage(JsonlStorage(logs_dir), storage)
+            print(f"📦 Данные JSONL из {logs_dir} перенесены в {db_path}")
+        return storage
+    if backend == "jsonl":
+        return JsonlStorage(logs_dir)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def has_jsonl_data(logs_dir: str) -> bool:
+    """Есть ли в logs_dir данные JsonlStorage: потоки, диалоги или профиль ошибок"""
+    if not os.path.isdir(logs_dir):
+        return False
+    for filename in os.listdir(logs_dir):
+        if filename.endswith(".jsonl") or (filename.startswith("dialog_") and filename.endswith(".json")):
+            return True
+    profile_path = os.path.join(logs_dir, "user_error_profile.json")
+    return os.path.exists(profile_path) and os.path.getsize(profile_path) > 2
+
+
+def copy_storage(source: DialogStorage, target: DialogStorage, dialogs_limit: int = 3):
+    """Переносит журналы, последние диалоги и профиль ошибок между хранилищами (например, jsonl -> sqlite)"""
+    for stream in DialogStorage.STREAMS:
+        for entry in source.iter_entries(stream):
+            target.append(stream, entry)
+    for dialog_data in reversed(source.recent_dialogs(dialogs_limit)):
+        target.save_dialog(dialog_data, keep_last=dialogs_limit)
+    target.save_error_profile(source.load_error_profile())
+
+
+# Старые JSON-массивы в dialog_logs/ и потоки, в которые они переносятся
+LEGACY_JSON_FILES = {
+    "errors": "errors.json",
+    "help_requests": "help_requests.json",
+    "aggressive_incidents": "aggressive_incidents.json",
+    "user_errors_raw": "user_errors_raw.json",
+}
+LEGACY_COINS_FILE = "user_coins.json"
+
+
+def migrate_legacy_json_logs(logs_dir: str, storage: DialogStorage) -> Dict[str, int]:
+    """
+    Одноразовый перенос dialog_logs/*.json (JSON-массивы, переписываемые целиком) в потоки storage.
+    Перенесенный файл переименовывается в *.json.migrated, поэтому повторный вызов ничего не делает.
+    Возвращает количество перенесенных записей по потокам.
+    """
+    migrated = {}
+
+    for stream, filename in LEGACY_JSON_FILES.items():
+        legacy_path = os.path.join(logs_dir, filename)
+        if not os.path.exists(legacy_path):
+            continue
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except Exception as e:
+            print(f"Error loading legacy log {legacy_path}: {e}")
+            continue
+        if not isinstance(entries, list):
+            print(f"Warning: {legacy_path} is not a JSON list, skipping migration.")
+            continue
+
+        for entry in entries:
+            storage.append(stream, entry)
+        os.replace(legacy_path, legacy_path + ".migrated")
+        migrated[stream] = len(entries)
+        print(f"Migrated {len(entries)} entries: {filename} -> {stream}")
+
+    # Баланс монет превращается в одну стартовую запись журнала монет
+    coins_path = os.path.join(logs_dir, LEGACY_COINS_FILE)
+    if os.path.exists(coins_path):
+        try:
+            with open(coins_path, 'r', encoding='utf-8') as f:
+                coins_data = json.load(f)
+            storage.append("coins", {
+                "timestamp": coins_data.get("last_updated", datetime.datetime.now().isoformat()),
+                "amount": coins_data.get("coins", 0),
+                "earned": coins_data.get("total_earned", 0),
+                "reason": "legacy_balance"
+            })
+            os.replace(coins_path, coins_path + ".migrated")
+            migrated["coins"] = 1
+            print(f"Migrated coin balance: {coins_data.get('coins', 0)}")
+        except Exception as e:
+            print(f"Error migrating {coins_path}: {e}")
+
+    return migrated
+
+
+# Бенчмарк: стоимость одной записи по мере роста журнала (python dialog_storage.py [N])
+if __name__ == '__main__':
+    import sys
+    import time
+    import tempfile
+
+    total_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    checkpoints = [n for n in (1_000, 10_000, 25_000, 50_000, 100_000, total_entries) if n <= total_entries]
+    checkpoints = sorted(set(checkpoints))
+    sample_entry = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "dialog_id": "bench",
+        "type": "translation",
+        "user_input": "How do I say 'счет, пожалуйста'?",
+        "ai_response": "ПЕРЕВОД:\nThe bill, please.",
+        "context": {"scenario": "restaurant", "difficulty": "easy"}
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        storage = JsonlStorage(tmp_dir)
+        print("JSONL append:")
+        written = 0
+        for checkpoint in checkpoints:
+            # Меряем 1000 записей на каждом рубеже размера
+            while written < checkpoint - 1_000:
+                storage.append("help_requests", sample_entry)
+                written += 1
+            started = time.perf_counter()
+            while written < checkpoint:
+                storage.append("help_requests", sample_entry)
+                written += 1
+            per_event_us = (time.perf_counter() - started) / 1_000 * 1e6
+            print(f"  {checkpoint:>7} entries: {per_event_us:8.1f} µs/event")
+
+        started = time.perf_counter()
+        streamed = sum(1 for _ in storage.iter_entries("help_requests"))
+        print(f"Streamed read of {streamed} entries: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        # Для сравнения: старая схема "прочитать массив, дописать, переписать с indent=2"
+        legacy_path = os.path.join(tmp_dir, "legacy.json")
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump([], f)
+        print("Legacy JSON rewrite:")
+        legacy_written = 0
+        for checkpoint in (100, 1_000, 2_000):
+            while legacy_written < checkpoint - 100:
+                with open(legacy_path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+                entries.append(sample_entry)
+                with open(legacy_path, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, ensure_ascii=False, indent=2)
+                legacy_written += 1
+            started = time.perf_counter()
+            while legacy_written < checkpoint:
+                with open(legacy_path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+                entries.append(sample_entry)
+                with open(legacy_path, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, ensure_ascii=False, indent=2)
+                legacy_written += 1
+            per_event_us = (time.perf_counter() - started) / 100 * 1e6
+            print(f"  {checkpoint:>7} entries: {per_event_us:8.1f} µs/event")
@@ -0,0 +1,245 @@
+import json
+import asyncio
+import hashlib
+import datetime
+from typing import Dict, List, Optional, Set
+
+from metrics import BACKGROUND_TASKS, registry
+
+# Параметры общего анализа ошибок: пачка уходит в модель при batch_size сообщениях
+# или после idle_seconds без новых реплик
+ERROR_ANALYSIS_SETTINGS = {
+    "model": "gpt-3.5-turbo",
+    "batch_size": 5,
+    "idle_seconds": 30.0,
+    "max_batch_size": 20,  # Пока лимиты API под нагрузкой, пачка копится до этого размера
+}
+
+ERROR_ANALYSIS_BATCH_SIZE = registry.histogram("error_analysis_batch_messages", "User messages per error analysis request")
+ERROR_ANALYSIS_PENDING = registry.gauge("error_analysis_pending_messages", "User messages waiting for batch error analysis")
+
+
+def message_hash(dialog_id: str, user_message_text: str) -> str:
+    """Стабильный ключ сообщения пользователя: по нему проверяется, анализировалось ли оно уже"""
+    normalized = " ".join(user_message_text.split())
+    return hashlib.sha1(f"{dialog_id}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+class ErrorAnalysisPipeline:
+    """
+    Единый анализ ошибок пользователя для чата и экрана отработки.
+    Реплики копятся в очереди и уходят в модель одним запросом на пачку;
+    хеши проанализированных сообщений пишутся в поток "analyzed_messages",
+    чтобы анализ перед упражнениями отправлял только новые сообщения.
+    """
+
+    def __init__(self, dialog_manager, batch_size: int = None, idle_seconds: float = None):
+        self.dialog_manager = dialog_manager
+        self.batch_size = batch_size or ERROR_ANALYSIS_SETTINGS["batch_size"]
+        self.idle_seconds = idle_seconds if idle_seconds is not None else ERROR_ANALYSIS_SETTINGS["idle_seconds"]
+        self.pending: List[Dict] = []
+        self._analyzed_hashes: Optional[Set[str]] = None
+        self._idle_timer: Optional[asyncio.TimerHandle] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flush_tasks: Set[asyncio.Task] = set() # Ссылки на запущенные flush, чтобы их не собрал GC
+
+    @property
+    def analyzed_hashes(self) -> Set[str]:
+        if self._analyzed_hashes is None:
+            self._analyzed_hashes = {
+                entry["hash"] for entry in self.dialog_manager.storage.iter_entries("analyzed_messages")
+            }
+        return self._analyzed_hashes
+
+    def is_analyzed(self, dialog_id: str, user_message_text: str) -> bool:
+        return message_hash(dialog_id, user_message_text) in self.analyzed_hashes
+
+    def mark_analyzed(self, dialog_id: str, user_messages: List[str]):
+        """Запоминает, что сообщения диалога уже отправлялись на анализ"""
+        timestamp = datetime.datetime.now().isoformat()
+        for text in user_messages:
+            digest = message_hash(dialog_id, text)
+            if digest in self.analyzed_hashes:
+                continue
+            self.analyzed_hashes.add(digest)
+            self.dialog_manager.storage.append("analyzed_messages", {
+                "timestamp": timestamp,
+                "dialog_id": dialog_id,
+                "hash": digest
+            })
+
+    def filter_unseen(self, dialog_id: str, user_messages: List[str]) -> List[str]:
+        """Оставляет только сообщения, которые еще не анализировались и не стоят в очереди"""
+        queued = {item["hash"] for item in self.pending}
+        unseen = []
+        for text in user_messages:
+            digest = message_hash(dialog_id, text)
+            if digest not in self.analyzed_hashes and digest not in queued:
+                unseen.append(text)
+        return unseen
+
+    def enqueue(self, dialog_id: str, user_message_text: str, full_dialog_history: List[Dict]):
+        """
+        Ставит реплику в очередь (вызывается из event loop после каждого хода).
+        Запрос к модели не делается сразу: пачка уходит по размеру или по таймеру простоя.
+        """
+        digest = message_hash(dialog_id, user_message_text)
+        if digest in self.analyzed_hashes or any(item["hash"] == digest for item in self.pending):
+            return
+
+        # Для контекста достаточно последней реплики собеседника перед сообщением
+        previous_ai_message = ""
+        for msg in reversed(full_dialog_history):
+            if msg["role"] == "assistant":
+                previous_ai_message = msg["content"]
+                break
+
+        self.pending.append({
+            "hash": digest,
+            "dialog_id": dialog_id,
+            "user_message": user_message_text,
+            "previous_ai_message": previous_ai_message
+        })
+        ERROR_ANALYSIS_PENDING.inc()
+
+        loop = asyncio.get_running_loop()
+        if self._idle_timer:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+        if len(self.pending) >= self.batch_size and not self._should_defer():
+            self._start_flush()
+        else:
+            self._idle_timer = loop.call_later(self.idle_seconds, self._start_flush)
+
+    def _start_flush(self):
+        """Запускает flush в фоне и держит ссылку на задачу до ее завершения"""
+        task = asyncio.get_running_loop().create_task(self.flush())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    def _should_defer(self) -> bool:
+        """Лимиты API близки: полная пачка ждет таймера простоя и собирает больше реплик в один запрос"""
+        client = self.dialog_manager.client
+        scheduler = getattr(client, "scheduler", None)
+        return (scheduler is not None and len(self.pending) < ERROR_ANALYSIS_SETTINGS["max_batch_size"]
+                and scheduler.under_pressure("background"))
+
+    async def flush(self):
+        """Отправляет накопленные реплики одним запросом и обновляет профиль ошибок"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if self._idle_timer:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, []
+            ERROR_ANALYSIS_PENDING.dec(len(batch))
+            ERROR_ANALYSIS_BATCH_SIZE.observe(len(batch))
+
+            with BACKGROUND_TASKS.track_inprogress(kind="error_analysis"):
+                detected_errors = await self.analyze_batch(batch)
+            if detected_errors is None:
+                # Пачка не проанализирована - сообщения останутся "новыми" для анализа перед упражнениями
+                return
+
+            self.dialog_manager.record_detailed_user_errors(detected_errors)
+            for item in batch:
+                self.mark_analyzed(item["dialog_id"], [item["user_message"]])
+
+    async def analyze_batch(self, batch: List[Dict]) -> Optional[List[Dict]]:
+        """
+        Один запрос к модели на всю пачку. Возвращает ошибки с dialog_id и user_message,
+        либо None, если анализ не удался.
+        """
+        client = self.dialog_manager.client
+        if not client:
+            print("OpenAI client not set in DialogManager. Cannot analyze detailed errors.")
+            return None
+
+        messages_text = ""
+        for i, item in enumerate(batch, 1):
+            if item["previous_ai_message"]:
+                messages_text += f'{i}. (в ответ на: "{item["previous_ai_message"]}")\n   "{item["user_message"]}"\n'
+            else:
+                messages_text += f'{i}. "{item["user_message"]}"\n'
+
+        analysis_prompt = f"""
+        Ты - продвинутый ассистент по проверке английского языка.
+        Проанализируй каждое пронумерованное сообщение пользователя на наличие ошибок.
+        Реплика собеседника в скобках дана только для контекста, ее не проверяй.
+
+        Сообщения пользователя:
+        {messages_text}
+
+        Выяви следующие типы ошибок:
+        1.  Грамматические ошибки (неправильное время глагола, артикли, предлоги, порядок слов, согласование времен и т.д.).
+        2.  Лексические ошибки (неправильный выбор слова, использование неформальной лексики в формальном контексте, смешение слов).
+        3.  Стилистические ошибки (неестественные или неуклюжие фразы, тавтология).
+        4.  Орфографические ошибки (опечатки).
+        5.  Использование русских слов (если это не часть специального сценария, где это допустимо, считай это ошибкой).
+        6.  Использование ненормативной лексики (маты, оскорбления).
+
+        Ответ должен быть в формате JSON:
+        {{
+            "errors": [
+                {{
+                    "message_number": номер сообщения с ошибкой,
+                    "original_phrase": "фрагмент текста пользователя с ошибкой",
+                    "error_type": "категория ошибки (например, 'verb_tense', 'spelling', 'word_choice', 'russian_word_inappropriate', 'profanity', 'article_error', 'preposition_error')",
+                    "explanation": "краткое и понятное объяснение ошибки на русском языке",
+                    "correction": "предлагаемый правильный вариант на английском языке"
+                }}
+            ]
+        }}
+
+        Если ошибок нет, верни: {{"errors": []}}
+        """
+
+        ai_response_content = ""
+        try:
+            response = await client.chat(
+                operation="error_analysis",
+                purpose="background",
+                model=ERROR_ANALYSIS_SETTINGS["model"],
+                messages=[
+                    {"role": "system", "content": "You are an expert English language error detection assistant. Provide output ONLY in JSON format."},
+                    {"role": "user", "content": analysis_prompt}
+                ],
+                temperature=0.2,
+                response_format={"type": "json_object"}
+            )
+            ai_response_content = response.choices[0].message.content
+            result = json.loads(ai_response_content)
+        except json.JSONDecodeError as e:
+            print(f"Error decoding JSON from OpenAI error analysis: {e}")
+            print(f"OpenAI response content: {ai_response_content}")
+            return None
+        except Exception as e:
+            print(f"Error calling OpenAI for error analysis: {e}")
+            return None
+
+        errors = result.get("errors", []) if isinstance(result, dict) else result
+        if not isinstance(errors, list):
+            print(f"Warning: OpenAI returned unexpected format for error analysis: {ai_response_content}")
+            return None
+
+        detected_errors = []
+        for error in errors:
+            if not isinstance(error, dict):
+                continue
+            try:
+                message_number = int(error.get("message_number", 0))
+            except (ValueError, TypeError):
+                message_number = 0
+            if not 1 <= message_number <= len(batch):
+                print(f"Skipping error with unknown message number: {error}")
+                continue
+            item = batch[message_number - 1]
+            error["dialog_id"] = item["dialog_id"]
+            error["user_message"] = item["user_message"]
+            detected_errors.append(error)
+
+        print(f"✅ Пакетный анализ: {len(batch)} сообщений, найдено {len(detected_errors)} ошибок")
+        return detected_errors
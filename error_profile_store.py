@@ -0,0 +1,108 @@
+import datetime
+from typing import Dict, List, Optional, Set
+
+# Сколько последних появлений ошибки хранится в history одной записи профиля
+ERROR_HISTORY_LIMIT = 20
+
+
+def make_error_key(error_type: str, original_phrase: str) -> str:
+    """Ключ записи профиля: тип ошибки + нормализованная оригинальная фраза"""
+    return f"{error_type}_{original_phrase.lower().strip().replace(' ', '_')}"
+
+
+class ErrorProfileStore:
+    """
+    Профиль ошибок пользователя в памяти с индексами:
+    - первичный: error_key -> данные ошибки;
+    - вторичный: error_type -> множество error_key;
+    - exercise_id -> error_key для упражнений, созданных по ошибке.
+    Изменения копятся как "грязные" ключи, commit() отдает в хранилище только их.
+    """
+
+    def __init__(self, storage, history_limit: int = ERROR_HISTORY_LIMIT):
+        self.storage = storage
+        self.history_limit = history_limit
+        self._entries: Optional[Dict[str, Dict]] = None
+        self._by_type: Dict[str, Set[str]] = {}
+        self._exercise_links: Dict[str, str] = {}
+        self._dirty: Set[str] = set()
+
+    def _ensure_loaded(self):
+        if self._entries is not None:
+            return
+        self._entries = self.storage.load_error_profile()
+        self._by_type = {}
+        for error_key, data in self._entries.items():
+            self._by_type.setdefault(data.get("error_type"), set()).add(error_key)
+        self._exercise_links = {
+            entry["exercise_id"]: entry["error_key"] for entry in self.storage.iter_entries("exercise_links")
+        }
+
+    @property
+    def entries(self) -> Dict[str, Dict]:
+        """Первичный индекс профиля (только для чтения, изменения - через put/update)"""
+        self._ensure_loaded()
+        return self._entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, error_key: str) -> bool:
+        return error_key in self.entries
+
+    def get(self, error_key: str) -> Optional[Dict]:
+        return self.entries.get(error_key)
+
+    def keys_by_type(self, error_type: str) -> Set[str]:
+        self._ensure_loaded()
+        return set(self._by_type.get(error_type, ()))
+
+    def put(self, error_key: str, data: Dict):
+        """Добавляет или заменяет запись целиком"""
+        previous = self.entries.get(error_key)
+        if previous is not None and previous.get("error_type") != data.get("error_type"):
+            self._by_type.get(previous.get("error_type"), set()).discard(error_key)
+        self._entries[error_key] = data
+        self._by_type.setdefault(data.get("error_type"), set()).add(error_key)
+        self._dirty.add(error_key)
+
+    def update(self, error_key: str, **fields) -> Dict:
+        """Частичное обновление полей существующей записи"""
+        data = self.entries[error_key]
+        if "error_type" in fields and fields["error_type"] != data.get("error_type"):
+            self._by_type.get(data.get("error_type"), set()).discard(error_key)
+            self._by_type.setdefault(fields["error_type"], set()).add(error_key)
+        data.update(fields)
+        self._dirty.add(error_key)
+        return data
+
+    def append_history(self, error_key: str, history_entry: Dict):
+        """Добавляет появление ошибки в history, оставляя последние history_limit"""
+        history = self.entries[error_key].setdefault("history", [])
+        history.append(history_entry)
+        if len(history) > self.history_limit:
+            del history[:-self.history_limit]
+        self._dirty.add(error_key)
+
+    def link_exercise(self, exercise_id: str, error_key: str):
+        """Запоминает, по какой ошибке создано упражнение"""
+        self._ensure_loaded()
+        self._exercise_links[exercise_id] = error_key
+        self.storage.append("exercise_links", {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "exercise_id": exercise_id,
+            "error_key": error_key
+        })
+
+    def error_key_for_exercise(self, exercise_id: str) -> Optional[str]:
+        self._ensure_loaded()
+        return self._exercise_links.get(exercise_id)
+
+    def commit(self) -> List[str]:
+        """Сохраняет измененные записи и возвращает их ключи"""
+        if not self._dirty:
+            return []
+        changed = {error_key: self._entries[error_key] for error_key in self._dirty}
+        self.storage.save_error_profile_entries(changed, self._entries)
+        self._dirty.clear()
+        return list(changed)
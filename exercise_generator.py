@@ -2,15 +2,28 @@ import json
 import os
 import asyncio
 import random
+import uuid
 from datetime import datetime
 from typing import Dict, List, Any, Tuple
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from model_gateway import ModelGateway, get_gateway
+from error_profile_store import make_error_key
+from answer_grader import AnswerGrader
+from tracing import traced
+from metrics import BACKGROUND_TASKS
+
+# Сколько запросов на генерацию упражнений может одновременно идти к модели
+EXERCISE_GENERATION_CONCURRENCY = 5
+
+# Пачечная проверка ответов: больше ответов или символов заданий - пачка делится на несколько запросов
+ANSWER_CHECK_BATCH_SIZE = 15
+ANSWER_CHECK_BATCH_CHARS = 8000
 
 class ErrorAnalysisAndPracticeSystem:
-    def __init__(self, dialog_manager):
+    def __init__(self, dialog_manager, max_concurrent_generations: int = EXERCISE_GENERATION_CONCURRENCY,
+                 client: ModelGateway = None):
         self.dialog_manager = dialog_manager
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = client or dialog_manager.client or get_gateway()
+        self.generation_semaphore = asyncio.Semaphore(max_concurrent_generations)
         self.exercise_types = [
             "word_replacement",      # Замени слово
             "translation_en_ru",     # Переведи с английского на русский
@@ -18,7 +31,10 @@ class ErrorAnalysisAndPracticeSystem:
             "simple_sentences",      # Составить 5 простых предложений
             "text_composition"       # Написать текст с 2 использованиями слова
         ]
+        # Однозначные ответы проверяются локально, к модели идут только неоднозначные
+        self.answer_grader = AnswerGrader(self.check_exercise_answer_with_model, self.check_exercise_answers_with_model)
     
+    @traced("practice.run", new_trace=True)
     async def run_full_error_analysis_and_practice(self):
         """
         Основная функция для полного анализа ошибок и создания упражнений
@@ -31,13 +47,8 @@ class ErrorAnalysisAndPracticeSystem:
         # 2. Получение переводов которые запрашивал пользователь
         translation_requests = self.get_user_translation_requests()
         
-        # 3. Загрузка существующих ошибок из профиля
-        existing_errors = self.load_user_error_profile()
-        
-        # 4. Объединение всех данных и создание упражнений
-        practice_session = await self.create_practice_session(
-            dialog_errors, translation_requests, existing_errors
-        )
+        # 3. Объединение с профилем ошибок и создание упражнений
+        practice_session = await self.create_practice_session(dialog_errors, translation_requests)
         
         return practice_session
     
@@ -45,6 +56,10 @@ class ErrorAnalysisAndPracticeSystem:
         """
         Анализирует последние 3 диалога на наличие ошибок пользователя
         """
+        # Сначала дожидаемся реплик, которые еще стоят в очереди анализа из чата
+        pipeline = self.dialog_manager.error_analysis
+        await pipeline.flush()
+        
         # Получаем последние 3 диалога
         recent_dialogs = self.dialog_manager.get_recent_dialogs(limit=3)
         all_errors = []
@@ -54,8 +69,9 @@ class ErrorAnalysisAndPracticeSystem:
             scenario = dialog.get("scenario", "unknown")
             messages = dialog.get("messages", [])
             
-            # Извлекаем только сообщения пользователя
+            # Извлекаем только сообщения пользователя, которые еще не анализировались во время чата
             user_messages = [msg["content"] for msg in messages if msg["role"] == "user"]
+            user_messages = pipeline.filter_unseen(dialog_id, user_messages)
             
             if user_messages:
                 print(f"📊 Анализируем диалог {dialog_id[:8]}... ({len(user_messages)} сообщений пользователя)")
@@ -108,8 +124,9 @@ class ErrorAnalysisAndPracticeSystem:
         """
         
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
+            response = await self.client.chat(
+                operation="exercise_error_analysis",
+                purpose="background",
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "Ты эксперт по анализу ошибок в английском языке. Отвечай ТОЛЬКО в формате JSON."},
@@ -128,6 +145,9 @@ class ErrorAnalysisAndPracticeSystem:
                 error["scenario"] = scenario
                 error["timestamp"] = datetime.now().isoformat()
             
+            # Повторно эти сообщения анализироваться не будут
+            self.dialog_manager.error_analysis.mark_analyzed(dialog_id, user_messages)
+            
             print(f"✅ Найдено {len(errors)} ошибок в диалоге")
             return errors
             
@@ -139,28 +159,24 @@ class ErrorAnalysisAndPracticeSystem:
         """
         Получает переводы, которые запрашивал пользователь
         """
-        help_requests_file = os.path.join(self.dialog_manager.logs_dir, "help_requests.json")
         translation_requests = []
         
-        if os.path.exists(help_requests_file):
-            try:
-                with open(help_requests_file, 'r', encoding='utf-8') as f:
-                    help_requests = json.load(f)
-                
+        try:
+            # Журнал запросов помощи читается потоково, без загрузки целиком
+            for request in self.dialog_manager.storage.iter_entries("help_requests"):
                 # Фильтруем только переводы
-                for request in help_requests:
-                    if request.get("request_type") == "translation" or "перевод" in request.get("user_input", "").lower():
-                        # Извлекаем переведенные слова/фразы из ответа AI
-                        ai_response = request.get("ai_response", "")
-                        translation_requests.append({
-                            "original_text": self.extract_original_from_translation(ai_response),
-                            "translation": self.extract_translation_from_response(ai_response),
-                            "dialog_id": request.get("dialog_id", ""),
-                            "timestamp": request.get("timestamp", "")
-                        })
-                        
-            except Exception as e:
-                print(f"❌ Ошибка загрузки запросов переводов: {e}")
+                if request.get("request_type") == "translation" or "перевод" in request.get("user_input", "").lower():
+                    # Извлекаем переведенные слова/фразы из ответа AI
+                    ai_response = request.get("ai_response", "")
+                    translation_requests.append({
+                        "original_text": self.extract_original_from_translation(ai_response),
+                        "translation": self.extract_translation_from_response(ai_response),
+                        "dialog_id": request.get("dialog_id", ""),
+                        "timestamp": request.get("timestamp", "")
+                    })
+                    
+        except Exception as e:
+            print(f"❌ Ошибка загрузки запросов переводов: {e}")
         
         print(f"📚 Найдено {len(translation_requests)} запросов переводов")
         return translation_requests
@@ -184,35 +200,32 @@ class ErrorAnalysisAndPracticeSystem:
     
     def load_user_error_profile(self) -> Dict:
         """
-        Загружает профиль ошибок пользователя
+        Возвращает профиль ошибок пользователя (error_key -> данные ошибки), только для чтения
         """
-        error_profile_file = os.path.join(self.dialog_manager.logs_dir, "user_error_profile.json")
-        
-        if os.path.exists(error_profile_file):
-            try:
-                with open(error_profile_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"❌ Ошибка загрузки профиля ошибок: {e}")
+        try:
+            return self.dialog_manager.error_profile.entries
+        except Exception as e:
+            print(f"❌ Ошибка загрузки профиля ошибок: {e}")
         
         return {}
     
-    async def create_practice_session(self, dialog_errors: List[Dict], translation_requests: List[Dict], existing_errors: Dict) -> Dict:
+    async def create_practice_session(self, dialog_errors: List[Dict], translation_requests: List[Dict]) -> Dict:
         """
         Создает сессию упражнений на основе всех данных
         """
         # Обновляем профиль ошибок новыми найденными ошибками
-        updated_profile = await self.update_error_profile(dialog_errors, existing_errors)
+        updated_profile = await self.update_error_profile(dialog_errors)
         
         # Выбираем максимум 5 ошибок для отработки
         errors_to_practice = self.select_errors_for_practice(updated_profile, max_errors=5)
         
-        # Создаем упражнения для каждой ошибки (по 3 упражнения на ошибку)
-        practice_exercises = []
-        
-        for error_key, error_data in errors_to_practice.items():
-            exercises = await self.generate_exercises_for_error(error_data, translation_requests)
-            practice_exercises.extend(exercises)
+        # Создаем упражнения для всех ошибок параллельно (по 3 упражнения на ошибку),
+        # gather сохраняет порядок ошибок и упражнений внутри них
+        exercises_per_error = await asyncio.gather(*[
+            self.generate_exercises_for_error(error_data, translation_requests, error_key)
+            for error_key, error_data in errors_to_practice.items()
+        ])
+        practice_exercises = [exercise for exercises in exercises_per_error for exercise in exercises]
         
         practice_session = {
             "session_id": f"practice_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
@@ -230,26 +243,31 @@ class ErrorAnalysisAndPracticeSystem:
         print(f"🎯 Создана сессия упражнений: {len(practice_exercises)} упражнений для {len(errors_to_practice)} ошибок")
         return practice_session
     
-    async def update_error_profile(self, new_errors: List[Dict], existing_profile: Dict) -> Dict:
+    async def update_error_profile(self, new_errors: List[Dict]) -> Dict:
         """
-        Обновляет профиль ошибок пользователя
+        Обновляет профиль ошибок пользователя и возвращает его
         """
+        error_profile = self.dialog_manager.error_profile
         for error in new_errors:
-            error_key = f"{error['error_type']}_{error['original_phrase'].lower().replace(' ', '_')}"
+            error_key = make_error_key(error["error_type"], error["original_phrase"])
+            history_entry = {
+                "dialog_id": error["dialog_id"],
+                "timestamp": error["timestamp"],
+                "context": error.get("context", "")
+            }
             
-            if error_key in existing_profile:
+            if error_key in error_profile:
                 # Увеличиваем счетчик
-                existing_profile[error_key]["count"] += 1
-                existing_profile[error_key]["last_seen_timestamp"] = error["timestamp"]
-                existing_profile[error_key]["last_seen_dialog_id"] = error["dialog_id"]
-                existing_profile[error_key]["history"].append({
-                    "dialog_id": error["dialog_id"],
-                    "timestamp": error["timestamp"],
-                    "context": error.get("context", "")
-                })
+                error_profile.update(
+                    error_key,
+                    count=error_profile.get(error_key)["count"] + 1,
+                    last_seen_timestamp=error["timestamp"],
+                    last_seen_dialog_id=error["dialog_id"]
+                )
+                error_profile.append_history(error_key, history_entry)
             else:
                 # Новая ошибка
-                existing_profile[error_key] = {
+                error_profile.put(error_key, {
                     "original_phrase": error["original_phrase"],
                     "error_type": error["error_type"],
                     "explanation": error["explanation"],
@@ -261,16 +279,12 @@ class ErrorAnalysisAndPracticeSystem:
                     "last_seen_timestamp": error["timestamp"],
                     "first_seen_dialog_id": error["dialog_id"],
                     "last_seen_dialog_id": error["dialog_id"],
-                    "history": [{
-                        "dialog_id": error["dialog_id"],
-                        "timestamp": error["timestamp"],
-                        "context": error.get("context", "")
-                    }]
-                }
+                    "history": [history_entry]
+                })
         
-        # Сохраняем обновленный профиль
-        self.save_error_profile(existing_profile)
-        return existing_profile
+        # Сохраняем измененные записи профиля
+        self.save_error_profile()
+        return error_profile.entries
     
     def select_errors_for_practice(self, error_profile: Dict, max_errors: int = 5) -> Dict:
         """
@@ -298,9 +312,10 @@ class ErrorAnalysisAndPracticeSystem:
         
         return selected
     
-    async def generate_exercises_for_error(self, error_data: Dict, translation_requests: List[Dict]) -> List[Dict]:
+    async def generate_exercises_for_error(self, error_data: Dict, translation_requests: List[Dict], error_key: str = None) -> List[Dict]:
         """
-        Генерирует 3 упражнения для одной ошибки
+        Генерирует 3 упражнения для одной ошибки.
+        Если передан error_key, упражнения привязываются к записи профиля ошибок.
         """
         exercises = []
         original_phrase = error_data["original_phrase"]
@@ -316,13 +331,21 @@ class ErrorAnalysisAndPracticeSystem:
             # X4, X5, X6 - обычные упражнения
             exercise_types = self.get_exercise_types_for_high_count()
         
-        # Генерируем 3 упражнения
-        for i in range(3):
-            exercise_type = exercise_types[i % len(exercise_types)]
-            exercise = await self.generate_single_exercise(
-                original_phrase, correction, error_type, exercise_type, i + 1
-            )
-            exercises.append(exercise)
+        # Генерируем 3 упражнения параллельно (общий лимит - generation_semaphore)
+        planned_types = [exercise_types[i % len(exercise_types)] for i in range(3)]
+        results = await asyncio.gather(*[
+            self.generate_single_exercise(original_phrase, correction, error_type, exercise_type, i + 1)
+            for i, exercise_type in enumerate(planned_types)
+        ], return_exceptions=True)
+        
+        for i, (exercise_type, result) in enumerate(zip(planned_types, results)):
+            if isinstance(result, Exception):
+                print(f"❌ Ошибка генерации упражнения: {result}")
+                result = self.create_fallback_exercise(original_phrase, correction, exercise_type, i + 1)
+            if error_key:
+                result["error_key"] = error_key
+                self.dialog_manager.error_profile.link_exercise(result["exercise_id"], error_key)
+            exercises.append(result)
         
         return exercises
     
@@ -341,20 +364,24 @@ class ErrorAnalysisAndPracticeSystem:
         exercise_prompt = self.get_exercise_prompt(original_phrase, correction, error_type, exercise_type)
         
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Ты эксперт по созданию упражнений для изучения английского языка."},
-                    {"role": "user", "content": exercise_prompt}
-                ],
-                temperature=0.7
-            )
+            async with self.generation_semaphore:
+                with BACKGROUND_TASKS.track_inprogress(kind="exercise_generation"):
+                    response = await self.client.chat(
+                        operation="exercise_generation",
+                        purpose="background",
+                        priority="batch",
+                        model="gpt-3.5-turbo",
+                        messages=[
+                            {"role": "system", "content": "Ты эксперт по созданию упражнений для изучения английского языка."},
+                            {"role": "user", "content": exercise_prompt}
+                        ],
+                        temperature=0.7
+                    )
             
             exercise_content = response.choices[0].message.content
             
             return {
-                "exercise_id": f"{error_type}_{exercise_type}_{exercise_num}_{datetime.now().strftime('%H%M%S')}",
+                "exercise_id": f"{error_type}_{exercise_type}_{exercise_num}_{uuid.uuid4().hex}", # uuid: упражнения генерируются параллельно
                 "exercise_type": exercise_type,
                 "exercise_number": exercise_num,
                 "original_error": original_phrase,
@@ -443,7 +470,7 @@ class ErrorAnalysisAndPracticeSystem:
         Создает простое упражнение если AI не сработал
         """
         return {
-            "exercise_id": f"fallback_{exercise_type}_{exercise_num}_{datetime.now().strftime('%H%M%S')}",
+            "exercise_id": f"fallback_{exercise_type}_{exercise_num}_{uuid.uuid4().hex}",
             "exercise_type": exercise_type,
             "exercise_number": exercise_num,
             "original_error": original_phrase,
@@ -472,16 +499,13 @@ class ErrorAnalysisAndPracticeSystem:
         except Exception as e:
             print(f"❌ Ошибка сохранения сессии: {e}")
     
-    def save_error_profile(self, error_profile: Dict):
+    def save_error_profile(self):
         """
-        Сохраняет обновленный профиль ошибок
+        Сохраняет измененные записи профиля ошибок
         """
-        error_profile_file = os.path.join(self.dialog_manager.logs_dir, "user_error_profile.json")
-        
         try:
-            with open(error_profile_file, 'w', encoding='utf-8') as f:
-                json.dump(error_profile, f, ensure_ascii=False, indent=4)
-            print(f"💾 Профиль ошибок обновлен: {len(error_profile)} записей")
+            changed = self.dialog_manager.error_profile.commit()
+            print(f"💾 Профиль ошибок обновлен: {len(changed)} записей")
         except Exception as e:
             print(f"❌ Ошибка сохранения профиля ошибок: {e}")
     
@@ -489,82 +513,268 @@ class ErrorAnalysisAndPracticeSystem:
         """
         Отмечает упражнение как выполненное и обновляет счетчики
         """
-        # Загружаем сессию
+        return self.complete_session_exercises(session_id, [(exercise_id, user_answer, is_correct)])[0]
+    
+    def complete_session_exercises(self, session_id: str, results: List[Tuple[str, str, bool]]) -> List[Dict]:
+        """
+        Отмечает пачку упражнений сессии (exercise_id, ответ, верно ли) как выполненные:
+        файл сессии читается и сохраняется, профиль ошибок коммитится один раз на пачку.
+        """
         session_file = os.path.join(self.dialog_manager.logs_dir, "practice_sessions", f"{session_id}.json")
         
         try:
             with open(session_file, 'r', encoding='utf-8') as f:
                 session_data = json.load(f)
             
-            # Находим упражнение и обновляем его
-            for exercise in session_data["exercises"]:
-                if exercise["exercise_id"] == exercise_id:
-                    exercise["completed"] = True
-                    exercise["user_answer"] = user_answer
-                    exercise["is_correct"] = is_correct
-                    exercise["attempts"] += 1
-                    exercise["completion_timestamp"] = datetime.now().isoformat()
-                    break
+            # Находим упражнения и обновляем их
+            exercises = {exercise["exercise_id"]: exercise for exercise in session_data["exercises"]}
+            for exercise_id, user_answer, is_correct in results:
+                exercise = exercises.get(exercise_id)
+                if exercise is None:
+                    continue
+                exercise["completed"] = True
+                exercise["user_answer"] = user_answer
+                exercise["is_correct"] = is_correct
+                exercise["attempts"] += 1
+                exercise["completion_timestamp"] = datetime.now().isoformat()
             
             # Сохраняем обновленную сессию
             with open(session_file, 'w', encoding='utf-8') as f:
                 json.dump(session_data, f, ensure_ascii=False, indent=4)
             
-            # Начисляем монеты за правильный ответ
-            if is_correct:
-                new_coin_count = self.dialog_manager.add_coins(1, "exercise_completed")
-                print(f"🪙 +1 монета за правильное упражнение! Всего: {new_coin_count}")
-            
-            # Обновляем профиль ошибок
-            error_completed = self.update_error_profile_after_exercise(exercise_id, is_correct)
-            
-            # Дополнительный бонус за полную отработку ошибки
-            if error_completed:
-                bonus_coins = self.dialog_manager.add_coins(5, "error_mastered")
-                print(f"🎉 +5 монет бонус за полную отработку ошибки! Всего: {bonus_coins}")
-                return {"coins_earned": 6, "error_mastered": True}  # 1 + 5 монет
-            
-            return {"coins_earned": 1 if is_correct else 0, "error_mastered": False}
-            
         except Exception as e:
             print(f"❌ Ошибка обновления упражнения: {e}")
-            return {"coins_earned": 0, "error_mastered": False}
+            return [{"coins_earned": 0, "error_mastered": False} for _ in results]
+        
+        completions = [self.reward_exercise(exercise_id, is_correct) for exercise_id, _, is_correct in results]
+        # Сохраняем только измененные записи профиля
+        self.save_error_profile()
+        return completions
+    
+    def reward_exercise(self, exercise_id: str, is_correct: bool) -> Dict:
+        """
+        Начисляет монеты за упражнение и обновляет профиль ошибок в памяти (без сохранения)
+        """
+        # Начисляем монеты за правильный ответ
+        if is_correct:
+            new_coin_count = self.dialog_manager.add_coins(1, "exercise_completed")
+            print(f"🪙 +1 монета за правильное упражнение! Всего: {new_coin_count}")
+        
+        # Обновляем профиль ошибок
+        error_completed = self.update_error_profile_after_exercise(exercise_id, is_correct, save=False)
+        
+        # Дополнительный бонус за полную отработку ошибки
+        if error_completed:
+            bonus_coins = self.dialog_manager.add_coins(5, "error_mastered")
+            print(f"🎉 +5 монет бонус за полную отработку ошибки! Всего: {bonus_coins}")
+            return {"coins_earned": 6, "error_mastered": True}  # 1 + 5 монет
+        
+        return {"coins_earned": 1 if is_correct else 0, "error_mastered": False}
     
-    def update_error_profile_after_exercise(self, exercise_id: str, is_correct: bool) -> bool:
+    def update_error_profile_after_exercise(self, exercise_id: str, is_correct: bool, save: bool = True) -> bool:
         """
         Обновляет профиль ошибок после выполнения упражнения
         Возвращает True если ошибка полностью отработана (достигла X0)
+        save=False - запись остается "грязной" до следующего save_error_profile (для пачек)
         """
-        error_profile = self.load_user_error_profile()
+        error_profile = self.dialog_manager.error_profile
         error_completed = False
         
-        # Находим соответствующую ошибку по exercise_id
-        for error_key, error_data in error_profile.items():
-            if error_key in exercise_id or error_data["original_phrase"].replace(" ", "_") in exercise_id:
-                if is_correct:
-                    # Упражнение выполнено правильно - уменьшаем счетчик
-                    error_data["exercise_repetition_count"] = max(0, error_data["exercise_repetition_count"] - 1)
-                    
-                    # Если счетчик дошел до 0 - ошибка отработана, можно удалить
-                    if error_data["exercise_repetition_count"] == 0:
-                        print(f"🎉 Ошибка '{error_data['original_phrase']}' полностью отработана!")
-                        # Помечаем для удаления или архивируем
-                        error_data["completed"] = True
-                        error_data["completion_timestamp"] = datetime.now().isoformat()
-                        error_completed = True
-                else:
-                    # Упражнение выполнено неправильно - увеличиваем счетчик
-                    error_data["exercise_repetition_count"] += 1
-                    print(f"❌ Ошибка в упражнении. Счетчик увеличен до X{error_data['exercise_repetition_count']}")
-                
-                error_data["last_exercise_timestamp"] = datetime.now().isoformat()
-                break
+        # Находим соответствующую ошибку по привязке exercise_id -> error_key
+        error_key = error_profile.error_key_for_exercise(exercise_id)
+        if error_key is None:
+            # Упражнения, созданные до появления привязок
+            error_key = self.find_error_key_by_exercise_id(exercise_id)
+        if error_key is None or error_key not in error_profile:
+            return False
+        
+        error_data = error_profile.get(error_key)
+        timestamp = datetime.now().isoformat()
+        if is_correct:
+            # Упражнение выполнено правильно - уменьшаем счетчик
+            repetition_count = max(0, error_data["exercise_repetition_count"] - 1)
+            error_profile.update(error_key, exercise_repetition_count=repetition_count, last_exercise_timestamp=timestamp)
+            
+            # Если счетчик дошел до 0 - ошибка отработана
+            if repetition_count == 0:
+                print(f"🎉 Ошибка '{error_data['original_phrase']}' полностью отработана!")
+                error_profile.update(error_key, completed=True, completion_timestamp=timestamp)
+                error_completed = True
+        else:
+            # Упражнение выполнено неправильно - увеличиваем счетчик
+            error_profile.update(
+                error_key,
+                exercise_repetition_count=error_data["exercise_repetition_count"] + 1,
+                last_exercise_timestamp=timestamp
+            )
+            print(f"❌ Ошибка в упражнении. Счетчик увеличен до X{error_data['exercise_repetition_count']}")
         
-        # Сохраняем обновленный профиль
-        self.save_error_profile(error_profile)
+        # Сохраняем только эту запись профиля
+        if save:
+            self.save_error_profile()
         return error_completed
     
+    def find_error_key_by_exercise_id(self, exercise_id: str) -> str:
+        """
+        Старый способ поиска ошибки: перебор ключей профиля с поиском подстроки в exercise_id
+        """
+        for error_key, error_data in self.dialog_manager.error_profile.entries.items():
+            if error_key in exercise_id or error_data["original_phrase"].replace(" ", "_") in exercise_id:
+                return error_key
+        return None
+    
     async def check_exercise_answer(self, exercise: Dict, user_answer: str) -> Dict:
+        """
+        Проверяет ответ пользователя на упражнение: сначала локально (answer_grader),
+        неоднозначные ответы - с помощью OpenAI. Оценки кешируются по упражнению и ответу.
+        """
+        return await self.answer_grader.grade(exercise, user_answer)
+    
+    async def check_exercise_answers(self, answers: List[Tuple[Dict, str]]) -> List[Dict]:
+        """
+        Проверяет пачку ответов (упражнение, ответ), например всю сессию сразу: неоднозначные
+        ответы уходят к модели одним запросом на пачку. Результаты - в порядке answers.
+        """
+        return await self.answer_grader.grade_many(answers)
+    
+    async def complete_exercises(self, session_id: str, answers: List[Tuple[Dict, str]]) -> List[Dict]:
+        """
+        Проверяет ответы сессии пачкой и отмечает проверенные упражнения одним complete_session_exercises.
+        Ответ, который не удалось проверить, остается невыполненным.
+        """
+        grades = await self.check_exercise_answers(answers)
+        graded = [
+            (exercise["exercise_id"], user_answer, bool(grade.get("is_correct")))
+            for (exercise, user_answer), grade in zip(answers, grades) if not grade.get("error")
+        ]
+        completions = iter(self.complete_session_exercises(session_id, graded) if graded else [])
+        completed = []
+        for grade in grades:
+            if grade.get("error"):
+                completed.append({**grade, "coins_earned": 0, "error_mastered": False})
+            else:
+                completed.append({**grade, **next(completions)})
+        return completed
+    
+    def split_answer_batches(self, answers: List[Tuple[Dict, str]]) -> List[List[Tuple[Dict, str]]]:
+        """
+        Делит ответы на пачки не больше ANSWER_CHECK_BATCH_SIZE ответов и ANSWER_CHECK_BATCH_CHARS символов
+        """
+        batches, batch, batch_chars = [], [], 0
+        for exercise, user_answer in answers:
+            chars = len(exercise.get("content", "")) + len(user_answer) + len(exercise.get("correct_form", ""))
+            if batch and (len(batch) >= ANSWER_CHECK_BATCH_SIZE or batch_chars + chars > ANSWER_CHECK_BATCH_CHARS):
+                batches.append(batch)
+                batch, batch_chars = [], 0
+            batch.append((exercise, user_answer))
+            batch_chars += chars
+        if batch:
+            batches.append(batch)
+        return batches
+    
+    async def check_exercise_answers_with_model(self, answers: List[Tuple[Dict, str]]) -> List[Dict]:
+        """
+        Проверяет ответы с помощью OpenAI пачками (пачки идут параллельно); результаты - в порядке answers
+        """
+        batches = self.split_answer_batches(answers)
+        batch_results = await asyncio.gather(*(self.check_answer_batch_with_model(batch) for batch in batches))
+        return [result for results in batch_results for result in results]
+    
+    async def check_answer_batch_with_model(self, batch: List[Tuple[Dict, str]]) -> List[Dict]:
+        """
+        Одна пачка - один запрос с результатом по каждому ответу. Если ответ модели не разобрать
+        (битый или обрезанный JSON, не то число результатов), пачка делится пополам. Любая другая ошибка
+        (лимит, открытый breaker, дедлайн) - сразу ошибка проверки для всей пачки, без новых запросов.
+        """
+        if len(batch) == 1:
+            return [await self.check_exercise_answer_with_model(*batch[0])]
+        
+        items_text = "\n".join(
+            f"""
+        Ответ {number}:
+        Тип упражнения: {exercise.get("exercise_type", "")}
+        Исходная ошибка: {exercise.get("original_error", "")}
+        Правильная форма: {exercise.get("correct_form", "")}
+        Задание: {exercise.get("content", "")}
+        Ответ пользователя: "{user_answer}"
+        """
+            for number, (exercise, user_answer) in enumerate(batch, 1)
+        )
+        check_prompt = f"""
+        Проверь ответы пользователя на упражнения по английскому языку ({len(batch)} шт.).
+        {items_text}
+        Оцени каждый ответ отдельно и дай краткую обратную связь на русском языке.
+        Ответь в формате JSON, по одному элементу results на каждый ответ:
+        {{
+            "results": [
+                {{
+                    "id": номер ответа,
+                    "is_correct": true/false,
+                    "feedback": "объяснение на русском, почему правильно или что нужно исправить",
+                    "correct_answer": "правильный ответ, если пользователь ошибся"
+                }}
+            ]
+        }}
+        """
+        
+        try:
+            response = await self.client.chat(
+                operation="answer_check_batch",
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": "Ты эксперт по проверке упражнений английского языка. Отвечай только в JSON формате."},
+                    {"role": "user", "content": check_prompt}
+                ],
+                temperature=0.2,
+                response_format={"type": "json_object"}
+            )
+        except Exception as e:
+            print(f"❌ Ошибка пачечной проверки ({len(batch)} ответов): {e}")
+            return [self.answer_check_error(exercise, e) for exercise, _ in batch]
+        
+        try:
+            return self.parse_batch_check_results(response.choices[0].message.content, batch)
+        except ValueError as e: # В том числе json.JSONDecodeError
+            print(f"⚠️ Не удалось разобрать пачечную проверку ({len(batch)} ответов): {e}. Делим пачку пополам")
+            middle = len(batch) // 2
+            first, second = await asyncio.gather(
+                self.check_answer_batch_with_model(batch[:middle]),
+                self.check_answer_batch_with_model(batch[middle:])
+            )
+            return first + second
+    
+    def parse_batch_check_results(self, content: str, batch: List[Tuple[Dict, str]]) -> List[Dict]:
+        """
+        Результаты пачки по номерам ответов; ValueError, если результатов не столько, сколько ответов
+        """
+        data = json.loads(content)
+        items = data.get("results") if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            raise ValueError("no results list")
+        graded = {str(item.get("id")): item for item in items if isinstance(item, dict) and "is_correct" in item}
+        if len(items) != len(batch) or any(str(number) not in graded for number in range(1, len(batch) + 1)):
+            raise ValueError(f"{len(graded)} valid results of {len(items)} for {len(batch)} answers")
+        return [
+            {
+                "is_correct": graded[str(number)]["is_correct"] in (True, "true", "True"),
+                "feedback": graded[str(number)].get("feedback", ""),
+                "correct_answer": graded[str(number)].get("correct_answer") or exercise.get("correct_form", "")
+            }
+            for number, (exercise, _) in enumerate(batch, 1)
+        ]
+    
+    def answer_check_error(self, exercise: Dict, error: Exception) -> Dict:
+        """
+        Результат проверки, которая не удалась: упражнение не засчитывается, результат не кешируется
+        """
+        return {
+            "is_correct": False,
+            "feedback": "Ошибка при проверке ответа. Попробуйте еще раз.",
+            "correct_answer": exercise.get("correct_form", ""),
+            "error": str(error) or type(error).__name__ # Непустая: по ней результат не кешируется
+        }
+    
+    async def check_exercise_answer_with_model(self, exercise: Dict, user_answer: str) -> Dict:
         """
         Проверяет ответ пользователя на упражнение с помощью OpenAI
         """
@@ -596,8 +806,8 @@ class ErrorAnalysisAndPracticeSystem:
         """
         
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
+            response = await self.client.chat(
+                operation="answer_check",
                 model="gpt-3.5-turbo",
                 messages=[
                     {"role": "system", "content": "Ты эксперт по проверке упражнений английского языка. Отвечай только в JSON формате."},
@@ -612,8 +822,4 @@ class ErrorAnalysisAndPracticeSystem:
             
         except Exception as e:
             print(f"❌ Ошибка проверки ответа: {e}")
-            return {
-                "is_correct": False,
-                "feedback": "Ошибка при проверке ответа. Попробуйте еще раз.",
-                "correct_answer": correct_form
-            } 
\ No newline at end of file
+            return self.answer_check_error(exercise, e) 
\ No newline at end of file
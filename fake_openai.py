@@ -0,0 +1,209 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+# Поведение локального сервера вместо OpenAI (для benchmark.py).
+# Задержки - логнормальные: median секунд, sigma - разброс (0 - фиксированная задержка)
+FAKE_OPENAI_PROFILES = {
+    "default": {
+        "chat_first_token": {"median": 0.35, "sigma": 0.4},
+        "chat_tokens_per_second": 60,
+        "chat_reply_tokens": 40,
+        "transcription": {"median": 0.5, "sigma": 0.3},
+        "speech": {"median": 0.3, "sigma": 0.3},
+        "speech_seconds": 2.0,           # Длительность "синтезированного" аудио
+        "rate_limit_error_rate": 0.0,    # Доля ответов 429
+        "server_error_rate": 0.0,        # Доля ответов 500
+    },
+    "fast": {
+        "chat_first_token": {"median": 0.02, "sigma": 0.0},
+        "chat_tokens_per_second": 2000,
+        "chat_reply_tokens": 40,
+        "transcription": {"median": 0.02, "sigma": 0.0},
+        "speech": {"median": 0.02, "sigma": 0.0},
+        "speech_seconds": 1.0,
+        "rate_limit_error_rate": 0.0,
+        "server_error_rate": 0.0,
+    },
+    "flaky": {
+        "chat_first_token": {"median": 0.35, "sigma": 0.8}, # Длинный хвост задержек
+        "chat_tokens_per_second": 60,
+        "chat_reply_tokens": 40,
+        "transcription": {"median": 0.5, "sigma": 0.6},
+        "speech": {"median": 0.3, "sigma": 0.6},
+        "speech_seconds": 2.0,
+        "rate_limit_error_rate": 0.05,
+        "server_error_rate": 0.02,
+    },
+}
+
+REPLY_WORDS = ("Sure", "I", "can", "help", "you", "with", "that", "today", "what", "would", "you", "like", "to", "order")
+
+# Ответ на JSON-запросы: подходит и анализу ошибок (оба формата), и проверке ответа на упражнение (одного и пачки)
+JSON_REPLY = {
+    "errors": [{
+        "message_number": 1,
+        "original_phrase": "I goes to the shop",
+        "error_type": "verb_tense",
+        "explanation": "После I глагол без окончания -s",
+        "correction": "I go to the shop",
+        "severity": "medium",
+        "context": "benchmark"
+    }],
+    "is_correct": True,
+    "feedback": "Верно",
+    "correct_answer": "",
+    "results": [{"id": i, "is_correct": True, "feedback": "Верно", "correct_answer": ""} for i in range(1, 31)]
+}
+
+
+def sample_latency(spec: Dict) -> float:
+    if not spec["sigma"]:
+        return spec["median"]
+    return random.lognormvariate(0, spec["sigma"]) * spec["median"]
+
+
+class FakeOpenAIServer:
+    """
+    Минимальный HTTP/1.1 сервер (keep-alive, потоковые ответы) с эндпоинтами
+    /v1/chat/completions (обычный и stream=True), /v1/audio/transcriptions и /v1/audio/speech.
+    Работает в своем потоке и event loop, чтобы не занимать loop измеряемого кода.
+    """
+
+    def __init__(self, profile: str = "default", host: str = "127.0.0.1", port: int = 0):
+        self.profile = FAKE_OPENAI_PROFILES[profile]
+        self.host = host
+        self.port = port
+        self.requests: Counter = Counter()  # По эндпоинтам
+        self.responses: Counter = Counter() # По кодам ответа
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        self._server.close()
+        # Открытые keep-alive соединения закрываются до остановки loop
+        handlers = asyncio.all_tasks(self._loop)
+        for task in handlers:
+            task.cancel()
+        if handlers:
+            self._loop.run_until_complete(asyncio.wait(handlers))
+        self._loop.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True: # Keep-alive: запросы по одному соединению один за другим
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                await self._route(path.split("?", 1)[0], headers, body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError): # CancelledError - остановка сервера
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, path: str, headers: Dict, body: bytes, writer: asyncio.StreamWriter):
+        endpoint = path.rsplit("/v1/", 1)[-1]
+        self.requests[endpoint] += 1
+        roll = random.random()
+        if roll < self.profile["rate_limit_error_rate"]:
+            return await self._send_json(writer, 429, {"error": {"message": "Rate limit", "type": "requests"}},
+                                         {"retry-after": "0.2"})
+        if roll < self.profile["rate_limit_error_rate"] + self.profile["server_error_rate"]:
+            return await self._send_json(writer, 500, {"error": {"message": "Server error", "type": "server_error"}})
+
+        if endpoint == "chat/completions":
+            await self._chat(json.loads(body or b"{}"), writer)
+        elif endpoint == "audio/transcriptions":
+            await asyncio.sleep(sample_latency(self.profile["transcription"]))
+            await self._send_json(writer, 200, {"text": "I would like to order a coffee, please."})
+        elif endpoint == "audio/speech":
+            await asyncio.sleep(sample_latency(self.profile["speech"]))
+            audio = bytes(int(24000 * 2 * self.profile["speech_seconds"])) # Тишина в формате pcm 24 кГц
+            await self._send(writer, 200, "application/octet-stream", audio)
+        else:
+            await self._send_json(writer, 404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+    async def _chat(self, request: Dict, writer: asyncio.StreamWriter):
+        await asyncio.sleep(sample_latency(self.profile["chat_first_token"]))
+        token_delay = 1.0 / self.profile["chat_tokens_per_second"]
+        reply_tokens = self.profile["chat_reply_tokens"]
+        if request.get("response_format", {}).get("type") == "json_object":
+            content = json.dumps(JSON_REPLY, ensure_ascii=False)
+        else:
+            content = " ".join(REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(reply_tokens)) + "."
+        created = int(time.time())
+        usage = {"prompt_tokens": 100, "completion_tokens": reply_tokens, "total_tokens": 100 + reply_tokens}
+
+        if not request.get("stream"):
+            await asyncio.sleep(token_delay * reply_tokens)
+            return await self._send_json(writer, 200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": request.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+        self.responses[200] += 1
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            chunk = {
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": request.get("model"),
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}]
+            }
+            self._write_chunk(writer, b"data: " + json.dumps(chunk).encode() + b"\n\n")
+            await writer.drain()
+            await asyncio.sleep(token_delay)
+        self._write_chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _write_chunk(writer: asyncio.StreamWriter, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict, headers: Dict = None):
+        await self._send(writer, status, "application/json", json.dumps(payload).encode(), headers)
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, content_type: str, body: bytes, headers: Dict = None):
+        self.responses[status] += 1
+        head = f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+        for name, value in (headers or {}).items():
+            head += f"{name}: {value}\r\n"
+        writer.write(head.encode() + b"\r\n" + body)
+        await writer.drain()
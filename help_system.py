@@ -49,8 +49,9 @@ class HelpSystem:
         """
         
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
+            response = await self.client.chat(
+                operation="help",
+                priority="help",
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": help_prompt}],
                 temperature=0.7
@@ -99,8 +100,9 @@ class HelpSystem:
         "{ai_message_content}"
         """
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
+            response = await self.client.chat(
+                operation="help_cultural",
+                priority="help",
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3
@@ -133,8 +135,9 @@ class HelpSystem:
         "{ai_message_content}"
         """
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
+            response = await self.client.chat(
+                operation="help_grammar",
+                priority="help",
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3
@@ -334,8 +337,9 @@ class HelpDialog:
         """
         
         try:
-            response = await asyncio.to_thread(
-                self.help_system.client.chat.completions.create,
+            response = await self.help_system.client.chat(
+                operation="help_question",
+                priority="help",
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.7
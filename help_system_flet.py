@@ -1,14 +1,104 @@
 import flet as ft
 import asyncio
-from openai import OpenAI
-from config import OPENAI_API_KEY
+import hashlib
+from model_gateway import ModelGateway, get_gateway
+from tracing import traced
+
+# Заранее готовить подсказку (перевод + варианты ответа) сразу после ответа AI.
+# Каждая предзагрузка - запрос к модели, даже если подсказку не откроют, поэтому включается по уровням
+HELP_PREFETCH_BY_DIFFICULTY = {
+    "easy": True,    # Подсказки без лимита, открываются чаще всего
+    "medium": True,
+    "hard": False    # 5 подсказок на диалог - предзагрузка почти всегда была бы лишней
+}
+
+
+def last_ai_message_key(messages) -> str:
+    """Ключ подсказки: хеш последнего сообщения AI (None, если AI еще не отвечал)"""
+    for msg in reversed(messages):
+        if msg["role"] == "assistant":
+            return hashlib.sha1(msg["content"].encode("utf-8")).hexdigest()
+    return None
+
+
+class HelpPrefetcher:
+    """
+    Спекулятивная подготовка подсказки: генерация стартует в фоне сразу после ответа AI,
+    результат привязан к хешу последнего сообщения AI и сбрасывается с новым ходом.
+    Клик по "Помощь" получает готовый результат (или дожидается уже идущей генерации).
+    """
+
+    def __init__(self, help_system: 'HelpSystem'):
+        self.help_system = help_system
+        self.key = None
+        self.task = None
+
+    def invalidate(self):
+        """Новый ход: подготовленная подсказка больше не актуальна"""
+        if self.task and not self.task.done():
+            self.task.cancel()
+        self.key = None
+        self.task = None
+
+    def prefetch(self, messages, scenario, difficulty):
+        """
+        Запускает генерацию в фоне (вызывается из event loop после ответа AI). Спекулятивный запрос
+        идет с приоритетом "background" и не мешает настоящим запросам помощи; get() повышает его до "help".
+        """
+        key = last_ai_message_key(messages)
+        if key is None or (key == self.key and self.task):
+            return
+        self.invalidate()
+        self.key = key
+        self.task = asyncio.get_running_loop().create_task(
+            self.help_system.generate_help_content(list(messages[-6:]), scenario, difficulty, priority="background")
+        )
+
+    def promote(self, task):
+        """Пользователь ждет подсказку: фоновая генерация получает приоритет "help" в планировщике"""
+        scheduler = getattr(self.help_system.client, "scheduler", None)
+        if scheduler is not None and not task.done():
+            scheduler.promote(task, "help")
+
+    def is_ready(self, messages) -> bool:
+        return bool(self.task and self.task.done() and not self.task.cancelled() and self.key == last_ai_message_key(messages))
+
+    async def get(self, messages, scenario, difficulty):
+        """Подсказка для текущего сообщения AI: готовая, уже генерируемая или новая"""
+        key = last_ai_message_key(messages)
+        if key is None:
+            return None
+        if key != self.key or not self.task:
+            self.invalidate()
+            self.key = key
+            self.task = asyncio.get_running_loop().create_task(
+                self.help_system.generate_help_content(list(messages[-6:]), scenario, difficulty)
+            )
+        task = self.task
+        self.promote(task)
+        # shield: закрытие окна загрузки не отменяет генерацию, ее можно будет показать позже
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None # Пока ждали, пришел новый ход и подсказка устарела
+            raise
+        if not result or "error" in result or not result.get("translation", "").strip():
+            # Неудачный результат не кешируем - следующий клик попробует заново
+            if self.task is task:
+                self.invalidate()
+        return result
+
 
 class HelpSystem:
-    def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
-        
-    async def generate_help_content(self, last_messages, scenario, difficulty):
-        """Генерирует контент для помощи"""
+    def __init__(self, client: ModelGateway = None, dialog_manager=None):
+        # Используем общий клиент чата, если он передан
+        self.client = client or get_gateway()
+        self.dialog_manager = dialog_manager
+        
+    @traced("help.generate", new_trace=True)
+    async def generate_help_content(self, last_messages, scenario, difficulty, priority: str = "help"):
+        """Генерирует контент для помощи (priority - класс запроса в планировщике)"""
         # Формируем контекст из последних сообщений
         context = ""
         last_ai_message_content = ""
@@ -45,8 +135,9 @@ class HelpSystem:
         """
         
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
+            response = await self.client.chat(
+                operation="help",
+                priority=priority,
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": help_prompt}],
                 temperature=0.7
@@ -109,8 +200,9 @@ class HelpSystem:
         """
         
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
+            response = await self.client.chat(
+                operation="help_cultural",
+                priority="help",
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.5
@@ -127,8 +219,9 @@ class HelpSystem:
         """
         
         try:
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
+            response = await self.client.chat(
+                operation="help_grammar",
+                priority="help",
                 model="gpt-3.5-turbo",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.5
@@ -138,11 +231,21 @@ class HelpSystem:
             return f"Ошибка: {e}"
 
 class HelpDialog:
-    def __init__(self, page: ft.Page, chat_screen):
+    def __init__(self, page: ft.Page, chat_screen, client: ModelGateway = None, dialog_manager=None):
         self.page = page
         self.chat_screen = chat_screen
-        self.help_system = HelpSystem()
+        self.help_system = HelpSystem(client, dialog_manager)
+        self.prefetcher = HelpPrefetcher(self.help_system)
         self.current_help_data = None
+    
+    def prefetch_help(self):
+        """Готовит подсказку к последнему ответу AI, если для уровня сложности включена предзагрузка"""
+        if not HELP_PREFETCH_BY_DIFFICULTY.get(self.chat_screen.difficulty, False):
+            return
+        if (self.chat_screen.max_hints != float('inf') and 
+            self.chat_screen.hint_count >= self.chat_screen.max_hints):
+            return # Подсказки кончились - показывать будет нечего
+        self.prefetcher.prefetch(self.chat_screen.messages, self.chat_screen.scenario, self.chat_screen.difficulty)
         
     async def show_help_dialog(self):
         """Показывает диалог помощи"""
@@ -157,17 +260,19 @@ class HelpDialog:
                 "Вы использовали все доступные подсказки для этого уровня сложности")
             return False
         
-        # Генерируем помощь (убираем кеширование - всегда свежий контент)
+        # Подсказка к текущему сообщению AI обычно уже готова (HelpPrefetcher) -
+        # окно загрузки показываем, только если ее еще нужно ждать
         loading_dialog = self.create_loading_dialog()
-        self.page.dialog = loading_dialog
-        loading_dialog.open = True
-        self.page.update()
+        if not self.prefetcher.is_ready(self.chat_screen.messages):
+            self.page.dialog = loading_dialog
+            loading_dialog.open = True
+            self.page.update()
         
         try:
             # Сбрасываем предыдущие данные помощи
             self.current_help_data = None
             
-            self.current_help_data = await self.help_system.generate_help_content(
+            self.current_help_data = await self.prefetcher.get(
                 self.chat_screen.messages,
                 self.chat_screen.scenario,
                 self.chat_screen.difficulty
@@ -190,7 +295,8 @@ class HelpDialog:
                 help_dialog.on_dismiss = lambda e: self.chat_screen._update_hints_display()
                 self.page.update()
                 
-                # Увеличиваем счетчик подсказок, если помощь была успешно СГЕНЕРИРОВАНА и ПОКАЗАНА
+                # Увеличиваем счетчик подсказок, только если помощь была ПОКАЗАНА
+                # (фоновая предзагрузка подсказки счетчик не тратит)
                 if self.chat_screen.max_hints != float('inf'):
                     self.chat_screen.hint_count += 1
                     
@@ -457,8 +563,9 @@ class HelpDialog:
                 Дай подробный и понятный ответ на русском языке.
                 """
                 
-                response = await asyncio.to_thread(
-                    self.help_system.client.chat.completions.create,
+                response = await self.help_system.client.chat(
+                    operation="help_question",
+                    priority="help",
                     model="gpt-3.5-turbo",
                     messages=[{"role": "user", "content": prompt}],
                     temperature=0.7
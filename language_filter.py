@@ -1,3 +1,6 @@
+from text_matcher import KeywordMatcher
+
+
 class LanguageFilter:
     def __init__(self):
         # В будущем здесь можно будет загрузить словари или модели
@@ -9,6 +12,9 @@ class LanguageFilter:
             # Важно: этот список должен быть тщательно подобран
             # и учитывать контекст, чтобы избежать ложных срабатываний.
         ]
+        # Автомат строится один раз: проверка за один проход по тексту при любом размере словаря.
+        # Без границ слов, чтобы ловить словоформы ("дураки", "идиота"); регистр, ё/е и leetspeak не важны
+        self.matcher = KeywordMatcher(self.aggressive_keywords, normalize=True)
 
     def is_aggressive(self, text: str) -> bool:
         """
@@ -17,12 +23,7 @@ class LanguageFilter:
         """
         if not text:
             return False
-        
-        text_lower = text.lower()
-        for keyword in self.aggressive_keywords:
-            if keyword in text_lower:
-                return True
-        return False
+        return self.matcher.contains_any(text)
 
     def get_detected_keywords(self, text: str) -> list[str]:
         """
@@ -30,13 +31,7 @@ class LanguageFilter:
         """
         if not text:
             return []
-            
-        text_lower = text.lower()
-        detected = []
-        for keyword in self.aggressive_keywords:
-            if keyword in text_lower:
-                detected.append(keyword)
-        return detected
+        return self.matcher.find_keywords(text)
 
 # Пример использования (для тестирования):
 if __name__ == '__main__':
@@ -46,6 +41,7 @@ if __name__ == '__main__':
         "Это нормально.",
         "Ты дурак какой-то.",
         "Ну что за черт!",
+        "Ты ИД1ОТ, дур@к!",
         "Я очень зол, блин.",
         "Все хорошо."
     ]
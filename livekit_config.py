@@ -18,18 +18,46 @@ VOICE_SETTINGS = {
     "chunk_duration": 0.1,  # 100ms chunks
     "silence_threshold": 0.01,
     "silence_duration": 1.0,  # 1 second of silence to stop recording
+    "max_buffer_seconds": 60,  # Recording buffer preallocated for this long (grows if exceeded)
+    # Voice activity detection (voice_activity.py); silence_threshold is the minimum speech RMS
+    "vad_frame_ms": 20,
+    "vad_snr_ratio": 3.0,  # Speech RMS must exceed the adaptive noise floor this many times
+    "vad_max_zcr": 0.45,  # Frames with a higher zero-crossing rate are treated as noise
+    "vad_noise_adaptation": 0.05,  # How fast the noise floor follows non-speech frames
+    "vad_hangover_ms": 200,  # Speech is extended by this much after the last speech frame
+    "vad_pre_roll_ms": 300,  # Audio kept before speech onset
+    "no_speech_timeout": 5.0,  # Stop if nothing was said for this long
+    # Voice session (voice_session.py): transcribe as soon as speech pauses, before the endpoint confirms it
+    "speculative_stt": True,
+    "turn_history_size": 100,  # Timings of the last N voice turns kept for latency tracking
 }
 
 # TTS Settings
 TTS_SETTINGS = {
     "voice": "alloy",  # OpenAI TTS voice
     "model": "tts-1",
-    "speed": 1.0
+    "speed": 1.0,
+    "response_format": "mp3",  # Whole-reply synthesis (text_to_speech)
+    # Streaming playback (tts_pipeline.py): sentences are synthesized as raw PCM and played as they arrive
+    "stream_format": "pcm",  # OpenAI "pcm" = 24 kHz, 16-bit, mono
+    "pcm_sample_rate": 24000,
+    "max_concurrent_synthesis": 3,
+    "min_sentence_chars": 20,  # Shorter sentences are merged with the next one
+    # Playback engine (audio_output.py): decoded PCM allowed ahead of the device, clips waiting for decode
+    "playback_queue_seconds": 2.0,
+    "playback_max_clips": 32,
+    # Synthesized speech cache (tts_cache.py)
+    "cache_dir": "tts_cache",
+    "cache_memory_mb": 32,
+    "cache_disk_mb": 256
 }
 
 # STT Settings  
 STT_SETTINGS = {
     "model": "whisper-1",
     "language": "en",
-    "temperature": 0.0
+    "temperature": 0.0,
+    # Audio is downmixed/downsampled to this before upload (never upsampled); Whisper works at 16 kHz mono
+    "upload_sample_rate": 16000,
+    "upload_channels": 1
 } 
\ No newline at end of file
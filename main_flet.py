@@ -1,13 +1,19 @@
 import flet as ft
 import asyncio
 import uuid
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from model_gateway import get_gateway
 from templates import templates
 from dialog_manager import DialogManager
 from language_filter import LanguageFilter
+from script_detector import detect_scripts
+from context_window import ContextWindow
+from tts_cache import template_phrases
 from prompts import get_system_prompt
 from help_system_flet import HelpSystem, HelpDialog
+from exercise_generator import ErrorAnalysisAndPracticeSystem
+from tracing import start_trace, span, traced
+from metrics import start_metrics_exporters
+from task_runner import TaskRunner
 from datetime import datetime
 import os
 
@@ -16,9 +22,16 @@ import os
 # В идеале, нужно передавать app через page.session или другим способом.
 global_app_instance = None
 
+# Частота перерисовки пузыря ассистента при потоковом ответе (кадров в секунду)
+STREAM_UPDATE_FPS = 15
+
+# Сколько проверок упражнений идет одновременно (клики по карточкам и "Проверить все")
+EXERCISE_CHECK_CONCURRENCY = 4
+
 # Импорт голосового функционала
 try:
     from voice_handler import VoiceHandler
+    from voice_session import VoiceSession
     VOICE_AVAILABLE = True
 except ImportError as e:
     print(f"⚠️ Voice functionality not available: {e}")
@@ -31,12 +44,16 @@ class EnglishLearningApp:
         self.page = page
         self.dialog_manager = DialogManager()
         
-        # Initialize OpenAI client
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        # Общий на процесс ModelGateway (AsyncOpenAI + один пул соединений), передается во все подсистемы
+        self.client = get_gateway()
         
         # Состояние упражнений
         self.current_practice_session = None
         self.completed_exercises_count = 0
+        # Проверка ответов: локально, неоднозначные - моделью (кеш оценок общий на приложение)
+        self.practice_system = ErrorAnalysisAndPracticeSystem(self.dialog_manager, client=self.client)
+        # Проверки ответов - задачи на event loop страницы, отменяются при уходе с экрана упражнений
+        self.exercise_checks = TaskRunner(EXERCISE_CHECK_CONCURRENCY)
         
         # Настройка страницы
         self.page.title = "Английские сценки"
@@ -84,6 +101,7 @@ class EnglishLearningApp:
 
         print(f"Обработано событие окна: {event_data}")
         if event_data == "close":
+            self.exercise_checks.cancel_all()
             # Очищаем файлы практик при закрытии приложения
             self.cleanup_practice_files()
             print("👋 Приложение закрывается, файлы практик очищены")
@@ -553,8 +571,11 @@ class EnglishLearningApp:
         self.update_coins_display()
         
         # Сохраняем текущую сессию для отслеживания
+        self.exercise_checks.cancel_all() # Карточки прошлой сессии больше не на экране
         self.current_practice_session = practice_session
         self.completed_exercises_count = 0
+        # complete_exercises отмечает упражнения и привязанные ошибки в файле сессии
+        self.practice_system.save_practice_session(practice_session)
 
         back_button = ft.ElevatedButton(
             "⬅️ На главный экран", 
@@ -614,6 +635,17 @@ class EnglishLearningApp:
                 card = self.create_exercise_card(exercise_data, index + 1)
                 exercise_cards_column_controls.append(card)
         
+        check_all_button = ft.ElevatedButton(
+            "✅ Проверить все",
+            on_click=lambda e: self.handle_check_all_exercises(exercise_cards_column.controls),
+            bgcolor="#4CAF50",
+            color=ft.Colors.WHITE,
+            style=ft.ButtonStyle(
+                shape=ft.RoundedRectangleBorder(radius=15),
+                padding=ft.padding.symmetric(horizontal=30, vertical=15)
+            )
+        )
+
         exercise_cards_column = ft.Column(
             exercise_cards_column_controls, 
             spacing=20, 
@@ -658,6 +690,8 @@ class EnglishLearningApp:
         page_content_controls.append(ft.Container(height=20))
 
         action_buttons_row_controls = [back_button]
+        if exercises_to_display:
+            action_buttons_row_controls.append(check_all_button)
         # if view_all_button: # This was causing NameError if view_all_button was not created
         #    action_buttons_row_controls.append(view_all_button)
         
@@ -711,6 +745,10 @@ class EnglishLearningApp:
                 alignment=ft.alignment.center
             ),
             actions=[
+                ft.TextButton(
+                    "✅ Проверить все",
+                    on_click=lambda _: self.handle_check_all_exercises(all_exercises_column.controls)
+                ),
                 ft.TextButton(
                     "Закрыть",
                     on_click=lambda _: self.close_dialog(all_exercises_dialog),
@@ -869,143 +907,165 @@ class EnglishLearningApp:
                 color=ft.Colors.with_opacity(0.1, ft.Colors.BLACK),
                 offset=ft.Offset(0, 2)
             ),
-            width=600  # Фиксированная ширина для центрирования
+            width=600,  # Фиксированная ширина для центрирования
+            data=(exercise, answer_field, result_container, check_button) # Для "Проверить все"
         )
     
     def handle_check_exercise(self, exercise, answer_field, result_container, check_button):
-        """Синхронный обработчик для проверки упражнения"""
+        """Обработчик клика "Проверить": проверка идет задачей на event loop страницы"""
         print(f"DEBUG: Handling check for exercise: {exercise.get('exercise_id', 'N/A')}")
-        import threading
-        
-        def run_async():
-            import asyncio
-            try:
-                # Создаем новый event loop для этого потока
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(self.check_exercise_async(exercise, answer_field, result_container, check_button))
-            except Exception as e:
-                # В случае ошибки показываем сообщение пользователю
-                print(f"DEBUG: Error in run_async for check_exercise: {e}")
-                result_container.content = ft.Text(f"Ошибка проверки: {e}", size=14, color="#F44336")
-                result_container.bgcolor = "#FFEBEE"
-                result_container.visible = True
-                if self.page: self.page.update() # Ensure page update
-            finally:
-                if 'loop' in locals() and loop.is_running():
-                    loop.close()
-        
-        # Запускаем в отдельном потоке
-        thread = threading.Thread(target=run_async)
-        thread.daemon = True
-        thread.start()
-    
-    async def check_exercise_async(self, exercise, answer_field, result_container, check_button):
-        """Асинхронная проверка ответа пользователя на упражнение"""
-        print(f"DEBUG: Starting async check for exercise: {exercise.get('exercise_id', 'N/A')}")
-        user_answer = answer_field.value.strip()
-        if not user_answer:
-            result_container.content = ft.Text(
-                "⚠️ Пожалуйста, введите ваш ответ", 
-                size=14, 
-                color="#FF9800",
-                weight=ft.FontWeight.BOLD
-            )
-            result_container.bgcolor = "#FFF3E0"
-            result_container.visible = True
+        self.page.run_task(self.run_exercise_checks, [(exercise, answer_field, result_container, check_button)])
+
+    def handle_check_all_exercises(self, cards):
+        """Обработчик "Проверить все": карточки с введенным и еще не проверенным ответом"""
+        checks = []
+        for card in cards:
+            if not isinstance(getattr(card, "data", None), tuple):
+                continue # Не карточка упражнения (например, кнопка "Показать все")
+            exercise, answer_field, result_container, check_button = card.data
+            if check_button.disabled or not (answer_field.value or "").strip():
+                continue
+            checks.append(card.data)
+        print(f"DEBUG: Checking all exercises: {len(checks)} with answers")
+        if checks:
+            self.page.run_task(self.run_exercise_checks, checks)
+
+    async def run_exercise_checks(self, checks):
+        """
+        Проверка карточек одной задачей на event loop страницы (не больше EXERCISE_CHECK_CONCURRENCY задач,
+        повторный клик по идущей проверке не дублирует ее). Для "Проверить все" это одна пачка:
+        неоднозначные ответы всех карточек идут к модели одним запросом.
+        """
+        key = tuple(id(check_button) for *_, check_button in checks)
+        result, = await self.exercise_checks.run_all([(key, self.check_exercises_async, checks)])
+        if isinstance(result, Exception): # Отмененные проверки (уход с экрана) не показываются
+            print(f"DEBUG: Error in exercise check: {result}")
+            for exercise, answer_field, result_container, check_button in checks:
+                self.show_check_error(result_container, check_button, result)
             if self.page: self.page.update()
+
+    async def check_exercises_async(self, checks):
+        """Проверяет ответы пачкой и отмечает упражнения в сессии (complete_exercises), затем показывает результаты"""
+        answered = []
+        for exercise, answer_field, result_container, check_button in checks:
+            if check_button.disabled:
+                continue # Карточку уже проверяет другая задача (клик "Проверить" и "Проверить все" подряд) или она проверена
+            user_answer = (answer_field.value or "").strip()
+            if not user_answer:
+                result_container.content = ft.Text(
+                    "⚠️ Пожалуйста, введите ваш ответ", 
+                    size=14, 
+                    color="#FF9800",
+                    weight=ft.FontWeight.BOLD
+                )
+                result_container.bgcolor = "#FFF3E0"
+                result_container.visible = True
+                continue
+            
+            # Блокируем кнопку во время проверки
+            check_button.disabled = True
+            check_button.content = ft.Row([
+                ft.ProgressRing(width=16, height=16, color=ft.Colors.WHITE),
+                ft.Text("Проверяю...", size=14, color=ft.Colors.WHITE)
+            ], spacing=8, alignment=ft.MainAxisAlignment.CENTER)
+            answered.append((exercise, user_answer, result_container, check_button))
+        if self.page: self.page.update()
+        if not answered:
             return
         
-        # Блокируем кнопку во время проверки
-        check_button.disabled = True
-        check_button.content = ft.Row([
-            ft.ProgressRing(width=16, height=16, color=ft.Colors.WHITE),
-            ft.Text("Проверяю...", size=14, color=ft.Colors.WHITE)
-        ], spacing=8, alignment=ft.MainAxisAlignment.CENTER)
-        if self.page: self.page.update()
+        print(f"DEBUG: Checking {len(answered)} exercises")
+        session_id = self.current_practice_session.get("session_id", "") if self.current_practice_session else ""
+        # Однозначные ответы проверяются локально без сети, остальные - моделью, одним запросом на пачку
+        outcomes = await self.practice_system.complete_exercises(
+            session_id, [(exercise, user_answer) for exercise, user_answer, _, _ in answered]
+        )
         
-        try:
-            # Простая проверка - считаем ответ правильным если он содержит правильную форму
-            correct_form = exercise.get("correct_form", "").lower()
-            is_correct = correct_form in user_answer.lower()
-            
-            await asyncio.sleep(0.5) # Simulate network delay for checking
-
-            if is_correct:
-                # Начисляем монеты
-                new_coin_count = self.dialog_manager.add_coins(1, "exercise_completed")
-                
-                # Увеличиваем счетчик выполненных упражнений
-                self.completed_exercises_count += 1
-                
-                # Проверяем, все ли упражнения выполнены
-                total_exercises = self.current_practice_session.get("total_exercises", 0) if self.current_practice_session else 0
-                if self.completed_exercises_count >= total_exercises and total_exercises > 0 : # Check total_exercises > 0
-                    self.cleanup_practice_files()
-                    print(f"🎉 Все {total_exercises} упражнений выполнены! Файлы практик очищены.")
-                
-                result_container.content = ft.Column([
-                    ft.Row([
-                        ft.Icon(ft.Icons.CHECK_CIRCLE, color="#4CAF50", size=20),
-                        ft.Text("Правильно!", size=16, weight=ft.FontWeight.BOLD, color="#2E7D32")
-                    ]),
-                    ft.Text("Отличная работа! Вы использовали правильную форму.", size=14, color="#1A1A1A"),
-                    ft.Container(
-                        content=ft.Row([
-                            ft.Text("🪙", size=18),
-                            ft.Text(f"+1 монета! Всего: {new_coin_count}", size=14, weight=ft.FontWeight.BOLD, color="#FF8F00")
-                        ]),
-                        bgcolor="#FFF8E1",
-                        border_radius=8,
-                        padding=ft.padding.all(10),
-                        margin=ft.margin.only(top=10)
-                    )
-                ])
-                result_container.bgcolor = "#E8F5E8"
-                
-                self.update_coins_display()
-                
+        for (exercise, user_answer, result_container, check_button), outcome in zip(answered, outcomes):
+            if outcome.get("error"):
+                self.show_check_error(result_container, check_button, outcome["error"])
             else:
-                result_container.content = ft.Column([
-                    ft.Row([
-                        ft.Icon(ft.Icons.ERROR, color="#F44336", size=20),
-                        ft.Text("Попробуйте еще раз", size=16, weight=ft.FontWeight.BOLD, color="#D32F2F")
-                    ]),
-                    ft.Text("Убедитесь, что вы используете правильную форму в своем ответе.", size=14, color="#1A1A1A"),
-                    ft.Text(f"Подсказка: используйте '{exercise.get('correct_form', '')}'", size=14, color="#1976D2", weight=ft.FontWeight.W_600)
-                ])
-                result_container.bgcolor = "#FFEBEE"
+                self.show_check_result(exercise, outcome, result_container, check_button)
+        
+        if self.page: self.page.update()
+
+    def show_check_result(self, exercise, outcome, result_container, check_button):
+        """Результат проверки в карточке; монеты уже начислены complete_exercises"""
+        if outcome.get("is_correct"):
+            # Увеличиваем счетчик выполненных упражнений
+            self.completed_exercises_count += 1
             
-            result_container.visible = True
+            # Проверяем, все ли упражнения выполнены
+            total_exercises = self.current_practice_session.get("total_exercises", 0) if self.current_practice_session else 0
+            if self.completed_exercises_count >= total_exercises and total_exercises > 0 : # Check total_exercises > 0
+                self.cleanup_practice_files()
+                print(f"🎉 Все {total_exercises} упражнений выполнены! Файлы практик очищены.")
             
-            # Блокируем кнопку после проверки (независимо от результата)
-            check_button.content = ft.Row([
-                ft.Icon(ft.Icons.DONE, size=18, color=ft.Colors.WHITE),
-                ft.Text("Проверено", size=14, color=ft.Colors.WHITE)
-            ], spacing=8, alignment=ft.MainAxisAlignment.CENTER)
-            check_button.bgcolor = "#9E9E9E"
-            check_button.disabled = True # Explicitly keep disabled
+            coins_earned = outcome.get("coins_earned", 0)
+            coins_text = f"+{coins_earned} монет(ы)! Всего: {self.dialog_manager.get_coins_data().get('coins', 0)}"
+            if outcome.get("error_mastered"):
+                coins_text += " 🎉 Ошибка полностью отработана!"
             
-        except Exception as ex:
-            print(f"DEBUG: Exception in check_exercise_async: {ex}")
-            result_container.content = ft.Text(
-                f"❌ Ошибка проверки: {ex}", 
-                size=14, 
-                color="#F44336"
-            )
-            result_container.bgcolor = "#FFEBEE"
-            result_container.visible = True
+            result_container.content = ft.Column([
+                ft.Row([
+                    ft.Icon(ft.Icons.CHECK_CIRCLE, color="#4CAF50", size=20),
+                    ft.Text("Правильно!", size=16, weight=ft.FontWeight.BOLD, color="#2E7D32")
+                ]),
+                ft.Text(outcome.get("feedback") or "Отличная работа! Вы использовали правильную форму.", size=14, color="#1A1A1A"),
+                ft.Container(
+                    content=ft.Row([
+                        ft.Text("🪙", size=18),
+                        ft.Text(coins_text, size=14, weight=ft.FontWeight.BOLD, color="#FF8F00")
+                    ]),
+                    bgcolor="#FFF8E1",
+                    border_radius=8,
+                    padding=ft.padding.all(10),
+                    margin=ft.margin.only(top=10),
+                    visible=coins_earned > 0
+                )
+            ])
+            result_container.bgcolor = "#E8F5E8"
             
-            # Восстанавливаем кнопку в случае ошибки (опционально, но хорошо для UX)
-            check_button.disabled = False
-            check_button.content = ft.Row([
-                ft.Icon(ft.Icons.CHECK_CIRCLE, size=18, color=ft.Colors.WHITE),
-                ft.Text("Проверить", size=14, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)
-            ], spacing=8, alignment=ft.MainAxisAlignment.CENTER)
-            check_button.bgcolor="#4CAF50" # Restore original color
+            self.update_coins_display()
+            
+        else:
+            result_container.content = ft.Column([
+                ft.Row([
+                    ft.Icon(ft.Icons.ERROR, color="#F44336", size=20),
+                    ft.Text("Попробуйте еще раз", size=16, weight=ft.FontWeight.BOLD, color="#D32F2F")
+                ]),
+                ft.Text(outcome.get("feedback") or "Убедитесь, что вы используете правильную форму в своем ответе.", size=14, color="#1A1A1A"),
+                ft.Text(f"Подсказка: используйте '{outcome.get('correct_answer') or exercise.get('correct_form', '')}'", size=14, color="#1976D2", weight=ft.FontWeight.W_600)
+            ])
+            result_container.bgcolor = "#FFEBEE"
         
-        if self.page: self.page.update()
-        print(f"DEBUG: Exiting async check for exercise: {exercise.get('exercise_id', 'N/A')}")
+        result_container.visible = True
+        
+        # Блокируем кнопку после проверки (независимо от результата)
+        check_button.content = ft.Row([
+            ft.Icon(ft.Icons.DONE, size=18, color=ft.Colors.WHITE),
+            ft.Text("Проверено", size=14, color=ft.Colors.WHITE)
+        ], spacing=8, alignment=ft.MainAxisAlignment.CENTER)
+        check_button.bgcolor = "#9E9E9E"
+        check_button.disabled = True # Explicitly keep disabled
+
+    def show_check_error(self, result_container, check_button, error):
+        """Проверка не удалась: показываем ошибку и возвращаем кнопку"""
+        print(f"DEBUG: Exercise check failed: {error}")
+        result_container.content = ft.Text(
+            f"❌ Ошибка проверки: {error}", 
+            size=14, 
+            color="#F44336"
+        )
+        result_container.bgcolor = "#FFEBEE"
+        result_container.visible = True
+        
+        # Восстанавливаем кнопку в случае ошибки (опционально, но хорошо для UX)
+        check_button.disabled = False
+        check_button.content = ft.Row([
+            ft.Icon(ft.Icons.CHECK_CIRCLE, size=18, color=ft.Colors.WHITE),
+            ft.Text("Проверить", size=14, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)
+        ], spacing=8, alignment=ft.MainAxisAlignment.CENTER)
+        check_button.bgcolor="#4CAF50" # Restore original color
     
     def update_coins_display(self):
         """Обновляет отображение монет в интерфейсе"""
@@ -1078,7 +1138,7 @@ class EnglishLearningApp:
 
         
         return {
-            "exercise_id": f"simple_{exercise_type}_{exercise_number}_{datetime.now().strftime('%H%M%S%f')}", # Added %f for milliseconds
+            "exercise_id": f"simple_{exercise_type}_{exercise_number}_{uuid.uuid4().hex}",
             "exercise_type": exercise_type,
             "exercise_number": exercise_number,
             "original_error": original_error,
@@ -1139,6 +1199,7 @@ class EnglishLearningApp:
     def return_to_main_screen(self, e=None): # Added e=None for compatibility with on_click
         """Возвращается на главный экран с очисткой файлов практик"""
         print("DEBUG: Returning to main screen")
+        self.exercise_checks.cancel_all() # Незавершенные проверки ушедшего экрана не нужны
         # Очищаем файлы практик при возврате на главный экран
         self.cleanup_practice_files()
         self.show_start_screen()
@@ -1154,15 +1215,18 @@ class ChatScreen:
         self.communication_mode = communication_mode
         self.client = client
         self.dialog_manager = dialog_manager
-        # Передаем созданный OpenAI клиент в DialogManager
+        # Передаем общий ModelGateway в DialogManager
         if self.dialog_manager and self.client: # Check if they exist
             self.dialog_manager.set_openai_client(self.client)
         self.language_filter = LanguageFilter()
         
         # Состояние чата
-        self.messages = []
+        self.messages = [] # Полная история диалога (сохраняется и анализируется целиком)
+        # В запрос к модели идет окно: system + сводка старых ходов + последние ходы
+        self.context_window = ContextWindow(self.client)
         self.hint_count = 0
         self.max_hints = self.get_max_hints()
+        self.stream_replies = True # Выводить ответ AI по мере генерации (token streaming)
         
         # UI элементы
         self.chat_container = None # type: ft.Column | None
@@ -1171,13 +1235,17 @@ class ChatScreen:
         
         # Голосовой функционал
         self.voice_handler = None # type: VoiceHandler | None
+        self.voice_session = None # type: VoiceSession | None
         self.voice_button = None # type: ft.Container | None
         self.is_voice_mode = (communication_mode == "voice")
         
         if self.is_voice_mode and VOICE_AVAILABLE:
             try:
-                self.voice_handler = VoiceHandler()
+                self.voice_handler = VoiceHandler(self.client)
                 self.setup_voice_callbacks()
+                # Фразы шаблона сценария (приветствие, реакции) озвучиваются заранее по предложениям и берутся из кеша
+                scenario_phrases = template_phrases({self.scenario_key: templates.get(self.scenario_key, {})})
+                if self.page: self.page.run_task(self.voice_handler.prewarm_tts_cache, scenario_phrases)
             except Exception as e:
                 print(f"⚠️ Error initializing VoiceHandler: {e}")
                 VOICE_AVAILABLE = False # Disable voice if init fails
@@ -1188,8 +1256,8 @@ class ChatScreen:
         try:
             # These require client and dialog_manager to be properly initialized
             if self.client and self.dialog_manager:
-                 self.help_system = HelpSystem(self.client, self.dialog_manager)
                  self.help_dialog = HelpDialog(self.page, self, self.client, self.dialog_manager) # Pass self as chat_screen
+                 self.help_system = self.help_dialog.help_system
             else:
                 print("⚠️ HelpSystem/HelpDialog not initialized due to missing client or dialog_manager")
                 self.help_system = None
@@ -1237,6 +1305,7 @@ class ChatScreen:
         )
         
         self.messages = [{"role": "system", "content": system_content}]
+        self.context_window.reset()
     
     def setup_voice_callbacks(self):
         """Настраивает колбэки для голосового обработчика"""
@@ -1247,11 +1316,16 @@ class ChatScreen:
         self.voice_handler.on_recording_start = self.on_voice_recording_start
         self.voice_handler.on_recording_stop = self.on_voice_recording_stop
         self.voice_handler.on_transcription_ready = self.on_voice_transcription_ready
+        if self.page:
+            # STT, ответ и озвучка одного хода перекрываются во времени; новая запись прерывает ход
+            self.voice_session = VoiceSession(self.voice_handler, self.process_voice_transcription, self.page.run_task)
         print("DEBUG: Voice callbacks set up.")
 
     def on_voice_recording_start(self):
         """Колбэк начала записи голоса"""
         print("DEBUG: Voice recording started (callback)")
+        if self.voice_session:
+            self.voice_session.barge_in() # Пользователь заговорил - текущий ответ больше не нужен
         if self.voice_button:
             self.voice_button.icon = ft.Icons.STOP
             self.voice_button.bgcolor = "#F44336"  # Красный
@@ -1267,10 +1341,10 @@ class ChatScreen:
             self.voice_button.tooltip = "Начать запись"
             if self.page: self.page.update(self.voice_button)
             
-        # Запускаем транскрипцию
-        if self.voice_handler:
-            print("DEBUG: Scheduling voice transcription processing.")
-            asyncio.create_task(self.process_voice_transcription())
+        # Запускаем ход голосовой сессии (колбэк может прийти из потока записи)
+        if self.voice_session:
+            print("DEBUG: Voice endpoint, starting voice turn.")
+            self.voice_session.endpoint()
     
     def on_voice_transcription_ready(self, text: str):
         """Колбэк готовности транскрипции"""
@@ -1280,35 +1354,20 @@ class ChatScreen:
             self.message_input.value = text
             if self.page: self.page.update(self.message_input)
     
-    async def process_voice_transcription(self):
-        """Обрабатывает транскрипцию голоса"""
-        if not self.voice_handler:
-            print("DEBUG: No voice handler for transcription processing.")
-            return
-            
+    async def process_voice_transcription(self, transcription, timings=None):
+        """Обрабатывает транскрипцию голоса (колбэк VoiceSession, распознавание уже выполнено)"""
         try:
-            # Показываем индикатор обработки
-            self.add_message_to_chat("🎤 Обрабатываю голосовое сообщение...", "system")
-            
-            # Транскрибируем аудио
-            print("DEBUG: Awaiting transcription from voice_handler.")
-            transcription = await self.voice_handler.transcribe_audio()
             print(f"DEBUG: Transcription received: '{transcription}'")
 
             if transcription:
-                # Удаляем индикатор обработки
-                if self.chat_container and self.chat_container.controls:
-                    self.chat_container.controls.pop()  # Удаляем последнее сообщение
+                self.on_voice_transcription_ready(transcription)
                 
                 # Добавляем транскрибированное сообщение
                 self.add_message_to_chat(f"🗣️ {transcription}", "user")
                 
                 # Отправляем сообщение в чат
-                await self.process_text_message(transcription)
+                await self.process_text_message(transcription, timings=timings)
             else:
-                # Удаляем индикатор и показываем ошибку
-                if self.chat_container and self.chat_container.controls:
-                    self.chat_container.controls.pop()
                 self.add_message_to_chat("❌ Не удалось распознать речь. Попробуйте еще раз.", "system")
                 
         except Exception as e:
@@ -1349,7 +1408,7 @@ class ChatScreen:
             if audio_data:
                 # Воспроизводим аудио
                 print("DEBUG: Playing AI audio response.")
-                self.voice_handler.play_audio(audio_data) # This might need to be async or threaded if it blocks
+                self.voice_handler.play_audio(audio_data) # Non-blocking: decoded and played by the playback engine
                 self.add_message_to_chat("🔊 Воспроизвожу ответ...", "system") # This appears after playback starts
             else:
                 self.add_message_to_chat("❌ Не удалось сгенерировать голосовой ответ.", "system")
@@ -1414,6 +1473,7 @@ class ChatScreen:
         
         return ft.Row([bubble], alignment=alignment)
     
+    @traced("ui.add_message")
     def add_message_to_chat(self, text, role):
         """Добавляет сообщение в чат с анимацией"""
         if self.chat_container:
@@ -1436,43 +1496,43 @@ class ChatScreen:
         # Обрабатываем текстовое сообщение
         await self.process_text_message(user_text)
     
-    async def process_text_message(self, user_text: str):
-        """Обрабатывает текстовое сообщение (из ввода или голоса)"""
+    async def process_text_message(self, user_text: str, timings=None):
+        """Обрабатывает текстовое сообщение (из ввода или голоса; timings - TurnTimings голосового хода)"""
+        with start_trace("chat.turn", dialog_id=self.dialog_id, scenario=self.scenario_key, mode=self.communication_mode):
+            await self._process_text_message(user_text, timings)
+
+    async def _process_text_message(self, user_text: str, timings=None):
         print(f"DEBUG: Processing text message: '{user_text}'")
         # Добавляем сообщение пользователя
         self.add_message_to_chat(user_text, "user")
 
-        # Предварительный анализ сообщения пользователя
-        if self.language_filter.is_aggressive(user_text):
+        # Предварительный анализ сообщения пользователя (один проход по тексту на словарь)
+        with span("chat.filter_checks", chars=len(user_text)):
             detected_profanity_keywords = self.language_filter.get_detected_keywords(user_text)
-            if detected_profanity_keywords and self.dialog_manager:
-                self.dialog_manager.log_raw_user_error(
-                    dialog_id=self.dialog_id,
-                    user_message_text=user_text,
-                    detected_error_type="profanity",
-                    raw_error_details=detected_profanity_keywords,
-                    context={"scenario": self.scenario, "difficulty": self.difficulty}
-                )
+            # Все слова кириллицей (не только частые), одним проходом по тексту
+            script_analysis = detect_scripts(user_text)
+        is_aggressive_message = bool(detected_profanity_keywords)
+        if detected_profanity_keywords and self.dialog_manager:
+            self.dialog_manager.log_raw_user_error(
+                dialog_id=self.dialog_id,
+                user_message_text=user_text,
+                detected_error_type="profanity",
+                raw_error_details=detected_profanity_keywords,
+                context={"scenario": self.scenario, "difficulty": self.difficulty}
+            )
 
-        common_russian_words = [
-            "да", "нет", "не", "и", "в", "на", "я", "ты", "он", "она", "оно", "мы", "вы", "они",
-            "мой", "твой", "его", "ее", "их", "наш", "ваш", "это", "тот", "так", "как", "что", "где",
-            "когда", "привет", "пока", "спасибо", "пожалуйста", "хорошо", "плохо", "что-то", "почему"
-        ]
-        
-        detected_russian_words = []
-        user_words = user_text.lower().replace(',', '').replace('.', '').replace('!', '').replace('?', '').split()
-        for word in user_words:
-            if word in common_russian_words:
-                detected_russian_words.append(word)
-        
-        if detected_russian_words and self.dialog_manager:
+        if script_analysis.has_cyrillic and self.dialog_manager:
             self.dialog_manager.log_raw_user_error(
                 dialog_id=self.dialog_id,
                 user_message_text=user_text,
                 detected_error_type="russian_word_detected",
-                raw_error_details=list(set(detected_russian_words)), # Unique words
-                context={"scenario": self.scenario, "difficulty": self.difficulty}
+                raw_error_details=list(dict.fromkeys(script_analysis.cyrillic_words)), # Unique words, in order
+                context={
+                    "scenario": self.scenario,
+                    "difficulty": self.difficulty,
+                    "cyrillic_spans": script_analysis.cyrillic_spans,
+                    "cyrillic_ratio": round(script_analysis.cyrillic_ratio, 2)
+                }
             )
         
         if any(word in user_text.lower() for word in ["выход", "exit", "bye", "пока"]): # Added "пока"
@@ -1483,7 +1543,7 @@ class ChatScreen:
         
         # Aggression check moved after exit check
         current_template = templates.get(self.scenario_key)
-        if self.language_filter.is_aggressive(user_text) and current_template:
+        if is_aggressive_message and current_template:
             # ... (rest of aggression logic as before)
             # Ensure dialog_manager is checked before use
             if self.dialog_manager:
@@ -1492,6 +1552,8 @@ class ChatScreen:
             return
 
         self.messages.append({"role": "user", "content": user_text})
+        if self.help_dialog:
+            self.help_dialog.prefetcher.invalidate() # Подсказка к прошлому ответу AI больше не нужна
         
         if not self.client:
             self.add_message_to_chat("Ошибка: OpenAI клиент не инициализирован.", "system")
@@ -1505,32 +1567,61 @@ class ChatScreen:
                 self.chat_container.controls.append(typing_indicator)
                 if self.page: self.page.update(self.chat_container)
 
-            response = await asyncio.to_thread(
-                self.client.chat.completions.create,
-                model="gpt-3.5-turbo",
-                messages=self.messages,
-                temperature=0.7 # Default, can be adjusted
-            )
-            
-            # Удаляем индикатор "печатает..."
-            if self.chat_container and self.chat_container.controls and self.chat_container.controls[-1] == typing_indicator:
-                self.chat_container.controls.pop()
-                # No page update needed here, will be updated when AI message is added
-            
-            answer = response.choices[0].message.content
-            self.add_message_to_chat(answer, "assistant") # This updates the page
+            # В голосовом режиме ответ озвучивается по предложениям прямо во время стриминга
+            speaker = None
+            if self.stream_replies and self.is_voice_mode and VOICE_AVAILABLE and self.voice_handler:
+                speaker = self.voice_handler.create_streaming_speaker()
+
+            def on_delta(delta):
+                if timings: timings.mark("first_token")
+                if speaker: speaker.feed(delta)
+
+            if self.stream_replies:
+                # Пузырь "печатает..." сам становится пузырем ответа
+                try:
+                    answer = await self.stream_assistant_reply(typing_indicator, on_delta=on_delta)
+                except Exception:
+                    if speaker: speaker.cancel()
+                    raise
+            else:
+                with span("chat.prompt_build"):
+                    messages = self.context_window.build(self.messages)
+                response = await self.client.chat(
+                    operation="chat_reply",
+                    model="gpt-3.5-turbo",
+                    messages=messages,
+                    temperature=0.7 # Default, can be adjusted
+                )
+                
+                # Удаляем индикатор "печатает..."
+                if self.chat_container and self.chat_container.controls and self.chat_container.controls[-1] == typing_indicator:
+                    self.chat_container.controls.pop()
+                    # No page update needed here, will be updated when AI message is added
+                
+                answer = response.choices[0].message.content
+                if timings: timings.mark("first_token")
+                self.add_message_to_chat(answer, "assistant") # This updates the page
             self.messages.append({"role": "assistant", "content": answer})
+            # Сводка старых ходов обновляется в фоне, ответ пользователю ее не ждет
+            self.context_window.after_turn(self.messages)
+            if self.help_dialog:
+                # Перевод и варианты ответа готовятся заранее, пока пользователь читает ответ
+                self.help_dialog.prefetch_help()
             
-            if self.is_voice_mode and VOICE_AVAILABLE and self.voice_handler:
+            if speaker:
+                # Досказываем остаток ответа; ждать конца воспроизведения не нужно
+                await speaker.finish(wait_playback=False)
+                if timings and speaker.first_audio_at:
+                    timings.mark("first_audio", speaker.first_audio_at)
+            elif self.is_voice_mode and VOICE_AVAILABLE and self.voice_handler:
                 await self.play_ai_response_voice(answer)
             
             if self.dialog_manager:
-                asyncio.create_task(
-                    self.dialog_manager.analyze_and_save_detailed_user_errors(
-                        dialog_id=self.dialog_id,
-                        user_message_text=user_text,
-                        full_dialog_history=self.messages
-                    )
+                # Реплика уходит в очередь пакетного анализа ошибок, запроса к модели на каждый ход нет
+                self.dialog_manager.error_analysis.enqueue(
+                    dialog_id=self.dialog_id,
+                    user_message_text=user_text,
+                    full_dialog_history=self.messages[:-1] # без только что полученного ответа
                 )
             
         except Exception as ex:
@@ -1543,11 +1634,87 @@ class ChatScreen:
                     "user_message": user_text
                 })
     
+    @traced("chat.stream_reply")
+    async def stream_assistant_reply(self, assistant_bubble: ft.Row, on_delta=None) -> str:
+        """
+        Запрашивает ответ в режиме stream=True и дописывает дельты в пузырь ассистента.
+        page.update вызывается не чаще STREAM_UPDATE_FPS раз в секунду.
+        on_delta (например, StreamingSpeaker.feed) получает каждую дельту сразу, без троттлинга.
+        Возвращает полный текст ответа после закрытия потока.
+        """
+        loop = asyncio.get_running_loop()
+        deltas: asyncio.Queue = asyncio.Queue()
+        bubble_text = assistant_bubble.controls[0].content # Row -> Container -> Text
+
+        with span("chat.prompt_build"):
+            messages = self.context_window.build(self.messages)
+        stream = await self.client.chat(
+            operation="chat_reply",
+            model="gpt-3.5-turbo",
+            messages=messages,
+            temperature=0.7,
+            stream=True
+        )
+
+        async def pump_stream():
+            # Поток читается отдельной задачей, чтобы отрисовка шла по кадрам, а не по приходу дельт
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        deltas.put_nowait(chunk.choices[0].delta.content)
+            except Exception as e:
+                deltas.put_nowait(e)
+            finally:
+                deltas.put_nowait(None)
+
+        pump_task = loop.create_task(pump_stream())
+
+        parts = []
+        frame_interval = 1.0 / STREAM_UPDATE_FPS
+        last_render = 0.0
+        dirty = False
+        try:
+            while True:
+                try:
+                    # Если есть неотрисованный текст - ждем не дольше, чем до следующего кадра
+                    timeout = max(0.0, frame_interval - (loop.time() - last_render)) if dirty else None
+                    item = await asyncio.wait_for(deltas.get(), timeout)
+                except asyncio.TimeoutError:
+                    item = ""
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if item:
+                    parts.append(item)
+                    dirty = True
+                    if on_delta: on_delta(item)
+                if dirty and loop.time() - last_render >= frame_interval:
+                    bubble_text.value = "".join(parts)
+                    with span("ui.update"):
+                        if self.page: self.page.update(bubble_text)
+                    last_render = loop.time()
+                    dirty = False
+        except asyncio.CancelledError:
+            pump_task.cancel()
+            await stream.close() # Ход прерван (barge-in): соединение закрывается, остаток ответа не читается
+            raise
+        finally:
+            if not pump_task.done():
+                await asyncio.wait([pump_task])
+
+        answer = "".join(parts)
+        bubble_text.value = answer
+        if self.page: self.page.update(bubble_text)
+        return answer
+
     def save_dialog_on_completion(self):
         """Сохраняет диалог при завершении"""
         if len(self.messages) > 1 and self.dialog_manager:  # есть сообщения кроме system
             self.dialog_manager.save_dialog(self.dialog_id, self.scenario, self.difficulty, self.messages)
             print(f"Dialog (ID: {self.dialog_id}) saved: {len(self.messages)} messages")
+            # Диалог закончен - не ждем таймера простоя, анализируем оставшиеся реплики
+            if self.page: self.page.run_task(self.dialog_manager.error_analysis.flush)
     
     def close_dialog(self, dialog: ft.AlertDialog): # Type hint for dialog
         """Закрывает диалог"""
@@ -1756,6 +1923,5 @@ def main(page: ft.Page):
 
 if __name__ == '__main__':
     print("DEBUG: Starting Flet app...")
+    start_metrics_exporters() # Снимок в dialog_logs/metrics.json и/или эндпоинт /metrics (METRICS_SETTINGS)
     ft.app(target=main, view=ft.AppView.WEB_BROWSER, port=8550, host="0.0.0.0")
-
-</rewritten_file> 
@@ -0,0 +1,348 @@
+import asyncio
+import atexit
+import functools
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+# Метрики процесса: задержки вызовов модели, токены, кеш, файловый ввод-вывод, фоновые задачи
+METRICS_SETTINGS = {
+    "json_dump_path": "dialog_logs/metrics.json",  # Периодический снимок в JSON; None - выключено
+    "json_dump_interval": 60.0,                    # Секунд между снимками
+    "http_port": None,                             # Например 9464: GET /metrics (текстовый формат Prometheus), /metrics.json
+    "http_host": "127.0.0.1",
+    "histogram_sub_buckets": 32,                   # Делений на каждую степень двойки: погрешность перцентилей ~3%
+    "quantiles": (0.5, 0.9, 0.95, 0.99),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_ZERO_BUCKET = -(1 << 30) # Нули и отрицательные значения - одна корзина ниже всех
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Dict = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class HdrHistogram:
+    """
+    Гистограмма в духе HDR: корзина - степень двойки, разбитая на sub_buckets равных частей.
+    Память - только занятые корзины, относительная погрешность перцентиля не больше 1/sub_buckets
+    при любом масштабе значений (от микросекунд до минут).
+    """
+
+    __slots__ = ("sub_buckets", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, sub_buckets: int):
+        self.sub_buckets = sub_buckets
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, value: float) -> int:
+        if value <= 0:
+            return _ZERO_BUCKET
+        mantissa, exponent = math.frexp(value) # value = mantissa * 2**exponent, mantissa в [0.5, 1)
+        return exponent * self.sub_buckets + int((mantissa - 0.5) * 2 * self.sub_buckets)
+
+    def _upper_bound(self, index: int) -> float:
+        exponent, sub = divmod(index, self.sub_buckets)
+        return (0.5 + (sub + 1) / (2 * self.sub_buckets)) * 2.0 ** exponent
+
+    def record(self, value: float):
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                if index == _ZERO_BUCKET:
+                    return 0.0
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+    def summary(self, quantiles) -> Dict[str, float]:
+        result = {"count": self.count, "sum": self.sum}
+        if self.count:
+            result.update({"min": self.min, "max": self.max, "mean": self.sum / self.count})
+            result.update({f"p{round(q * 100):g}": self.quantile(q) for q in quantiles})
+        return result
+
+
+class _Metric:
+    """Семейство значений одной метрики по наборам меток"""
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, registry: "MetricsRegistry"):
+        self.name = name
+        self.help = help_text
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, object] = {}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, registry: "MetricsRegistry"):
+        super().__init__(name, help_text, registry)
+        self._functions: Dict[LabelKey, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        """Значение считается при выгрузке (например, длина очереди)"""
+        with self._lock:
+            self._functions[_label_key(labels)] = function
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """+1 на время блока: сколько таких задач идет сейчас"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def value(self, **labels) -> float:
+        key = _label_key(labels)
+        function = self._functions.get(key)
+        return function() if function else self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        return list(values.items())
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = HdrHistogram(self.registry.settings["histogram_sub_buckets"])
+            histogram.record(value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Секунды выполнения блока (и при исключении тоже)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def get(self, **labels) -> Optional[HdrHistogram]:
+        return self._values.get(_label_key(labels))
+
+    def samples(self):
+        quantiles = self.registry.settings["quantiles"]
+        with self._lock:
+            return [(key, histogram.summary(quantiles)) for key, histogram in self._values.items()]
+
+
+class MetricsRegistry:
+    def __init__(self, settings: Dict = None):
+        self.settings = {**METRICS_SETTINGS, **(settings or {})}
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help_text: str):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, self)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        return self._get_or_create(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str = "") -> Gauge:
+        return self._get_or_create(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str = "") -> Histogram:
+        return self._get_or_create(Histogram, name, help_text)
+
+    def snapshot(self) -> Dict:
+        """Все метрики как JSON-совместимый словарь"""
+        metrics = {}
+        for name, metric in sorted(self._metrics.items()):
+            values = []
+            for key, value in metric.samples():
+                entry = {"labels": dict(key)}
+                if isinstance(value, dict):
+                    entry.update(value)
+                else:
+                    entry["value"] = value
+                values.append(entry)
+            metrics[name] = {"type": metric.kind, "help": metric.help, "values": values}
+        return {"generated_at": datetime.now().isoformat(), "metrics": metrics}
+
+    def render_text(self) -> str:
+        """Текстовый формат экспозиции Prometheus; гистограммы - как summary (квантили, _sum, _count)"""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            kind = "summary" if metric.kind == "histogram" else metric.kind
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in metric.samples():
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+                    continue
+                for q in self.settings["quantiles"]:
+                    quantile = value.get(f"p{round(q * 100):g}", 0.0)
+                    lines.append(f"{name}{_format_labels(key, {'quantile': q})} {quantile}")
+                lines.append(f"{name}_sum{_format_labels(key)} {value['sum']}")
+                lines.append(f"{name}_count{_format_labels(key)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path: str):
+        """Атомарная запись снимка (через временный файл)"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+
+# Общая для модулей метрика: фоновые задачи модели (анализ ошибок, сводка, упражнения), идущие сейчас
+BACKGROUND_TASKS = registry.gauge("background_tasks_in_flight", "Background model tasks running now, by kind")
+
+
+def timed(histogram: Histogram, **labels):
+    """Декоратор: время вызова функции (обычной или async) в histogram"""
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body, content_type = registry.render_text().encode(), "text/plain; version=0.0.4; charset=utf-8"
+        elif path == "/metrics.json":
+            body, content_type = json.dumps(registry.snapshot(), ensure_ascii=False).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Без строки в консоли на каждый опрос
+
+
+_exporters_started = False
+
+
+def start_metrics_exporters(settings: Dict = None):
+    """HTTP-эндпоинт и/или периодический JSON-снимок по METRICS_SETTINGS (один раз на процесс)"""
+    global _exporters_started
+    if _exporters_started:
+        return
+    _exporters_started = True
+    settings = {**registry.settings, **(settings or {})}
+
+    if settings["http_port"]:
+        try:
+            server = ThreadingHTTPServer((settings["http_host"], settings["http_port"]), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            print(f"📊 Метрики: http://{settings['http_host']}:{server.server_address[1]}/metrics")
+        except OSError as e:
+            print(f"⚠️ Не удалось запустить эндпоинт метрик: {e}")
+
+    dump_path = settings["json_dump_path"]
+    if dump_path:
+        def dump():
+            try:
+                registry.dump_json(dump_path)
+            except Exception as e:
+                print(f"⚠️ Не удалось сохранить метрики: {e}")
+
+        def dump_periodically():
+            while not stop.wait(settings["json_dump_interval"]):
+                dump()
+
+        stop = threading.Event()
+        threading.Thread(target=dump_periodically, daemon=True).start()
+        atexit.register(dump)
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import OPENAI_API_KEY
+from model_scheduler import ModelScheduler, estimate_request_tokens
+from call_policy import CallPolicy
+from tracing import span
+from metrics import registry
+
+# Общий для всего процесса доступ к API модели
+MODEL_GATEWAY_SETTINGS = {
+    "max_connections": 20,            # Одновременных HTTP-соединений на весь процесс
+    "max_keepalive_connections": 10,  # Сколько соединений держать открытыми между запросами (без повторного TLS)
+    "keepalive_expiry": 60.0,         # Сколько секунд простаивающее соединение остается в пуле
+    "connect_timeout": 5.0,
+    "max_retries": 0,                 # Повторы SDK выключены: повторами, дедлайнами и дублями управляет CallPolicy
+    # Таймаут одной попытки по назначению вызова, секунды (дедлайн всего вызова - в CALL_POLICY_SETTINGS)
+    "timeouts": {
+        "chat": 30.0,           # Обычный ответ в чате
+        "stream": 60.0,         # Потоковый ответ: соединение живет, пока модель пишет
+        "background": 90.0,     # Анализ ошибок, упражнения, сводка - пользователь их не ждет
+        "speech": 30.0,         # TTS
+        "transcription": 30.0,  # STT
+    },
+}
+
+MODEL_CALL_SECONDS = registry.histogram(
+    "model_call_seconds", "Model call duration including retries (stream: until the stream is open), by operation"
+)
+MODEL_CALLS = registry.counter("model_calls_total", "Model calls by operation, priority and outcome")
+MODEL_TOKENS = registry.counter("model_tokens_total", "Tokens from response usage (not reported for streams), by direction")
+MODEL_TTS_CHARACTERS = registry.counter("model_tts_characters_total", "Characters sent to TTS")
+MODEL_QUEUE_WAIT = registry.histogram("model_queue_wait_seconds", "Wait for a scheduler slot, by priority")
+MODEL_IN_FLIGHT = registry.gauge("model_requests_in_flight", "Model requests holding a scheduler slot")
+
+
+class ModelGateway:
+    """
+    Единая точка доступа к OpenAI для всех подсистем: один AsyncOpenAI и один пул
+    keep-alive соединений вместо отдельного синхронного клиента (и потока из asyncio.to_thread)
+    на каждый запрос. Таймаут задается по назначению вызова (MODEL_GATEWAY_SETTINGS["timeouts"]),
+    явный timeout=... в вызове имеет приоритет.
+    Каждый вызов проходит через CallPolicy (дедлайн, повторы, дубли, предохранитель), а каждая
+    попытка - через ModelScheduler: priority - класс из PRIORITY_CLASSES.
+    operation - место вызова ("chat_reply", "help_grammar", "answer_check"...) для метрик и трассировки.
+    """
+
+    def __init__(self, api_key: str = OPENAI_API_KEY, settings: Dict = None, scheduler: ModelScheduler = None,
+                 policy: CallPolicy = None, base_url: str = None):
+        self.settings = {**MODEL_GATEWAY_SETTINGS, **(settings or {})}
+        self.timeouts = {**MODEL_GATEWAY_SETTINGS["timeouts"], **self.settings["timeouts"]}
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.settings["max_connections"],
+                max_keepalive_connections=self.settings["max_keepalive_connections"],
+                keepalive_expiry=self.settings["keepalive_expiry"]
+            ),
+            timeout=httpx.Timeout(self.timeouts["chat"], connect=self.settings["connect_timeout"]),
+            follow_redirects=True
+        )
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url, # None - адрес по умолчанию (или OPENAI_BASE_URL); для бенчмарка - локальный сервер
+            http_client=self.http_client,
+            max_retries=self.settings["max_retries"]
+        )
+        self.scheduler = scheduler or ModelScheduler()
+        self.policy = policy or CallPolicy()
+        MODEL_IN_FLIGHT.set_function(lambda: self.scheduler.in_flight)
+
+    def _timeout(self, purpose: str, kwargs: Dict) -> httpx.Timeout:
+        seconds = kwargs.pop("timeout", None) or self.timeouts[purpose]
+        return httpx.Timeout(seconds, connect=self.settings["connect_timeout"])
+
+    @contextmanager
+    def _measure(self, kind: str, operation: str, priority: str, **attributes):
+        """Span трассировки и метрики одного вызова (вместе с повторами)"""
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            with span(f"model.{kind}", operation=operation, priority=priority, **attributes):
+                yield
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            MODEL_CALL_SECONDS.observe(time.perf_counter() - started, operation=operation)
+            MODEL_CALLS.inc(operation=operation, priority=priority, outcome=outcome)
+
+    async def chat(self, purpose: str = None, priority: str = None, deadline: float = None,
+                   hedge: bool = None, operation: str = None, **kwargs):
+        """
+        chat.completions.create. purpose - ключ таймаута попытки; по умолчанию "stream" для stream=True,
+        иначе "chat". priority по умолчанию "background" для purpose="background", иначе "interactive".
+        deadline и hedge переопределяют политику класса.
+        С stream=True возвращает AsyncStream (читать через async for); слот планировщика
+        освобождается, когда поток открыт.
+        """
+        purpose = purpose or ("stream" if kwargs.get("stream") else "chat")
+        priority = priority or ("background" if purpose == "background" else "interactive")
+        operation = operation or purpose
+        timeout = self._timeout(purpose, kwargs)
+        estimated = estimate_request_tokens(kwargs, self.scheduler.settings["default_completion_tokens"])
+
+        async def attempt():
+            async with self.scheduler.slot(priority, estimated) as reservation:
+                MODEL_QUEUE_WAIT.observe(reservation.waited, priority=priority)
+                response = await self.client.chat.completions.create(timeout=timeout, **kwargs)
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    reservation.actual_tokens = usage.total_tokens
+                    MODEL_TOKENS.inc(usage.prompt_tokens, operation=operation, direction="prompt")
+                    MODEL_TOKENS.inc(usage.completion_tokens, operation=operation, direction="completion")
+                return response
+
+        with self._measure("chat", operation, priority, stream=bool(kwargs.get("stream")), estimated_tokens=estimated):
+            return await self.policy.call("chat", priority, attempt, deadline=deadline, hedge=hedge)
+
+    async def speech(self, priority: str = "voice", deadline: float = None, operation: str = "tts", **kwargs) -> bytes:
+        """audio.speech.create, возвращает готовые байты аудио"""
+        timeout = self._timeout("speech", kwargs)
+        MODEL_TTS_CHARACTERS.inc(len(kwargs.get("input", "")), operation=operation)
+
+        async def attempt():
+            async with self.scheduler.slot(priority) as reservation:
+                MODEL_QUEUE_WAIT.observe(reservation.waited, priority=priority)
+                response = await self.client.audio.speech.create(timeout=timeout, **kwargs)
+                return response.content
+
+        with self._measure("speech", operation, priority):
+            return await self.policy.call("speech", priority, attempt, deadline=deadline)
+
+    async def transcribe(self, priority: str = "voice", deadline: float = None, operation: str = "stt", **kwargs) -> str:
+        """audio.transcriptions.create, возвращает текст"""
+        timeout = self._timeout("transcription", kwargs)
+        file = kwargs.get("file")
+
+        async def attempt():
+            if hasattr(file, "seek"):
+                file.seek(0) # Повтор отправляет файл заново
+            async with self.scheduler.slot(priority) as reservation:
+                MODEL_QUEUE_WAIT.observe(reservation.waited, priority=priority)
+                response = await self.client.audio.transcriptions.create(timeout=timeout, **kwargs)
+                return response.text
+
+        with self._measure("transcription", operation, priority):
+            return await self.policy.call("transcription", priority, attempt, deadline=deadline)
+
+    async def aclose(self):
+        await self.client.close()
+
+
+_gateway: Optional[ModelGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> ModelGateway:
+    """Общий на процесс ModelGateway (создается при первом обращении)"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = ModelGateway()
+        return _gateway
@@ -0,0 +1,217 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from weakref import WeakKeyDictionary
+
+from context_window import estimate_message_tokens
+
+# Классы приоритета запросов к модели, от самого срочного
+PRIORITY_CLASSES = ("interactive", "help", "voice", "background", "batch")
+
+MODEL_SCHEDULER_SETTINGS = {
+    "requests_per_minute": 500,
+    "tokens_per_minute": 200000,
+    "max_in_flight": 16,               # Одновременных запросов на процесс (не больше max_connections шлюза)
+    # Доля лимитов (корзин и max_in_flight), которую класс оставляет свободной для более срочных:
+    # фоновые запросы ждут, пока корзина не наполнится выше этой доли
+    "reserve": {
+        "interactive": 0.0,
+        "help": 0.0,
+        "voice": 0.0,
+        "background": 0.25,
+        "batch": 0.4,
+    },
+    "pressure_margin": 0.1,            # under_pressure() срабатывает заранее, на reserve + margin
+    "default_completion_tokens": 300,  # Оценка ответа, если в запросе нет max_tokens
+}
+
+
+class TokenBucket:
+    """Корзина на per_minute единиц с непрерывным пополнением; уровень может уйти в минус после доплаты"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def level(self) -> float:
+        self._refill()
+        return self.tokens / self.capacity
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """Через сколько секунд можно взять amount, оставив в корзине reserve от емкости"""
+        self._refill()
+        needed = min(amount, self.capacity) + self.capacity * reserve - self.tokens
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+    def adjust(self, estimated: float, actual: float):
+        """Поправка после ответа: списано по оценке, а потрачено actual"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + estimated - actual)
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "future", "queued_at", "task")
+
+    def __init__(self, priority: str, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.tokens = tokens
+        self.future = future
+        self.queued_at = time.monotonic()
+        self.task = asyncio.current_task()
+
+
+class Reservation:
+    """Выданный слот; actual_tokens заполняется по usage ответа, если он известен"""
+
+    __slots__ = ("priority", "tokens", "actual_tokens", "waited")
+
+    def __init__(self, priority: str, tokens: int, waited: float):
+        self.priority = priority
+        self.tokens = tokens
+        self.actual_tokens: Optional[int] = None
+        self.waited = waited
+
+
+def estimate_request_tokens(kwargs: Dict, default_completion_tokens: int = None) -> int:
+    """Оценка стоимости chat-запроса в токенах: сообщения + ожидаемый ответ"""
+    completion = kwargs.get("max_tokens") or default_completion_tokens or MODEL_SCHEDULER_SETTINGS["default_completion_tokens"]
+    return sum(estimate_message_tokens(message) for message in kwargs.get("messages") or []) + completion
+
+
+class ModelScheduler:
+    """
+    Очередь запросов к модели со строгим приоритетом классов (PRIORITY_CLASSES) и двумя
+    корзинами: запросов и токенов в минуту. Слот выдается голове очереди, когда хватает
+    корзин и места в max_in_flight; фоновые классы при этом оставляют свободной долю
+    reserve, поэтому всплеск фоновой работы не задерживает ответ в чате.
+    Работает в одном event loop.
+    """
+
+    def __init__(self, settings: Dict = None):
+        self.settings = {**MODEL_SCHEDULER_SETTINGS, **(settings or {})}
+        self.reserve = {**MODEL_SCHEDULER_SETTINGS["reserve"], **self.settings["reserve"]}
+        self.requests = TokenBucket(self.settings["requests_per_minute"])
+        self.tokens = TokenBucket(self.settings["tokens_per_minute"])
+        self._rank = {name: rank for rank, name in enumerate(PRIORITY_CLASSES)}
+        self._queue: List = [] # (rank, seq, waiter)
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.in_flight = 0
+        self.dispatched: Counter = Counter()
+        self.total_wait: Counter = Counter() # Секунды в очереди по классам
+        self._promoted: "WeakKeyDictionary[asyncio.Task, str]" = WeakKeyDictionary() # Задача -> повышенный класс
+
+    def _in_flight_limit(self, priority: str) -> int:
+        return max(1, int(self.settings["max_in_flight"] * (1 - self.reserve[priority])))
+
+    @asynccontextmanager
+    async def slot(self, priority: str, tokens: int = 0):
+        """Ждет слот для запроса класса priority стоимостью tokens и держит его до выхода из блока"""
+        if priority not in self._rank:
+            raise ValueError(f"Unknown priority class: {priority}")
+        promoted = self._promoted.get(asyncio.current_task())
+        if promoted and self._rank[promoted] < self._rank[priority]:
+            priority = promoted
+        waiter = _Waiter(priority, tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, (self._rank[priority], next(self._seq), waiter))
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(Reservation(waiter.priority, tokens, 0.0)) # Слот выдан, но запрос уже не нужен
+            raise
+        reservation = Reservation(waiter.priority, tokens, time.monotonic() - waiter.queued_at)
+        try:
+            yield reservation
+        finally:
+            self._release(reservation)
+
+    def _dispatch(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            _, _, waiter = self._queue[0]
+            if waiter.future.done(): # Отменен, пока ждал
+                heapq.heappop(self._queue)
+                continue
+            reserve = self.reserve[waiter.priority]
+            if self.in_flight >= self._in_flight_limit(waiter.priority):
+                return # Освободится в _release
+            wait = max(self.requests.wait_time(1, reserve), self.tokens.wait_time(waiter.tokens, reserve))
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+            self.dispatched[waiter.priority] += 1
+            self.total_wait[waiter.priority] += time.monotonic() - waiter.queued_at
+            waiter.future.set_result(None)
+
+    def promote(self, task: asyncio.Task, priority: str):
+        """
+        Повышает класс запросов задачи task: ждущие в очереди переставляются, следующие попытки
+        сразу встают с priority. Например, фоновая подготовка подсказки, которую пользователь уже ждет.
+        """
+        if priority not in self._rank:
+            raise ValueError(f"Unknown priority class: {priority}")
+        rank = self._rank[priority]
+        current = self._promoted.get(task)
+        if current is None or rank < self._rank[current]:
+            self._promoted[task] = priority
+        changed = False
+        for index, (queued_rank, seq, waiter) in enumerate(self._queue):
+            if waiter.task is task and rank < queued_rank and not waiter.future.done():
+                waiter.priority = priority
+                self._queue[index] = (rank, seq, waiter)
+                changed = True
+        if changed:
+            heapq.heapify(self._queue)
+            self._dispatch()
+
+    def _release(self, reservation: Reservation):
+        self.in_flight -= 1
+        if reservation.actual_tokens is not None:
+            self.tokens.adjust(reservation.tokens, reservation.actual_tokens)
+        self._dispatch()
+
+    def under_pressure(self, priority: str) -> bool:
+        """
+        Пришлось бы запросу этого класса ждать сейчас (или почти)? Фоновые задачи по этому
+        признаку откладывают работу и собирают ее в более крупные пачки.
+        """
+        rank = self._rank[priority]
+        if any(queued_rank <= rank and not waiter.future.done() for queued_rank, _, waiter in self._queue):
+            return True
+        if self.in_flight >= self._in_flight_limit(priority):
+            return True
+        threshold = self.reserve[priority] + self.settings["pressure_margin"]
+        return self.requests.level() < threshold or self.tokens.level() < threshold
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": Counter(waiter.priority for _, _, waiter in self._queue if not waiter.future.done()),
+            "dispatched": dict(self.dispatched),
+            "avg_wait": {p: self.total_wait[p] / n for p, n in self.dispatched.items() if n},
+            "requests_level": round(self.requests.level(), 3),
+            "tokens_level": round(self.tokens.level(), 3),
+        }
@@ -0,0 +1,103 @@
+import re
+from typing import List, Tuple
+
+# Слова кириллицей ищутся одним регулярным выражением; дефис и апостроф внутри слова
+# не разрывают его ("что-то", "don't")
+_CYRILLIC = "\u0400-\u052F\u1C80-\u1C8F\u2DE0-\u2DFF\uA640-\uA69F" # Кириллица со всеми дополнениями
+_LATIN = "A-Za-z\u00C0-\u024F"
+_CYRILLIC_WORD = re.compile(rf"[{_CYRILLIC}]+(?:[-'’][{_CYRILLIC}]+)*")
+_ANY_WORD = re.compile(rf"[{_CYRILLIC}]+(?:[-'’][{_CYRILLIC}]+)*|[{_LATIN}]+(?:[-'’][{_LATIN}]+)*")
+
+
+class ScriptAnalysis:
+    """Результат detect_scripts: слова кириллицей с позициями и доля русского в сообщении"""
+
+    __slots__ = ("text", "cyrillic_spans", "cyrillic_words", "_total_word_count")
+
+    def __init__(self, text: str, cyrillic_spans: List[Tuple[int, int]], cyrillic_words: List[str]):
+        self.text = text
+        self.cyrillic_spans = cyrillic_spans # (начало, конец) каждого слова кириллицей в исходном тексте
+        self.cyrillic_words = cyrillic_words # Эти слова в нижнем регистре, по порядку
+        self._total_word_count = None
+
+    @property
+    def cyrillic_word_count(self) -> int:
+        return len(self.cyrillic_words)
+
+    @property
+    def has_cyrillic(self) -> bool:
+        return bool(self.cyrillic_words)
+
+    @property
+    def total_word_count(self) -> int:
+        """Слов кириллицей и латиницей (числа и знаки не считаются); считается только по запросу"""
+        if self._total_word_count is None:
+            self._total_word_count = sum(1 for _ in _ANY_WORD.finditer(self.text))
+        return self._total_word_count
+
+    @property
+    def cyrillic_ratio(self) -> float:
+        """Доля слов кириллицей среди всех слов: 0.0 - только английский, 1.0 - только русский"""
+        if not self.cyrillic_words:
+            return 0.0
+        return self.cyrillic_word_count / self.total_word_count
+
+    def __repr__(self):
+        return f"ScriptAnalysis(cyrillic_words={self.cyrillic_words}, cyrillic_spans={self.cyrillic_spans})"
+
+
+_EMPTY_LIST: List = [] # Общий пустой список для сообщений без кириллицы (не изменять)
+
+
+def detect_scripts(text: str) -> ScriptAnalysis:
+    """
+    Находит все слова кириллицей за один проход по тексту.
+    Сообщение в ASCII (обычный английский) отсекается без регулярного выражения и без новых списков.
+    """
+    if not text or text.isascii():
+        return ScriptAnalysis(text or "", _EMPTY_LIST, _EMPTY_LIST)
+
+    spans = []
+    words = []
+    for match in _CYRILLIC_WORD.finditer(text):
+        spans.append(match.span())
+        words.append(match.group().lower())
+    return ScriptAnalysis(text, spans, words)
+
+
+def unique_cyrillic_words(text: str) -> List[str]:
+    """Уникальные слова кириллицей в порядке появления"""
+    return list(dict.fromkeys(detect_scripts(text).cyrillic_words))
+
+
+# Бенчмарк: старая проверка по списку из 35 слов против детектора
+if __name__ == '__main__':
+    import timeit
+
+    def legacy_detect(user_text):
+        common_russian_words = [
+            "да", "нет", "не", "и", "в", "на", "я", "ты", "он", "она", "оно", "мы", "вы", "они",
+            "мой", "твой", "его", "ее", "их", "наш", "ваш", "это", "тот", "так", "как", "что", "где",
+            "когда", "привет", "пока", "спасибо", "пожалуйста", "хорошо", "плохо", "что-то", "почему"
+        ]
+        detected_russian_words = []
+        user_words = user_text.lower().replace(',', '').replace('.', '').replace('!', '').replace('?', '').split()
+        for word in user_words:
+            if word in common_russian_words:
+                detected_russian_words.append(word)
+        return detected_russian_words
+
+    samples = {
+        "английский": "I would like to order a steak, medium rare, and a glass of red wine, please.",
+        "смешанный": "I want заказать стейк, please, и ещё бокал вина. Что-то вкусное!",
+        "русский": "Здравствуйте, я хотел бы заказать столик на двоих на вечер пятницы.",
+        "длинный англ.": "Could you tell me where the nearest station is? " * 40,
+    }
+
+    runs = 20000
+    print(f"{'текст':>14} {'список, мкс':>12} {'детектор, мкс':>14}  найдено списком / детектором")
+    for name, text in samples.items():
+        legacy_us = timeit.timeit(lambda: legacy_detect(text), number=runs) / runs * 1e6
+        detector_us = timeit.timeit(lambda: detect_scripts(text), number=runs) / runs * 1e6
+        analysis = detect_scripts(text)
+        print(f"{name:>14} {legacy_us:>12.2f} {detector_us:>14.2f}  {len(legacy_detect(text))} / {analysis.cyrillic_word_count} (доля {analysis.cyrillic_ratio:.2f})")
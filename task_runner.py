@@ -0,0 +1,65 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+
+
+class TaskRunner:
+    """
+    Задачи на event loop приложения (вместо потока и нового event loop на каждый клик):
+    не больше max_concurrency одновременно, одна задача на ключ (повторный клик по той же
+    карточке не запускает вторую проверку), отмена всех задач при уходе с экрана.
+    submit() и run_all() вызываются из event loop, cancel_all() - из любого потока.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.tasks: Dict[Hashable, asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def in_flight(self) -> int:
+        return sum(1 for task in self.tasks.values() if not task.done())
+
+    def submit(self, key: Hashable, fn: Callable[..., Awaitable], *args) -> asyncio.Task:
+        """Запускает fn(*args); если задача с этим ключом еще идет, возвращает ее"""
+        task = self.tasks.get(key)
+        if task is not None and not task.done():
+            return task
+        self._loop = asyncio.get_running_loop()
+        task = self._loop.create_task(self._run(fn, *args))
+        self.tasks[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return task
+
+    async def run_all(self, jobs: Iterable[tuple]) -> List:
+        """Пачка задач (key, fn, *args); результаты и исключения - в порядке jobs"""
+        tasks = [self.submit(key, fn, *args) for key, fn, *args in jobs]
+        if not tasks:
+            return []
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    def cancel_all(self):
+        """Отменяет все идущие и ожидающие очереди задачи"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._cancel_all()
+        else:
+            loop.call_soon_threadsafe(self._cancel_all) # Обработчики кликов Flet работают в своих потоках
+
+    async def _run(self, fn: Callable[..., Awaitable], *args):
+        async with self.semaphore:
+            return await fn(*args)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+
+    def _cancel_all(self):
+        for task in list(self.tasks.values()):
+            task.cancel()
+        self.tasks.clear()
@@ -0,0 +1,87 @@
+import asyncio
+
+from answer_grader import ACCEPT, REJECT, UNCERTAIN, AnswerGrader, grade_locally
+
+
+def exercise(exercise_type="word_replacement", exercise_id="ex1"):
+    return {
+        "exercise_id": exercise_id,
+        "exercise_type": exercise_type,
+        "original_error": "She go to school",
+        "correct_form": "She is going to school",
+        "content": "ЗАДАНИЕ: Исправьте ошибку.\nShe go to school\nПРАВИЛЬНЫЙ ОТВЕТ: She goes to school",
+    }
+
+
+def test_grades_against_expected_answer_of_the_exercise():
+    assert grade_locally(exercise(), "She goes to school.").verdict == ACCEPT
+    assert grade_locally(exercise(), "she GOES to school").verdict == ACCEPT
+    assert grade_locally(exercise(), "She goes to scool").verdict == ACCEPT  # Опечатка
+    # correct_form из профиля ошибок не эталон упражнения - такой ответ решает модель
+    assert grade_locally(exercise(), "She is going to school").verdict == UNCERTAIN
+
+
+def test_rejects_unchanged_task_sentence_and_empty_answer():
+    assert grade_locally(exercise(), "She go to school").verdict == REJECT
+    assert grade_locally(exercise(), "  ").verdict == REJECT
+
+
+def test_open_exercises_go_to_the_model():
+    assert grade_locally(exercise("text_composition"), "She goes to school").verdict == UNCERTAIN
+    assert grade_locally(exercise("translation_ru_en"), "She goes to school").verdict == UNCERTAIN
+
+
+def test_grader_calls_model_once_for_same_uncertain_answer():
+    calls = []
+
+    async def model_check(exercise, user_answer):
+        calls.append(user_answer)
+        await asyncio.sleep(0.01)
+        return {"is_correct": True, "feedback": "Верно", "correct_answer": "She goes to school"}
+
+    async def scenario():
+        grader = AnswerGrader(model_check)
+        results = await asyncio.gather(*[grader.grade(exercise(), "She is going to school") for _ in range(3)])
+        results.append(await grader.grade(exercise(), "she IS going to school!"))
+        results.append(await grader.grade(exercise(), "She goes to school"))
+        return results
+
+    results = asyncio.run(scenario())
+    assert calls == ["She is going to school"]
+    assert all(result["is_correct"] for result in results)
+
+
+def test_cancelled_caller_does_not_cancel_shared_check():
+    calls = []
+
+    async def model_check(exercise, user_answer):
+        calls.append(user_answer)
+        await asyncio.sleep(0.02)
+        return {"is_correct": True, "feedback": "Верно", "correct_answer": "She goes to school"}
+
+    async def scenario():
+        grader = AnswerGrader(model_check)
+        first = asyncio.create_task(grader.grade(exercise(), "She is going to school"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(grader.grade(exercise(), "She is going to school"))
+        await asyncio.sleep(0)
+        first.cancel() # Пользователь ушел с экрана
+        return await second, first.cancelled()
+
+    result, first_cancelled = asyncio.run(scenario())
+    assert first_cancelled
+    assert result["is_correct"]
+    assert calls == ["She is going to school"]
+
+
+def test_model_error_reaches_every_waiter():
+    async def model_check(exercise, user_answer):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model unavailable")
+
+    async def scenario():
+        grader = AnswerGrader(model_check)
+        return await asyncio.gather(*[grader.grade(exercise(), "She is going to school") for _ in range(2)],
+                                    return_exceptions=True)
+
+    assert [type(error) for error in asyncio.run(scenario())] == [RuntimeError, RuntimeError]
@@ -0,0 +1,31 @@
+import io
+import wave
+
+from audio_buffer import PcmBuffer, encode_wav
+
+
+def test_pcm_buffer_grows_and_keeps_contents():
+    buffer = PcmBuffer(capacity=4)
+    buffer.append(b"\x01\x02\x03")
+    buffer.append(bytearray(b"\x04\x05\x06\x07"))
+    buffer.append(memoryview(b"\x08"))
+    assert len(buffer) == 8
+    with buffer.view() as view:
+        assert view.tobytes() == bytes(range(1, 9))
+
+    buffer.clear()
+    assert len(buffer) == 0
+    buffer.append(b"\xff")
+    with buffer.view() as view:
+        assert view.tobytes() == b"\xff"
+
+
+def test_encode_wav_is_readable():
+    pcm = bytes(range(256)) * 4
+    wav_file = encode_wav(pcm, sample_rate=16000, channels=2)
+    assert wav_file.name == "speech.wav"
+    with wave.open(io.BytesIO(wav_file.getvalue())) as reader:
+        assert reader.getframerate() == 16000
+        assert reader.getnchannels() == 2
+        assert reader.getsampwidth() == 2
+        assert reader.readframes(reader.getnframes()) == pcm
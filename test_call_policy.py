@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from call_policy import CallPolicy, CircuitOpenError, DeadlineExceededError
+
+FAST = {"deadline": 5.0, "max_attempts": 3, "base_delay": 0.001, "max_delay": 0.001, "hedge": False}
+
+
+def policy(**settings) -> CallPolicy:
+    return CallPolicy({"policies": {"interactive": FAST, "background": FAST}, **settings})
+
+
+def connection_error() -> openai.APIConnectionError:
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+
+def flaky(failures: int, result="ok"):
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        if len(calls) <= failures:
+            raise connection_error()
+        return result
+    return attempt, calls
+
+
+def test_retries_retryable_errors():
+    attempt, calls = flaky(2)
+    assert asyncio.run(policy().call("chat", "interactive", attempt)) == "ok"
+    assert len(calls) == 3
+
+
+def test_gives_up_after_max_attempts():
+    attempt, calls = flaky(5)
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(policy().call("chat", "interactive", attempt))
+    assert len(calls) == 3
+
+
+def test_non_retryable_error_is_raised_at_once():
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    call_policy = policy()
+    with pytest.raises(ValueError):
+        asyncio.run(call_policy.call("chat", "interactive", attempt))
+    assert len(calls) == 1
+    assert call_policy.breaker("chat", "interactive").failures == 0
+
+
+def test_breaker_opens_after_consecutive_failures_and_recovers():
+    call_policy = policy(breaker_failure_threshold=3, breaker_open_seconds=0.05)
+    attempt, calls = flaky(3)
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(call_policy.call("chat", "interactive", attempt))
+    assert call_policy.breaker("chat", "interactive").state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call_policy.call("chat", "interactive", attempt))
+    assert len(calls) == 3  # Открытый предохранитель не пускает запрос
+
+    asyncio.run(asyncio.sleep(0.06))
+    assert call_policy.breaker("chat", "interactive").state == "half-open"
+    assert asyncio.run(call_policy.call("chat", "interactive", attempt)) == "ok"
+    assert call_policy.breaker("chat", "interactive").state == "closed"
+
+
+def test_background_failures_do_not_open_interactive_breaker():
+    call_policy = policy(breaker_failure_threshold=3)
+    attempt, _ = flaky(3)
+    with pytest.raises(openai.APIConnectionError):
+        asyncio.run(call_policy.call("chat", "background", attempt))
+    assert call_policy.breaker("chat", "background").state == "open"
+
+    attempt, calls = flaky(0)
+    assert asyncio.run(call_policy.call("chat", "interactive", attempt)) == "ok"
+    assert call_policy.breaker("chat", "interactive").state == "closed"
+
+
+def test_deadline_covers_all_attempts():
+    async def attempt():
+        await asyncio.sleep(1.0)
+
+    call_policy = CallPolicy({"policies": {"interactive": {**FAST, "deadline": 0.05}}})
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(call_policy.call("chat", "interactive", attempt))
+    assert call_policy.breaker("chat", "interactive").failures == 1
@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+
+from dialog_storage import JsonlStorage, create_storage, migrate_legacy_json_logs
+
+
+def dialog(dialog_id: str, minute: int) -> dict:
+    return {
+        "dialog_id": dialog_id,
+        "timestamp_iso": f"2024-05-01T10:{minute:02d}:00",
+        "scenario": "cafe",
+        "difficulty": "easy",
+        "message_count": 2,
+        "duration_minutes": 1.5,
+        "messages": [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"}],
+    }
+
+
+def fill(storage):
+    storage.append("errors", {"type": "grammar", "dialog_id": "d1", "text": "He go"})
+    storage.append("errors", {"type": "vocabulary", "dialog_id": "d1", "text": "make a photo"})
+    storage.append("coins", {"amount": 5, "earned": 5})
+    storage.save_dialog(dialog("d1", 1))
+    storage.save_error_profile({"grammar:he go": {"count": 2, "mastered": False}})
+
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_round_trip(tmp_path, backend):
+    storage = create_storage(str(tmp_path), backend=backend)
+    fill(storage)
+
+    assert storage.count("errors") == 2
+    assert [e["text"] for e in storage.iter_entries("errors", type="grammar")] == ["He go"]
+    assert storage.tail("coins", 1) == [{"amount": 5, "earned": 5}]
+    assert storage.recent_dialogs(3)[0]["messages"][1]["content"] == "Hello!"
+    assert storage.dialog_stats()["scenarios_used"] == {"cafe": 1}
+    assert storage.load_error_profile() == {"grammar:he go": {"count": 2, "mastered": False}}
+
+
+def test_new_sqlite_database_copies_jsonl_data_once(tmp_path):
+    logs_dir = str(tmp_path)
+    fill(JsonlStorage(logs_dir))
+
+    storage = create_storage(logs_dir, backend="sqlite")
+    assert storage.count("errors") == 2
+    assert storage.tail("coins", 1) == [{"amount": 5, "earned": 5}]
+    assert [d["dialog_id"] for d in storage.recent_dialogs(3)] == ["d1"]
+    assert storage.load_error_profile()["grammar:he go"]["count"] == 2
+
+    # База уже есть: повторного переноса нет
+    storage._conn.close()
+    assert create_storage(logs_dir, backend="sqlite").count("errors") == 2
+
+
+def test_new_sqlite_database_without_jsonl_data_is_empty(tmp_path):
+    storage = create_storage(str(tmp_path), backend="sqlite")
+    assert storage.count("errors") == 0
+    assert storage.load_error_profile() == {}
+
+
+def test_legacy_json_logs_are_migrated_once(tmp_path):
+    logs_dir = str(tmp_path)
+    with open(os.path.join(logs_dir, "errors.json"), "w", encoding="utf-8") as f:
+        json.dump([{"type": "grammar", "text": "She don't"}], f)
+    with open(os.path.join(logs_dir, "user_coins.json"), "w", encoding="utf-8") as f:
+        json.dump({"coins": 12, "total_earned": 20, "last_updated": "2024-05-01T10:00:00"}, f)
+    storage = JsonlStorage(logs_dir)
+
+    assert migrate_legacy_json_logs(logs_dir, storage) == {"errors": 1, "coins": 1}
+    assert migrate_legacy_json_logs(logs_dir, storage) == {}
+    assert storage.tail("errors", 5) == [{"type": "grammar", "text": "She don't"}]
+    assert storage.tail("coins", 1)[0]["amount"] == 12
+    assert os.path.exists(os.path.join(logs_dir, "errors.json.migrated"))
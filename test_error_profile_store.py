@@ -0,0 +1,47 @@
+from dialog_storage import JsonlStorage
+from error_profile_store import ErrorProfileStore, make_error_key
+
+
+class RecordingStorage(JsonlStorage):
+    def __init__(self, logs_dir):
+        super().__init__(logs_dir)
+        self.saved = []
+
+    def save_error_profile_entries(self, changed, error_profile):
+        self.saved.append(sorted(changed))
+        super().save_error_profile_entries(changed, error_profile)
+
+
+def test_commit_saves_only_dirty_entries(tmp_path):
+    storage = RecordingStorage(str(tmp_path))
+    store = ErrorProfileStore(storage)
+    grammar = make_error_key("grammar", "He go")
+    vocabulary = make_error_key("vocabulary", "make a photo")
+    store.put(grammar, {"error_type": "grammar", "count": 1})
+    store.put(vocabulary, {"error_type": "vocabulary", "count": 1})
+    assert store.commit() and storage.saved == [sorted([grammar, vocabulary])]
+
+    assert store.commit() == []  # Нечего сохранять - хранилище не трогаем
+    store.update(grammar, count=2)
+    assert store.commit() == [grammar]
+    assert storage.saved[-1] == [grammar]
+    assert len(storage.saved) == 2
+
+    reloaded = ErrorProfileStore(JsonlStorage(str(tmp_path)))
+    assert reloaded.get(grammar)["count"] == 2
+    assert reloaded.keys_by_type("vocabulary") == {vocabulary}
+
+
+def test_indexes_follow_updates_and_history_is_bounded(tmp_path):
+    store = ErrorProfileStore(JsonlStorage(str(tmp_path)), history_limit=3)
+    store.put("k", {"error_type": "grammar"})
+    store.update("k", error_type="spelling")
+    assert store.keys_by_type("grammar") == set()
+    assert store.keys_by_type("spelling") == {"k"}
+
+    for i in range(5):
+        store.append_history("k", {"n": i})
+    assert [entry["n"] for entry in store.get("k")["history"]] == [2, 3, 4]
+
+    store.link_exercise("ex1", "k")
+    assert ErrorProfileStore(JsonlStorage(str(tmp_path))).error_key_for_exercise("ex1") == "k"
@@ -0,0 +1,47 @@
+import asyncio
+import json
+import os
+
+from dialog_manager import DialogManager
+from exercise_generator import ErrorAnalysisAndPracticeSystem
+
+
+def exercise(number: int) -> dict:
+    return {
+        "exercise_id": f"word_replacement_{number}",
+        "exercise_type": "word_replacement",
+        "original_error": "She go to school",
+        "correct_form": "She goes to school",
+        "content": "ЗАДАНИЕ: Исправьте ошибку.\nShe go to school\nПРАВИЛЬНЫЙ ОТВЕТ: She goes to school",
+        "completed": False,
+        "attempts": 0,
+    }
+
+
+def test_complete_exercises_saves_session_once_per_batch(tmp_path, monkeypatch):
+    dialog_manager = DialogManager(client=object(), logs_dir=str(tmp_path))
+    practice = ErrorAnalysisAndPracticeSystem(dialog_manager)
+    session = {"session_id": "s1", "exercises": [exercise(i) for i in range(3)]}
+    practice.save_practice_session(session)
+
+    writes = []
+    real_dump = json.dump
+    monkeypatch.setattr(json, "dump", lambda data, f, **kwargs: (writes.append(f.name), real_dump(data, f, **kwargs)))
+
+    # Ответы решаются локально (answer_grader), модель не нужна
+    answers = [(session["exercises"][0], "She goes to school"),
+               (session["exercises"][1], "She go to school"),
+               (session["exercises"][2], "she GOES to school!")]
+    results = asyncio.run(practice.complete_exercises("s1", answers))
+
+    session_file = os.path.join(str(tmp_path), "practice_sessions", "s1.json")
+    assert writes.count(session_file) == 1
+    assert [result["is_correct"] for result in results] == [True, False, True]
+    assert [result["coins_earned"] for result in results] == [1, 0, 1]
+    assert dialog_manager.get_coins_data()["coins"] == 2
+
+    with open(session_file, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert [(e["completed"], e["is_correct"], e["attempts"]) for e in saved["exercises"]] == [
+        (True, True, 1), (True, False, 1), (True, True, 1),
+    ]
@@ -0,0 +1,47 @@
+import asyncio
+
+from model_scheduler import ModelScheduler
+
+
+def test_promoted_task_overtakes_lower_priority_requests():
+    async def scenario(promote: bool):
+        scheduler = ModelScheduler({"max_in_flight": 1})
+        order = []
+        release = asyncio.Event()
+
+        async def request(name, priority):
+            async with scheduler.slot(priority) as reservation:
+                order.append((name, reservation.priority))
+                if name == "chat":
+                    await release.wait()
+
+        chat = asyncio.create_task(request("chat", "interactive"))
+        await asyncio.sleep(0)
+        prefetch = asyncio.create_task(request("prefetch", "background"))
+        voice = asyncio.create_task(request("voice", "voice"))
+        await asyncio.sleep(0)
+        if promote:
+            scheduler.promote(prefetch, "help") # Пользователь открыл помощь
+        release.set()
+        await asyncio.gather(chat, prefetch, voice)
+        return order[1:]
+
+    assert asyncio.run(scenario(False)) == [("voice", "voice"), ("prefetch", "background")]
+    assert asyncio.run(scenario(True)) == [("prefetch", "help"), ("voice", "voice")]
+
+
+def test_promotion_applies_to_later_requests_of_the_task():
+    async def scenario():
+        scheduler = ModelScheduler()
+
+        async def prefetch():
+            await asyncio.sleep(0.01)
+            async with scheduler.slot("background") as reservation: # Например, повтор после сбоя
+                return reservation.priority
+
+        task = asyncio.create_task(prefetch())
+        await asyncio.sleep(0)
+        scheduler.promote(task, "help")
+        return await task
+
+    assert asyncio.run(scenario()) == "help"
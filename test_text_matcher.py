@@ -0,0 +1,34 @@
+import random
+import re
+
+from text_matcher import KeywordMatch, KeywordMatcher
+
+
+def test_finds_overlapping_keywords_with_positions():
+    matcher = KeywordMatcher(["he", "she", "his", "hers"])
+    assert matcher.find_all("ushers") == [
+        KeywordMatch("she", 1, 4), KeywordMatch("he", 2, 4), KeywordMatch("hers", 2, 6),
+    ]
+    assert matcher.find_keywords("ushers") == ["he", "she", "hers"]
+    assert matcher.first_match("ushers") == KeywordMatch("she", 1, 4)
+    assert not matcher.contains_any("xyz")
+
+
+def test_word_boundary_and_normalization():
+    matcher = KeywordMatcher(["order", "идиот"], word_boundary=True, normalize=True)
+    assert matcher.find_keywords("Border control") == []
+    assert matcher.find_keywords("I'd like to ORDER, please") == ["order"]
+    assert matcher.find_keywords("ты ИД1ОТ!") == ["идиот"]
+
+
+def test_matches_naive_search():
+    rng = random.Random(0)
+    words = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(30)]
+    matcher = KeywordMatcher(words)
+    for _ in range(50):
+        text = "".join(rng.choice("abc ") for _ in range(40))
+        expected = sorted(
+            (m.start(), m.start() + len(word), word)
+            for word in set(words) for m in re.finditer(f"(?={re.escape(word)})", text)
+        )
+        assert sorted((m.start, m.end, m.keyword) for m in matcher.find_all(text)) == expected
@@ -0,0 +1,50 @@
+import os
+
+from tts_cache import TtsCache
+
+
+def test_memory_lru_evicts_least_recently_used(tmp_path):
+    cache = TtsCache(str(tmp_path), memory_limit_bytes=10, disk_limit_bytes=100)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"  # "a" becomes the most recent
+    cache.put("c", b"cccc")
+
+    stats = cache.stats()
+    assert stats["memory_entries"] == 2 and stats["memory_bytes"] == 8
+    assert list(cache._memory) == ["a", "c"]
+    assert cache.get("b") == b"bbbb"  # Evicted from memory, still on disk
+    assert cache.stats()["hits"] == 2
+
+
+def test_disk_lru_is_bounded_and_survives_restart(tmp_path):
+    cache = TtsCache(str(tmp_path), memory_limit_bytes=0, disk_limit_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    cache.get("a")
+    cache.put("c", b"cccc")
+
+    assert sorted(os.listdir(tmp_path)) == ["a.audio", "c.audio"]
+    assert cache.stats()["disk_bytes"] == 8
+
+    restarted = TtsCache(str(tmp_path), memory_limit_bytes=0, disk_limit_bytes=10)
+    assert restarted.get("c") == b"cccc"
+    assert restarted.get("b") is None
+    assert restarted.stats() == {"hits": 1, "misses": 1, "memory_entries": 0, "memory_bytes": 0,
+                                 "disk_entries": 2, "disk_bytes": 8}
+
+
+def test_key_depends_on_voice_settings():
+    key = TtsCache.make_key("Hello!", "alloy", "tts-1", 1.0, "mp3")
+    assert key == TtsCache.make_key(" Hello! ", "alloy", "tts-1", 1.0, "mp3")
+    assert key != TtsCache.make_key("Hello!", "nova", "tts-1", 1.0, "mp3")
+
+
+def test_memory_tier_lookup_does_not_touch_disk(tmp_path):
+    cache = TtsCache(str(tmp_path), memory_limit_bytes=4, disk_limit_bytes=100)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get_memory("b") == b"bbbb"
+    assert cache.get_memory("a") is None  # Only on disk
+    assert cache.stats()["misses"] == 0
+    assert cache.get("a") == b"aaaa"
@@ -0,0 +1,35 @@
+from tts_pipeline import SentenceSplitter, split_sentences
+
+
+def split(deltas, min_chars=10):
+    splitter = SentenceSplitter(min_chars=min_chars)
+    sentences = []
+    for delta in deltas:
+        sentences.extend(splitter.feed(delta))
+    return sentences, splitter.flush()
+
+
+def test_sentences_are_emitted_as_soon_as_complete():
+    splitter = SentenceSplitter(min_chars=10)
+    assert splitter.feed("Good evening, welcome to our") == []
+    assert splitter.feed(" restaurant. Do you have a") == ["Good evening, welcome to our restaurant."]
+    assert splitter.feed(" reservation? ") == ["Do you have a reservation?"]
+    assert splitter.flush() is None
+
+
+def test_short_sentences_and_abbreviations_are_merged():
+    sentences, rest = split(["Sure! ", "Mr. Smith will be with you shortly. ", "Thanks"])
+    assert sentences == ["Sure! Mr. Smith will be with you shortly."]
+    assert rest == "Thanks"
+
+
+def test_closing_quotes_stay_with_the_sentence():
+    sentences, rest = split(['He said "see you tomorrow." ', "Then he left."])
+    assert sentences == ['He said "see you tomorrow."']
+    assert rest == "Then he left."
+
+
+def test_split_sentences_matches_streamed_split():
+    text = "Sure! Mr. Smith will be with you shortly. Please take a seat by the window."
+    streamed, rest = split(list(text))
+    assert split_sentences(text, min_chars=10) == streamed + [rest]
@@ -0,0 +1,51 @@
+import numpy as np
+
+from voice_activity import VoiceActivityDetector
+
+RATE = 16000
+CHUNK_BYTES = RATE // 10 * 2  # 100 ms
+
+
+def feed(vad: VoiceActivityDetector, pcm: bytes):
+    """Index of the chunk that triggered the endpoint, or None"""
+    for i, offset in enumerate(range(0, len(pcm), CHUNK_BYTES)):
+        if vad.process(pcm[offset:offset + CHUNK_BYTES]):
+            return i
+    return None
+
+
+def noise(seconds: float, rng) -> np.ndarray:
+    return rng.normal(0, 30, int(RATE * seconds))
+
+
+def test_endpoint_after_speech_and_silence():
+    rng = np.random.default_rng(0)
+    t = np.arange(RATE) / RATE
+    tone = np.sin(2 * np.pi * 220 * t) * 6000 + noise(1.0, rng)
+    pcm = np.concatenate([noise(0.5, rng), tone, noise(2.0, rng)]).astype(np.int16).tobytes()
+
+    vad = VoiceActivityDetector(RATE)
+    endpoint_chunk = feed(vad, pcm)
+    # Speech ends at 1.5 s, the endpoint follows after silence_duration (1 s)
+    assert endpoint_chunk is not None and 24 <= endpoint_chunk <= 27
+
+    start, end = vad.speech_range(len(pcm))
+    assert 0.15 * RATE * 2 <= start <= 0.5 * RATE * 2     # Pre-roll before the onset
+    assert 1.5 * RATE * 2 <= end <= 1.8 * RATE * 2        # End of speech plus hangover
+
+
+def test_no_speech_timeout():
+    rng = np.random.default_rng(1)
+    vad = VoiceActivityDetector(RATE)
+    endpoint_chunk = feed(vad, noise(6.0, rng).astype(np.int16).tobytes())
+    assert endpoint_chunk == 49  # no_speech_timeout = 5 s
+    assert vad.speech_range(RATE * 12) is None
+
+
+def test_partial_frames_are_carried_over():
+    rng = np.random.default_rng(2)
+    pcm = noise(1.0, rng).astype(np.int16).tobytes()
+    vad = VoiceActivityDetector(RATE)
+    for offset in range(0, len(pcm), 333):
+        vad.process(pcm[offset:offset + 333])
+    assert vad._frames_seen == len(pcm) // vad.frame_bytes
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyaudio")
+
+from voice_handler import VoiceHandler
+
+
+class FakeStream:
+    """Input stream that plays back prepared chunks, then silence"""
+
+    def __init__(self, chunks, chunk_bytes, delay: float = 0.0):
+        self.chunks = list(chunks)
+        self.chunk_bytes = chunk_bytes
+        self.delay = delay
+        self.closed = False
+
+    def read(self, frames, exception_on_overflow=True):
+        time.sleep(self.delay)
+        return self.chunks.pop(0) if self.chunks else bytes(self.chunk_bytes)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def utterance(rate: int) -> bytes:
+    """0.5 s of quiet noise, 1 s of a loud tone, then silence long enough for the endpoint"""
+    rng = np.random.default_rng(0)
+    t = np.arange(rate) / rate
+    quiet = rng.normal(0, 30, rate // 2)
+    tone = np.sin(2 * np.pi * 220 * t) * 6000 + rng.normal(0, 30, rate)
+    return np.concatenate([quiet, tone]).astype(np.int16).tobytes()
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # TTS cache directory
+    handler = VoiceHandler(client=object())
+    yield handler
+    handler.is_recording = False
+
+
+def record(handler: VoiceHandler, pcm: bytes, delay: float = 0.0) -> FakeStream:
+    chunk_bytes = handler.chunk_size * handler.channels * handler.sample_width
+    stream = FakeStream([pcm[i:i + chunk_bytes] for i in range(0, len(pcm), chunk_bytes)], chunk_bytes, delay)
+    handler.audio.open = lambda **kwargs: stream
+    return stream
+
+
+def test_automatic_endpoint_stops_recording_and_notifies(handler):
+    stream = record(handler, utterance(handler.sample_rate))
+    stopped = threading.Event()
+    stop_threads = []
+    pauses = []
+
+    def on_stop():
+        stop_threads.append(threading.current_thread())
+        stopped.set()
+
+    handler.on_recording_stop = on_stop
+    handler.on_speech_pause = lambda start, end: pauses.append((start, end))
+    handler.start_recording()
+
+    assert stopped.wait(5.0), "on_recording_stop was not called on the VAD endpoint"
+    handler.recording_thread.join(2.0)
+    assert not handler.recording_thread.is_alive()
+    assert not handler.is_recording
+    assert stream.closed
+    assert stop_threads == [handler.recording_thread]
+
+    speech_range = handler.vad.speech_range(len(handler.audio_buffer))
+    assert speech_range is not None
+    assert pauses and pauses[-1] == speech_range # Speculative STT range matches the final one
+
+
+def test_button_stop_notifies_once(handler):
+    record(handler, b"", delay=0.01) # Silence, read slowly: the no-speech timeout is 5 s of audio away
+    stops = []
+    handler.on_recording_stop = lambda: stops.append(1)
+    handler.start_recording()
+
+    handler.stop_recording()
+    handler.stop_recording()
+
+    assert not handler.recording_thread.is_alive()
+    assert stops == [1]
+
+
+class FakeTtsClient:
+    def __init__(self):
+        self.inputs = []
+
+    async def speech(self, **kwargs):
+        self.inputs.append(kwargs["input"])
+        return b"\x00\x01" * 10
+
+
+class FakeSink:
+    def __init__(self):
+        self.written = []
+
+    def write(self, pcm):
+        self.written.append(pcm)
+
+    def flush(self):
+        pass
+
+    def wait_idle(self):
+        pass
+
+
+def test_prewarmed_template_is_played_from_cache(tmp_path, monkeypatch):
+    from templates import templates
+    from tts_pipeline import StreamingSpeaker
+
+    monkeypatch.chdir(tmp_path)
+    client = FakeTtsClient()
+    handler = VoiceHandler(client=client)
+    line = templates[1]["aggression_response"]
+
+    async def scenario():
+        await handler.prewarm_tts_cache([line])
+        prewarmed = list(client.inputs)
+        sink = FakeSink()
+        speaker = StreamingSpeaker(handler.synthesize_pcm, sink)
+        for word in line.split(" "): # Like the model stream: piece by piece
+            speaker.feed(word + " ")
+        await speaker.finish()
+        return prewarmed, sink
+
+    prewarmed, sink = asyncio.run(scenario())
+    assert len(prewarmed) == 2                   # The line is cached per sentence
+    assert client.inputs == prewarmed            # Playback makes no new requests
+    assert len(sink.written) == 2
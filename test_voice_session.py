@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pyaudio")
+
+from voice_handler import VoiceHandler
+from voice_session import VoiceSession
+from test_voice_handler import record, utterance
+
+
+class FakeSttClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def transcribe(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return " I would like a coffee. "
+
+
+def test_automatic_endpoint_runs_turn_with_speculative_stt(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = FakeSttClient()
+    handler = VoiceHandler(client=client)
+    record(handler, utterance(handler.sample_rate), delay=0.002)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        replies = []
+        done = asyncio.Event()
+
+        async def respond(transcription, timings):
+            replies.append((transcription, timings))
+            done.set()
+
+        def run_task(fn, *args): # Like page.run_task: callable from the recording thread
+            return asyncio.run_coroutine_threadsafe(fn(*args), loop)
+
+        session = VoiceSession(handler, respond, run_task, speculative_stt=True)
+        handler.on_recording_stop = session.endpoint # As ChatScreen.on_voice_recording_stop does
+        handler.start_recording()
+        await asyncio.wait_for(done.wait(), 5.0)
+        return session, replies
+
+    session, replies = asyncio.run(scenario())
+    handler.is_recording = False
+
+    assert len(replies) == 1
+    transcription, timings = replies[0]
+    assert transcription == "I would like a coffee."
+    assert timings.speculative_stt          # The STT started on the pause was reused
+    assert client.calls == 1                # ... and not repeated after the endpoint
+    assert "transcript" in timings.marks
+    assert not handler.is_recording
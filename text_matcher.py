@@ -0,0 +1,165 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Нормализация для режима normalize=True: один символ -> один символ, чтобы позиции совпадений
+# в нормализованном тексте совпадали с позициями в исходном.
+# ё -> е, leetspeak-цифры и символы -> буквы, кириллические двойники латинских букв (и "и" для "1") -> латиница
+# (применяется и к ключевым словам, и к тексту, поэтому "дур@к" и "дурак" совпадают)
+NORMALIZATION_TABLE = str.maketrans({
+    "ё": "е",
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t",
+    "@": "a", "$": "s",
+    "а": "a", "е": "e", "о": "o", "р": "p", "с": "c", "у": "y", "х": "x", "к": "k", "м": "m", "т": "t", "и": "i",
+})
+
+
+class KeywordMatch(NamedTuple):
+    keyword: str # Ключевое слово в исходном виде (как в словаре)
+    start: int   # Позиция начала совпадения в тексте
+    end: int     # Позиция сразу после совпадения
+
+
+def normalize_text(text: str, normalize: bool = True) -> str:
+    """Нижний регистр (+ нормализация) с сохранением длины строки"""
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # Редкие символы, у которых lower() меняет длину (например, "İ"), берем по первому символу
+        lowered = "".join(char.lower()[0] for char in text)
+    return lowered.translate(NORMALIZATION_TABLE) if normalize else lowered
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class KeywordMatcher:
+    """
+    Поиск многих ключевых слов за один проход по тексту (автомат Ахо-Корасик).
+    Автомат строится один раз, поиск линеен по длине текста и не зависит от размера словаря.
+
+    word_boundary=True - совпадение только целыми словами ("order" не найдется в "border");
+    normalize=True - регистр, ё/е и leetspeak не важны ("ИД1ОТ" найдется по "идиот").
+    """
+
+    def __init__(self, keywords: Iterable[str], word_boundary: bool = False, normalize: bool = False):
+        self.word_boundary = word_boundary
+        self.normalize = normalize
+        self.keywords: List[str] = []
+        # Узлы автомата: переходы, ссылка на суффикс, номера слов, заканчивающихся в узле
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        self._lengths: List[int] = []
+
+        seen = set()
+        for keyword in keywords:
+            pattern = normalize_text(keyword, normalize)
+            if not pattern or pattern in seen:
+                continue
+            seen.add(pattern)
+            self._add(pattern, len(self.keywords))
+            self.keywords.append(keyword)
+            self._lengths.append(len(pattern))
+        self._build_fail_links()
+
+    def _add(self, pattern: str, index: int):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(index)
+
+    def _build_fail_links(self):
+        queue = list(self._goto[0].values())
+        for node in queue: # queue растет по ходу обхода (BFS)
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[child] = candidate if candidate != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def _scan(self, text: str) -> Iterable[Tuple[int, int, int]]:
+        """(номер слова, начало, конец) для всех совпадений по порядку концов"""
+        if not text or not self.keywords:
+            return
+        prepared = normalize_text(text, self.normalize)
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for position, char in enumerate(prepared):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if not output[node]:
+                continue
+            end = position + 1
+            for index in output[node]:
+                start = end - self._lengths[index]
+                if self.word_boundary and (
+                    (start > 0 and _is_word_char(prepared[start - 1])) or
+                    (end < len(prepared) and _is_word_char(prepared[end]))
+                ):
+                    continue
+                yield index, start, end
+
+    def find_all(self, text: str) -> List[KeywordMatch]:
+        """Все совпадения с позициями (в том числе пересекающиеся)"""
+        return [KeywordMatch(self.keywords[index], start, end) for index, start, end in self._scan(text)]
+
+    def find_keywords(self, text: str) -> List[str]:
+        """Найденные ключевые слова без повторов, в порядке словаря"""
+        found = {index for index, _, _ in self._scan(text)}
+        return [self.keywords[index] for index in sorted(found)]
+
+    def contains_any(self, text: str) -> bool:
+        """Есть ли в тексте хотя бы одно ключевое слово (останавливается на первом совпадении)"""
+        for _ in self._scan(text):
+            return True
+        return False
+
+    def first_match(self, text: str) -> Optional[KeywordMatch]:
+        for index, start, end in self._scan(text):
+            return KeywordMatch(self.keywords[index], start, end)
+        return None
+
+
+# Микро-бенчмарк: время поиска растет с длиной сообщения, но не с размером словаря
+if __name__ == '__main__':
+    import random
+    import string
+    import timeit
+
+    random.seed(42)
+
+    def random_word(min_len=4, max_len=9):
+        return "".join(random.choice(string.ascii_lowercase) for _ in range(random.randint(min_len, max_len)))
+
+    def naive_find(keywords, text):
+        text_lower = text.lower()
+        return [keyword for keyword in keywords if keyword in text_lower]
+
+    print(f"{'слов':>6} {'символов':>9} {'цикл in, мкс':>14} {'автомат, мкс':>14} {'автомат, нс/символ':>19}")
+    for dictionary_size in (10, 100, 1000, 5000):
+        keywords = [random_word() for _ in range(dictionary_size)]
+        matcher = KeywordMatcher(keywords, normalize=True)
+        for message_length in (100, 1000, 10000):
+            words = []
+            while sum(len(w) + 1 for w in words) < message_length:
+                words.append(random.choice(keywords) if random.random() < 0.05 else random_word(2, 8))
+            message = " ".join(words)[:message_length]
+
+            runs = 20
+            naive_us = timeit.timeit(lambda: naive_find(keywords, message), number=runs) / runs * 1e6
+            matcher_us = timeit.timeit(lambda: matcher.find_all(message), number=runs) / runs * 1e6
+            print(f"{dictionary_size:>6} {message_length:>9} {naive_us:>14.1f} {matcher_us:>14.1f} {matcher_us * 1000 / message_length:>19.1f}")
+
+    matcher = KeywordMatcher(["идиот", "дурак", "check in"], word_boundary=True, normalize=True)
+    for phrase in ["Ты ИД1ОТ!", "Ну ты дур@к", "I want to check in", "checking inside"]:
+        print(f"'{phrase}' -> {matcher.find_all(phrase)}")
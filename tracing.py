@@ -0,0 +1,264 @@
+import asyncio
+import atexit
+import functools
+import json
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# Трассировка ходов диалога: где ход тратит время (фильтры, промпт, модель, UI, TTS, STT, сохранение)
+TRACING_SETTINGS = {
+    "enabled": False,          # Выключено - span() возвращает общий пустой span, накладных расходов почти нет
+    "sample_rate": 1.0,        # Доля записываемых трасс (решение принимается один раз на ход)
+    "buffer_size": 5000,       # Кольцевой буфер последних завершенных span'ов
+    "export_path": None,       # Файл для выгрузки; None - только буфер в памяти
+    "export_format": "jsonl",  # "jsonl" - span на строку, "otlp" - OTLP/JSON (строка на пачку), как у файлового экспортера OpenTelemetry
+    "export_batch_size": 200,  # Пачка пишется по завершении трассы или при накоплении стольких span'ов
+    "service_name": "spikly-ai",
+}
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """Интервал работы внутри трассы. Используется как контекстный менеджер; вложенные span'ы (и задачи,
+    созданные внутри) наследуют его через contextvars."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start_ns", "end_ns",
+                 "status", "error", "_token")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.status = "ok"
+        self.error: Optional[str] = None
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        if exc_type is asyncio.CancelledError:
+            self.status = "cancelled"
+        elif exc_type is not None:
+            self.status = "error"
+            self.error = f"{exc_type.__name__}: {exc}"
+        tracer.finish(self)
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Span выключенной или не попавшей в выборку трассы"""
+
+    __slots__ = ()
+    trace_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Span], service_name: str) -> Dict[str, Any]:
+    """Пачка span'ов в формате OTLP/JSON (ExportTraceServiceRequest)"""
+    status_codes = {"ok": 1, "error": 2, "cancelled": 0}
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+        "scopeSpans": [{
+            "scope": {"name": "spikly.tracing"},
+            "spans": [{
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                "status": {"code": status_codes[s.status], **({"message": s.error} if s.error else {})},
+            } for s in spans],
+        }],
+    }]}
+
+
+class FileSpanExporter:
+    """Дописывает span'ы в файл: JSONL (span на строку) или OTLP/JSON (пачка на строку)"""
+
+    def __init__(self, path: str, export_format: str = "jsonl", service_name: str = "spikly-ai"):
+        if export_format not in ("jsonl", "otlp"):
+            raise ValueError(f"Unknown export format: {export_format}")
+        self.path = path
+        self.export_format = export_format
+        self.service_name = service_name
+
+    def export(self, spans: List[Span]):
+        if self.export_format == "otlp":
+            lines = [json.dumps(to_otlp(spans, self.service_name), ensure_ascii=False, default=str)]
+        else:
+            lines = [json.dumps(s.to_dict(), ensure_ascii=False, default=str) for s in spans]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+class Tracer:
+    """
+    Решение о выборке, кольцевой буфер и выгрузка. Трасса начинается в start_trace() (ход диалога,
+    запрос помощи); span() без активной трассы ничего не записывает.
+    """
+
+    def __init__(self, settings: Dict = None):
+        self._lock = threading.Lock()
+        self._pending: List[Span] = []
+        self.configure(**{**TRACING_SETTINGS, **(settings or {})})
+        atexit.register(self.flush)
+
+    def configure(self, **settings):
+        """Меняет настройки на лету (например, включить трассировку в бенчмарке)"""
+        self.flush()
+        self.settings = {**getattr(self, "settings", TRACING_SETTINGS), **settings}
+        self.enabled = self.settings["enabled"]
+        self.sample_rate = self.settings["sample_rate"]
+        self.spans: deque = deque(maxlen=self.settings["buffer_size"])
+        self.exporter = FileSpanExporter(
+            self.settings["export_path"], self.settings["export_format"], self.settings["service_name"]
+        ) if self.settings["export_path"] else None
+
+    def start_trace(self, name: str, **attributes):
+        parent = _current_span.get()
+        if parent is not None: # Ход внутри голосового хода и т.п. - это часть той же трассы
+            return Span(name, parent.trace_id, parent.span_id, attributes)
+        if not self.enabled or random.random() >= self.sample_rate:
+            return NOOP_SPAN
+        return Span(name, f"{random.getrandbits(128):032x}", None, attributes)
+
+    def finish(self, span: Span):
+        self.spans.append(span)
+        if self.exporter is None:
+            return
+        with self._lock:
+            self._pending.append(span)
+            if span.parent_id is not None and len(self._pending) < self.settings["export_batch_size"]:
+                return
+            batch, self._pending = self._pending, []
+        self._export(batch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            print(f"⚠️ Не удалось выгрузить трассы: {e}")
+
+    def recent_spans(self, trace_id: str = None) -> List[Span]:
+        spans = list(self.spans)
+        return [s for s in spans if s.trace_id == trace_id] if trace_id else spans
+
+    def stage_summary(self, percentiles=(50, 95)) -> Dict[str, Dict[str, float]]:
+        """Длительность span'ов из буфера по именам: count и перцентили в мс - какой этап стал медленнее"""
+        durations: Dict[str, List[float]] = {}
+        for s in list(self.spans):
+            if s.status != "cancelled":
+                durations.setdefault(s.name, []).append(s.duration_ms)
+        summary = {}
+        for name, values in sorted(durations.items()):
+            values.sort()
+            summary[name] = {"count": len(values)}
+            for p in percentiles:
+                summary[name][f"p{p}_ms"] = values[min(len(values) - 1, int(len(values) * p / 100))]
+        return summary
+
+
+tracer = Tracer()
+
+
+def start_trace(name: str, **attributes):
+    """Корневой span трассы (или дочерний, если трасса уже идет)"""
+    return tracer.start_trace(name, **attributes)
+
+
+def span(name: str, **attributes):
+    """Дочерний span текущей трассы; без трассы - пустой span"""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace_id if current is not None else None
+
+
+def traced(name: str = None, new_trace: bool = False):
+    """Декоратор: вызов функции (обычной или async) - span; new_trace=True начинает трассу, если ее нет"""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+        open_span = start_trace if new_trace else span
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with open_span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with open_span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
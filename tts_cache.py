@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from metrics import registry
+
+TTS_CACHE_LOOKUPS = registry.counter("tts_cache_lookups_total", "TTS cache lookups by result: memory, disk or miss")
+
+
+class TtsCache:
+    """
+    Content-addressed cache for synthesized speech: memory LRU in front of a disk LRU.
+    Keyed by (text, voice, model, speed, format), so any TTS_SETTINGS change misses
+    instead of playing stale audio. Both levels are bounded in bytes.
+    """
+
+    def __init__(self, cache_dir: str, memory_limit_bytes: int, disk_limit_bytes: int):
+        self.cache_dir = cache_dir
+        self.memory_limit_bytes = memory_limit_bytes
+        self.disk_limit_bytes = disk_limit_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Disk index: key -> (size, last use), oldest first
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".audio"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-len(".audio")], stat.st_size))
+        entries.sort()
+        self._disk: "OrderedDict[str, int]" = OrderedDict((key, size) for _, key, size in entries)
+        self._disk_bytes = sum(self._disk.values())
+
+    @staticmethod
+    def make_key(text: str, voice: str, model: str, speed: float, response_format: str) -> str:
+        payload = json.dumps([text.strip(), voice, model, speed, response_format], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.audio")
+
+    def get_memory(self, key: str) -> Optional[bytes]:
+        """Memory tier only: no file I/O, safe to call on the event loop. A miss here isn't counted"""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is None:
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+        TTS_CACHE_LOOKUPS.inc(result="memory")
+        return audio
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Memory, then disk (blocking file read - use asyncio.to_thread from the event loop)"""
+        audio = self.get_memory(key)
+        if audio is not None:
+            return audio
+        with self._lock:
+            on_disk = key in self._disk
+        if not on_disk:
+            with self._lock:
+                self.misses += 1
+            TTS_CACHE_LOOKUPS.inc(result="miss")
+            return None
+
+        try:
+            with open(self._path(key), "rb") as f:
+                audio = f.read()
+            os.utime(self._path(key)) # mtime = last use, for LRU order after restart
+        except OSError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(key, 0)
+                self.misses += 1
+            TTS_CACHE_LOOKUPS.inc(result="miss")
+            return None
+        with self._lock:
+            self._disk.move_to_end(key)
+            self._remember(key, audio)
+            self.hits += 1
+        TTS_CACHE_LOOKUPS.inc(result="disk")
+        return audio
+
+    def put(self, key: str, audio: bytes):
+        if not audio:
+            return
+        with self._lock:
+            self._remember(key, audio)
+            known_size = self._disk.get(key)
+        if known_size is not None:
+            return
+        if len(audio) > self.disk_limit_bytes:
+            return
+
+        tmp_path = self._path(key) + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Error writing TTS cache: {e}")
+            return
+        with self._lock:
+            self._disk[key] = len(audio)
+            self._disk_bytes += len(audio)
+            evicted = self._evict_disk()
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def _remember(self, key: str, audio: bytes):
+        """Memory LRU insert (caller holds the lock)"""
+        if len(audio) > self.memory_limit_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.memory_limit_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+
+    def _evict_disk(self) -> list:
+        """Drops least recently used files over the limit (caller holds the lock)"""
+        evicted = []
+        while self._disk_bytes > self.disk_limit_bytes and self._disk:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(old_key)
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+def template_phrases(templates: Dict) -> Tuple[str, ...]:
+    """Fixed lines from templates.py the model is told to say (greetings, reactions)"""
+    phrases = []
+    for template in templates.values():
+        for field in ("initial_greeting", "aggression_response", "formality_reaction"):
+            phrase = template.get(field)
+            if phrase and phrase not in phrases:
+                phrases.append(phrase)
+    return tuple(phrases)
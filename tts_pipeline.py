@@ -0,0 +1,130 @@
+import asyncio
+import re
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from livekit_config import TTS_SETTINGS
+
+# End of sentence: terminal punctuation (and closing quotes/brackets) followed by whitespace
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+")
+# Abbreviations that end with a dot but don't end a sentence
+_ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "st.", "vs.", "etc.", "e.g.", "i.e.", "a.m.", "p.m."}
+
+
+class SentenceSplitter:
+    """
+    Cuts streamed text into sentences as soon as they are complete.
+    Sentences shorter than min_chars are merged with the next one, so TTS isn't
+    called for fragments like "Sure!".
+    """
+
+    def __init__(self, min_chars: int = None):
+        self.min_chars = min_chars if min_chars is not None else TTS_SETTINGS["min_sentence_chars"]
+        self._buffer = "" # Text after the last emitted sentence (usually less than one sentence)
+
+    def feed(self, delta: str) -> List[str]:
+        self._buffer += delta
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            end = match.end()
+            candidate = self._buffer[start:end].strip()
+            last_word = candidate.rsplit(None, 1)[-1].lower() if candidate else ""
+            if last_word in _ABBREVIATIONS or len(candidate) < self.min_chars:
+                continue
+            sentences.append(candidate)
+            start = end
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        """Whatever is left after the stream ended"""
+        rest = self._buffer.strip()
+        self._buffer = ""
+        return rest or None
+
+
+def split_sentences(text: str, min_chars: int = None) -> List[str]:
+    """Sentences of a complete text, cut exactly as StreamingSpeaker cuts a streamed reply"""
+    splitter = SentenceSplitter(min_chars)
+    sentences = splitter.feed(text)
+    rest = splitter.flush()
+    return sentences + [rest] if rest else sentences
+
+
+class StreamingSpeaker:
+    """
+    Speaks a reply while it is still being generated: each complete sentence is synthesized
+    (at most max_concurrency at a time) and played in order through a persistent sink.
+    Time to first audio becomes "first sentence + its synthesis" instead of
+    "whole reply + whole synthesis".
+    """
+
+    def __init__(self, synthesize: Callable[[str], Awaitable[Optional[bytes]]], sink,
+                 max_concurrency: int = None, min_sentence_chars: int = None):
+        self.synthesize = synthesize
+        self.sink = sink
+        self.splitter = SentenceSplitter(min_sentence_chars)
+        self.semaphore = asyncio.Semaphore(max_concurrency or TTS_SETTINGS["max_concurrent_synthesis"])
+        self._ordered: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._player = asyncio.get_running_loop().create_task(self._play_in_order())
+        self.started_at = time.perf_counter()
+        self.first_audio_at: Optional[float] = None
+        self.cancelled = False
+
+    @property
+    def time_to_first_audio(self) -> Optional[float]:
+        return self.first_audio_at - self.started_at if self.first_audio_at else None
+
+    def feed(self, delta: str):
+        """New text from the model"""
+        if self.cancelled:
+            return
+        for sentence in self.splitter.feed(delta):
+            self._schedule(sentence)
+
+    def _schedule(self, sentence: str):
+        task = asyncio.get_running_loop().create_task(self._synthesize(sentence))
+        self._tasks.append(task)
+        self._ordered.put_nowait(task)
+
+    async def _synthesize(self, sentence: str) -> Optional[bytes]:
+        async with self.semaphore:
+            return await self.synthesize(sentence)
+
+    async def _play_in_order(self):
+        while True:
+            task = await self._ordered.get()
+            if task is None:
+                break
+            try:
+                pcm = await task
+            except Exception as e:
+                print(f"Error synthesizing sentence: {e}")
+                continue
+            if pcm:
+                if self.first_audio_at is None:
+                    self.first_audio_at = time.perf_counter()
+                    print(f"First audio after {self.time_to_first_audio:.2f} s")
+                self.sink.write(pcm)
+
+    async def finish(self, wait_playback: bool = True):
+        """The reply is complete: speak the rest and (optionally) wait until playback ends"""
+        if self.cancelled:
+            return
+        rest = self.splitter.flush()
+        if rest:
+            self._schedule(rest)
+        self._ordered.put_nowait(None)
+        await self._player
+        if wait_playback:
+            await asyncio.to_thread(self.sink.wait_idle)
+
+    def cancel(self):
+        """Stops speaking: pending synthesis is cancelled and queued audio dropped"""
+        self.cancelled = True
+        for task in self._tasks:
+            task.cancel()
+        self._player.cancel()
+        self.sink.flush()
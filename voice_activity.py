@@ -0,0 +1,145 @@
+from collections import deque
+from typing import Optional, Tuple
+
+import numpy as np
+
+from livekit_config import VOICE_SETTINGS
+
+
+class VoiceActivityDetector:
+    """
+    Energy + zero-crossing-rate voice activity detector for int16 PCM.
+
+    Chunks are split into short frames and analysed with numpy. A frame is speech when its
+    RMS is well above an adaptive noise floor (and above an absolute minimum) and its
+    zero-crossing rate is not noise-like. Speech is extended by a hangover, and a pre-roll
+    before the onset is kept so the first syllable isn't clipped.
+
+    The detector works on byte offsets of the recorded stream: `speech_range()` tells which
+    part of the recording to upload (trailing silence trimmed).
+    """
+
+    def __init__(self, sample_rate: int, channels: int = 1, sample_width: int = 2, settings: dict = None):
+        settings = {**VOICE_SETTINGS, **(settings or {})}
+        self.channels = channels
+        self.frame_samples = max(1, int(sample_rate * settings["vad_frame_ms"] / 1000))
+        self.frame_bytes = self.frame_samples * channels * sample_width
+        frame_seconds = self.frame_samples / sample_rate
+
+        self.min_rms = settings["silence_threshold"]           # Absolute floor, fraction of full scale
+        self.snr_ratio = settings["vad_snr_ratio"]             # Speech must be this many times above noise
+        self.max_zcr = settings["vad_max_zcr"]                 # Hiss/noise crosses zero more often than speech
+        self.noise_adaptation = settings["vad_noise_adaptation"]
+        self.hangover_frames = int(round(settings["vad_hangover_ms"] / 1000 / frame_seconds))
+        self.pre_roll_frames = int(round(settings["vad_pre_roll_ms"] / 1000 / frame_seconds))
+        self.endpoint_frames = max(1, int(round(settings["silence_duration"] / frame_seconds)))
+        self.no_speech_frames = max(1, int(round(settings["no_speech_timeout"] / frame_seconds)))
+        self.reset()
+
+    def reset(self):
+        self.noise_floor: Optional[float] = None
+        self.speech_start_byte: Optional[int] = None # Onset minus pre-roll
+        self.speech_end_byte: Optional[int] = None   # Last speech frame plus hangover
+        self._frames_seen = 0
+        self._silent_frames = 0
+        self._hangover_left = 0
+        self._recent_frame_starts = deque(maxlen=self.pre_roll_frames + 1)
+        self._remainder = b""
+
+    @property
+    def speech_started(self) -> bool:
+        return self.speech_start_byte is not None
+
+    @property
+    def speech_paused(self) -> bool:
+        """Speech started and the hangover ran out: speech_end_byte stays put unless speech resumes"""
+        return self.speech_started and self._silent_frames >= max(1, self.hangover_frames)
+
+    def frame_features(self, pcm) -> Tuple[np.ndarray, np.ndarray]:
+        """(rms, zcr) per frame for whole frames in `pcm`; rms is a fraction of full scale"""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        frame_count = len(samples) // (self.frame_samples * self.channels)
+        frames = samples[:frame_count * self.frame_samples * self.channels].reshape(frame_count, self.frame_samples, self.channels)
+        frames = frames.mean(axis=2, dtype=np.float32) / 32768.0 if self.channels > 1 else frames[:, :, 0] / np.float32(32768.0)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / max(1, self.frame_samples - 1)
+        return rms, zcr
+
+    def process(self, chunk: bytes) -> bool:
+        """
+        Feeds the next recorded chunk. Returns True when the utterance has ended
+        (enough silence after speech, or no speech at all for no_speech_timeout).
+        """
+        pcm = self._remainder + chunk if self._remainder else chunk
+        whole = len(pcm) - len(pcm) % self.frame_bytes
+        self._remainder = bytes(pcm[whole:])
+        if not whole:
+            return False
+
+        rms, zcr = self.frame_features(memoryview(pcm)[:whole])
+        ended = False
+        for frame_rms, frame_zcr in zip(rms.tolist(), zcr.tolist()):
+            frame_start = self._frames_seen * self.frame_bytes
+            self._frames_seen += 1
+            self._recent_frame_starts.append(frame_start)
+
+            if self.noise_floor is None:
+                self.noise_floor = frame_rms
+            threshold = max(self.min_rms, self.noise_floor * self.snr_ratio)
+            is_speech = frame_rms > threshold and frame_zcr < self.max_zcr
+
+            if is_speech:
+                if not self.speech_started:
+                    # Onset: include the pre-roll frames before it
+                    self.speech_start_byte = self._recent_frame_starts[0]
+                self._hangover_left = self.hangover_frames
+                self._silent_frames = 0
+                self.speech_end_byte = frame_start + self.frame_bytes
+            else:
+                # Only non-speech frames adapt the noise floor
+                self.noise_floor += self.noise_adaptation * (frame_rms - self.noise_floor)
+                if self._hangover_left > 0:
+                    self._hangover_left -= 1
+                    self.speech_end_byte = frame_start + self.frame_bytes
+                self._silent_frames += 1
+
+            if self.speech_started and self._silent_frames >= self.endpoint_frames:
+                ended = True
+            elif not self.speech_started and self._frames_seen >= self.no_speech_frames:
+                ended = True
+        return ended
+
+    def speech_range(self, total_bytes: int) -> Optional[Tuple[int, int]]:
+        """Byte range of the recording to keep (pre-roll .. end of speech + hangover), None if no speech"""
+        if not self.speech_started:
+            return None
+        return self.speech_start_byte, min(self.speech_end_byte, total_bytes)
+
+
+# Cost per 100 ms chunk and endpointing on a synthetic recording
+if __name__ == '__main__':
+    import timeit
+
+    rate = 16000
+    rng = np.random.default_rng(0)
+    t = np.arange(rate) / rate
+    silence = (rng.normal(0, 30, rate // 2)).astype(np.int16)
+    speech = (np.sin(2 * np.pi * 220 * t) * 6000 + rng.normal(0, 30, rate)).astype(np.int16)
+    recording = np.concatenate([silence, speech, silence, silence, silence]).tobytes()
+
+    vad = VoiceActivityDetector(rate)
+    chunk_bytes = int(rate * VOICE_SETTINGS["chunk_duration"]) * 2
+    chunks = [recording[i:i + chunk_bytes] for i in range(0, len(recording), chunk_bytes)]
+    for i, chunk in enumerate(chunks):
+        if vad.process(chunk):
+            print(f"Endpoint after {(i + 1) * VOICE_SETTINGS['chunk_duration']:.1f} s of audio")
+            break
+    start, end = vad.speech_range(len(recording))
+    print(f"Speech range: {start / 2 / rate:.2f}-{end / 2 / rate:.2f} s, upload {end - start} of {len(recording)} bytes")
+
+    vad.reset()
+    runs = 2000
+    per_chunk = timeit.timeit(lambda: vad.process(chunks[3]), number=runs) / runs * 1e6
+    legacy = timeit.timeit(lambda: max(chunks[3]), number=runs) / runs * 1e6
+    print(f"Per 100 ms chunk: VAD {per_chunk:.1f} us, old max(bytes) {legacy:.1f} us")
@@ -1,46 +1,82 @@
 import asyncio
 import io
-import wave
 import pyaudio
 import threading
 from typing import Optional, Callable
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from model_gateway import ModelGateway, get_gateway
 from livekit_config import VOICE_SETTINGS, TTS_SETTINGS, STT_SETTINGS
-import tempfile
-import os
+from audio_buffer import PcmBuffer, encode_wav, convert_pcm16
+from voice_activity import VoiceActivityDetector
+from audio_output import PlaybackEngine
+from tts_pipeline import StreamingSpeaker, split_sentences
+from tts_cache import TtsCache, template_phrases
+from tracing import span, start_trace
+from metrics import registry
+
+STT_AUDIO_SECONDS = registry.counter("stt_audio_seconds_total", "Seconds of recorded speech sent to STT")
 
 class VoiceHandler:
     """Handles voice recording, STT, TTS, and audio playback"""
     
-    def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+    def __init__(self, client: ModelGateway = None):
+        self.client = client or get_gateway()
         self.audio = pyaudio.PyAudio()
         self.is_recording = False
-        self.is_playing = False
         self.recording_thread = None
-        self.audio_data = []
+        self._recording_lock = threading.Lock() # Button stop and auto-stop can race
         
         # Audio settings
         self.sample_rate = VOICE_SETTINGS["sample_rate"]
         self.channels = VOICE_SETTINGS["channels"]
+        self.sample_width = self.audio.get_sample_size(pyaudio.paInt16)
         self.chunk_size = int(self.sample_rate * VOICE_SETTINGS["chunk_duration"])
-        self.silence_threshold = VOICE_SETTINGS["silence_threshold"]
-        self.silence_duration = VOICE_SETTINGS["silence_duration"]
+        
+        # Recorded PCM, preallocated for max_buffer_seconds and reused between recordings
+        self.audio_buffer = PcmBuffer(
+            int(VOICE_SETTINGS["max_buffer_seconds"] * self.sample_rate * self.channels * self.sample_width)
+        )
+        # Endpointing and trailing-silence trimming (thresholds in VOICE_SETTINGS)
+        self.vad = VoiceActivityDetector(self.sample_rate, self.channels, self.sample_width)
+        
+        # In-process playback: decode thread + persistent output stream (opened on first playback)
+        self.playback = PlaybackEngine(
+            self.audio, TTS_SETTINGS["pcm_sample_rate"],
+            max_queued_seconds=TTS_SETTINGS["playback_queue_seconds"],
+            max_pending_clips=TTS_SETTINGS["playback_max_clips"]
+        )
+        self.active_speaker: Optional[StreamingSpeaker] = None
+        
+        # Synthesized speech cache (memory + disk), keyed by text and TTS settings
+        self.tts_cache = TtsCache(
+            TTS_SETTINGS["cache_dir"],
+            memory_limit_bytes=TTS_SETTINGS["cache_memory_mb"] * 1024 * 1024,
+            disk_limit_bytes=TTS_SETTINGS["cache_disk_mb"] * 1024 * 1024
+        )
         
         # Callbacks
         self.on_recording_start: Optional[Callable] = None
         self.on_recording_stop: Optional[Callable] = None
         self.on_transcription_ready: Optional[Callable[[str], None]] = None
         self.on_audio_ready: Optional[Callable[[bytes], None]] = None
+        # Called from the recording thread with the (start, end) byte range of the speech so far
+        # whenever the speaker pauses; the endpoint may still follow or speech may resume
+        self.on_speech_pause: Optional[Callable[[int, int], None]] = None
+        
+    @property
+    def is_playing(self) -> bool:
+        return self.playback.is_playing
         
     def start_recording(self):
         """Starts voice recording in a separate thread"""
         if self.is_recording:
             return
             
+        # Barge-in: the user starts talking, the assistant stops
+        self.stop_playback()
+            
         self.is_recording = True
-        self.audio_data = []
+        self.audio_buffer.clear()
+        self.vad.reset()
         
         if self.on_recording_start:
             self.on_recording_start()
@@ -51,12 +87,13 @@ class VoiceHandler:
         
     def stop_recording(self):
         """Stops voice recording"""
-        if not self.is_recording:
-            return
-            
-        self.is_recording = False
+        with self._recording_lock:
+            if not self.is_recording:
+                return
+            self.is_recording = False
         
-        if self.recording_thread:
+        # On an automatic endpoint this runs on the recording thread itself, which is about to exit
+        if self.recording_thread and self.recording_thread is not threading.current_thread():
             self.recording_thread.join(timeout=2.0)
             
         if self.on_recording_stop:
@@ -73,22 +110,19 @@ class VoiceHandler:
                 frames_per_buffer=self.chunk_size
             )
             
-            silence_counter = 0
-            max_silence_chunks = int(self.silence_duration * self.sample_rate / self.chunk_size)
-            
+            paused_at = None
             while self.is_recording:
                 try:
                     data = stream.read(self.chunk_size, exception_on_overflow=False)
-                    self.audio_data.append(data)
+                    self.audio_buffer.append(data)
                     
-                    # Simple silence detection
-                    audio_level = max(data) if data else 0
-                    if audio_level < self.silence_threshold * 32767:  # 16-bit audio
-                        silence_counter += 1
-                        if silence_counter >= max_silence_chunks:
-                            break
-                    else:
-                        silence_counter = 0
+                    # Stop on end of speech (or if nothing is said)
+                    if self.vad.process(data):
+                        break
+                        
+                    if self.on_speech_pause and self.vad.speech_paused and self.vad.speech_end_byte != paused_at:
+                        paused_at = self.vad.speech_end_byte
+                        self.on_speech_pause(self.vad.speech_start_byte, paused_at)
                         
                 except Exception as e:
                     print(f"Error reading audio: {e}")
@@ -107,60 +141,59 @@ class VoiceHandler:
             
     async def transcribe_audio(self) -> Optional[str]:
         """Transcribes recorded audio using OpenAI Whisper"""
-        if not self.audio_data:
+        if not len(self.audio_buffer):
+            return None
+        
+        # Only the detected speech (with pre-roll) is uploaded, leading/trailing silence is dropped
+        speech_range = self.vad.speech_range(len(self.audio_buffer))
+        if speech_range is None:
+            print("No speech detected, skipping transcription")
             return None
             
         try:
-            # Convert audio data to WAV format
-            audio_bytes = b''.join(self.audio_data)
-            
-            # Create temporary WAV file
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-                with wave.open(temp_file.name, 'wb') as wav_file:
-                    wav_file.setnchannels(self.channels)
-                    wav_file.setsampwidth(self.audio.get_sample_size(pyaudio.paInt16))
-                    wav_file.setframerate(self.sample_rate)
-                    wav_file.writeframes(audio_bytes)
-                
-                # Transcribe using OpenAI
-                with open(temp_file.name, 'rb') as audio_file:
-                    response = await asyncio.to_thread(
-                        self.client.audio.transcriptions.create,
-                        model=STT_SETTINGS["model"],
-                        file=audio_file,
-                        language=STT_SETTINGS["language"],
-                        temperature=STT_SETTINGS["temperature"]
-                    )
-                    
-                # Clean up temp file
-                os.unlink(temp_file.name)
+            transcription = await self.transcribe_range(*speech_range)
+            
+            if self.on_transcription_ready and transcription:
+                self.on_transcription_ready(transcription)
                 
-                transcription = response.text.strip()
-                
-                if self.on_transcription_ready and transcription:
-                    self.on_transcription_ready(transcription)
-                    
-                return transcription
+            return transcription
                 
         except Exception as e:
             print(f"Error transcribing audio: {e}")
             return None
             
+    async def transcribe_range(self, start: int, end: int) -> str:
+        """
+        Transcribes bytes [start, end) of the recording. Safe while recording is still going on:
+        appends never touch an already recorded range.
+        """
+        seconds = (end - start) / (self.sample_rate * self.channels * self.sample_width)
+        STT_AUDIO_SECONDS.inc(seconds)
+        with start_trace("stt.transcribe", seconds=round(seconds, 2)):
+            # WAV is built in memory from the recording buffer, nothing is written to disk
+            with span("stt.encode"), self.audio_buffer.view() as pcm, pcm[start:end] as speech_pcm:
+                upload_pcm, rate, channels = convert_pcm16(
+                    speech_pcm, self.sample_rate, self.channels,
+                    target_rate=STT_SETTINGS["upload_sample_rate"],
+                    target_channels=STT_SETTINGS["upload_channels"]
+                )
+                wav_file = encode_wav(upload_pcm, rate, channels, self.sample_width)
+            
+            transcription = await self.client.transcribe(
+                model=STT_SETTINGS["model"],
+                file=wav_file,
+                language=STT_SETTINGS["language"],
+                temperature=STT_SETTINGS["temperature"]
+            )
+            return transcription.strip()
+            
     async def text_to_speech(self, text: str) -> Optional[bytes]:
         """Converts text to speech using OpenAI TTS"""
         if not text.strip():
             return None
             
         try:
-            response = await asyncio.to_thread(
-                self.client.audio.speech.create,
-                model=TTS_SETTINGS["model"],
-                voice=TTS_SETTINGS["voice"],
-                input=text,
-                speed=TTS_SETTINGS["speed"]
-            )
-            
-            audio_data = response.content
+            audio_data = await self._synthesize(text, TTS_SETTINGS["response_format"])
             
             if self.on_audio_ready:
                 self.on_audio_ready(audio_data)
@@ -171,42 +204,93 @@ class VoiceHandler:
             print(f"Error generating speech: {e}")
             return None
             
-    def play_audio(self, audio_data: bytes):
-        """Plays audio data"""
-        if self.is_playing:
-            return
+    async def synthesize_pcm(self, text: str) -> Optional[bytes]:
+        """Synthesizes one sentence as raw PCM (TTS_SETTINGS["stream_format"]) for the audio sink"""
+        if not text.strip():
+            return None
+            
+        try:
+            return await self._synthesize(text, TTS_SETTINGS["stream_format"])
+            
+        except Exception as e:
+            print(f"Error generating speech: {e}")
+            return None
             
-        def _play():
-            try:
-                self.is_playing = True
+    def tts_cache_key(self, text: str, response_format: str) -> str:
+        return TtsCache.make_key(text, TTS_SETTINGS["voice"], TTS_SETTINGS["model"], TTS_SETTINGS["speed"], response_format)
+        
+    async def _synthesize(self, text: str, response_format: str) -> bytes:
+        """TTS request through the cache: repeated lines cost no request and no latency"""
+        with span("tts.synthesize", chars=len(text), format=response_format) as tts_span:
+            key = self.tts_cache_key(text, response_format)
+            # Memory hits are served inline; the disk tier is read off the event loop
+            audio_data = self.tts_cache.get_memory(key)
+            if audio_data is None:
+                audio_data = await asyncio.to_thread(self.tts_cache.get, key)
+            tts_span.set_attribute("cache_hit", audio_data is not None)
+            if audio_data is not None:
+                return audio_data
                 
-                # Create temporary file for audio playback
-                with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
-                    temp_file.write(audio_data)
-                    temp_file.flush()
-                    
-                    # Use system audio player (cross-platform)
-                    if os.name == 'nt':  # Windows
-                        os.system(f'start /wait "" "{temp_file.name}"')
-                    elif os.name == 'posix':  # macOS/Linux
-                        os.system(f'afplay "{temp_file.name}" 2>/dev/null || aplay "{temp_file.name}" 2>/dev/null')
-                    
-                    # Clean up
-                    os.unlink(temp_file.name)
+            audio_data = await self.client.speech(
+                model=TTS_SETTINGS["model"],
+                voice=TTS_SETTINGS["voice"],
+                input=text,
+                speed=TTS_SETTINGS["speed"],
+                response_format=response_format
+            )
+            await asyncio.to_thread(self.tts_cache.put, key, audio_data)
+            return audio_data
+        
+    async def prewarm_tts_cache(self, phrases=None):
+        """
+        Synthesizes fixed template lines (greetings, reactions) that aren't cached yet.
+        Lines are cached per sentence in the stream format, the keys StreamingSpeaker looks up
+        when the model repeats them. After the first run they come from the disk cache.
+        """
+        if phrases is None:
+            from templates import templates
+            phrases = template_phrases(templates)
+        response_format = TTS_SETTINGS["stream_format"]
+        sentences = list(dict.fromkeys(sentence for phrase in phrases for sentence in split_sentences(phrase)))
+        missing = await asyncio.to_thread(
+            lambda: [text for text in sentences if self.tts_cache.get(self.tts_cache_key(text, response_format)) is None]
+        )
+        if not missing:
+            return
+            
+        semaphore = asyncio.Semaphore(TTS_SETTINGS["max_concurrent_synthesis"])
+        
+        async def warm(text):
+            async with semaphore:
+                try:
+                    await self._synthesize(text, response_format)
+                except Exception as e:
+                    print(f"Error prewarming TTS cache: {e}")
                     
-            except Exception as e:
-                print(f"Error playing audio: {e}")
-            finally:
-                self.is_playing = False
-                
-        # Play in separate thread to avoid blocking
-        play_thread = threading.Thread(target=_play)
-        play_thread.daemon = True
-        play_thread.start()
+        await asyncio.gather(*[warm(text) for text in missing])
+        print(f"TTS cache prewarmed: {len(missing)} sentences")
+            
+    def create_streaming_speaker(self) -> StreamingSpeaker:
+        """Speaker for a reply that is still streaming in (call from the event loop)"""
+        self.active_speaker = StreamingSpeaker(self.synthesize_pcm, self.playback)
+        return self.active_speaker
+        
+    def play_audio(self, audio_data: bytes, response_format: str = None):
+        """Queues audio (TTS_SETTINGS["response_format"] by default) after whatever is playing"""
+        self.playback.play(audio_data, response_format or TTS_SETTINGS["response_format"])
+        
+    def stop_playback(self):
+        """Stops speech right away: streamed synthesis is cancelled, queued audio dropped (call from the event loop)"""
+        if self.active_speaker:
+            self.active_speaker.cancel()
+            self.active_speaker = None
+        self.playback.flush()
         
     def cleanup(self):
         """Cleanup resources"""
         self.stop_recording()
+        if hasattr(self, 'playback'):
+            self.playback.close()
         if hasattr(self, 'audio'):
             self.audio.terminate()
             
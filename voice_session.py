@@ -0,0 +1,150 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from livekit_config import VOICE_SETTINGS
+from tracing import start_trace
+
+
+class TurnTimings:
+    """
+    Stage marks of one voice turn, in seconds after the endpoint (recording stopped).
+    Stages: transcript (STT result), first_token (LLM), first_audio (first sentence handed
+    to playback), done. Only the first mark of a stage counts.
+    """
+
+    __slots__ = ("endpoint_at", "marks", "speculative_stt", "cancelled")
+
+    STAGES = ("transcript", "first_token", "first_audio", "done")
+
+    def __init__(self, endpoint_at: float = None):
+        self.endpoint_at = endpoint_at if endpoint_at is not None else time.perf_counter()
+        self.marks: Dict[str, float] = {}
+        self.speculative_stt = False # Transcript came from STT started before the endpoint
+        self.cancelled = False       # Interrupted by barge-in
+
+    def mark(self, stage: str, at: float = None):
+        if stage not in self.marks:
+            self.marks[stage] = (at if at is not None else time.perf_counter()) - self.endpoint_at
+
+    def as_dict(self) -> Dict[str, float]:
+        return {stage: self.marks[stage] for stage in self.STAGES if stage in self.marks}
+
+    def __str__(self) -> str:
+        parts = [f"{stage} {seconds:.2f} s" for stage, seconds in self.as_dict().items()]
+        if self.speculative_stt:
+            parts.append("speculative STT")
+        if self.cancelled:
+            parts.append("cancelled")
+        return ", ".join(parts) or "no stages"
+
+
+class VoiceSession:
+    """
+    Overlaps the stages of a voice turn instead of running them back to back:
+
+    - STT starts on the speech recorded so far as soon as the speaker pauses, while the
+      endpoint (silence_duration of silence) is still being confirmed; if speech resumes the
+      speculative result is discarded. On the endpoint a matching result is reused as is.
+    - The reply (`respond`: LLM stream + sentence-by-sentence TTS) starts right after the transcript.
+    - Starting a new recording (barge-in) cancels the running turn and stops playback.
+
+    Entry points called from the recording thread go through `run_task` (e.g. page.run_task),
+    all turn state lives on the event loop.
+    """
+
+    def __init__(self, voice_handler, respond: Callable[[Optional[str], TurnTimings], Awaitable[None]],
+                 run_task: Callable, speculative_stt: bool = None):
+        self.voice_handler = voice_handler
+        self.respond = respond
+        self.run_task = run_task
+        self.speculative_stt = VOICE_SETTINGS["speculative_stt"] if speculative_stt is None else speculative_stt
+        self.turns: deque = deque(maxlen=VOICE_SETTINGS["turn_history_size"])
+        self._speculative: Optional[Tuple[Tuple[int, int], asyncio.Task]] = None
+        self._turn: Optional[asyncio.Task] = None
+        if self.speculative_stt:
+            voice_handler.on_speech_pause = self._on_speech_pause
+
+    # Any thread
+
+    def _on_speech_pause(self, start: int, end: int):
+        self.run_task(self._speculate, start, end)
+
+    def endpoint(self):
+        """Recording stopped (auto endpoint or button): runs the turn for what was recorded"""
+        self.run_task(self._run_turn, time.perf_counter())
+
+    # Event loop
+
+    def barge_in(self):
+        """The user started speaking again: drop the running turn and whatever is being said"""
+        self._discard_speculative()
+        if self._turn and not self._turn.done():
+            self._turn.cancel()
+        self.voice_handler.stop_playback()
+
+    async def _speculate(self, start: int, end: int):
+        if self._speculative and self._speculative[0] == (start, end):
+            return
+        self._discard_speculative()
+        task = asyncio.get_running_loop().create_task(self.voice_handler.transcribe_range(start, end))
+        self._speculative = ((start, end), task)
+
+    def _discard_speculative(self):
+        if self._speculative:
+            self._speculative[1].cancel()
+            self._speculative = None
+
+    async def _transcribe(self, timings: TurnTimings) -> Optional[str]:
+        speech_range = self.voice_handler.vad.speech_range(len(self.voice_handler.audio_buffer))
+        speculative, self._speculative = self._speculative, None
+        if speech_range is None:
+            if speculative:
+                speculative[1].cancel()
+            print("No speech detected, skipping transcription")
+            return None
+
+        if speculative and speculative[0] == speech_range:
+            try:
+                transcription = await speculative[1]
+                timings.speculative_stt = True
+                return transcription
+            except Exception as e:
+                print(f"Speculative transcription failed, retrying: {e}")
+        elif speculative:
+            speculative[1].cancel() # Speech resumed after the pause, the result is outdated
+
+        return await self.voice_handler.transcribe_range(*speech_range)
+
+    async def _run_turn(self, endpoint_at: float):
+        if self._turn and not self._turn.done():
+            self._turn.cancel()
+        self._turn = asyncio.current_task()
+        timings = TurnTimings(endpoint_at)
+        try:
+            with start_trace("voice.turn") as turn_span:
+                try:
+                    transcription = await self._transcribe(timings)
+                except Exception as e:
+                    print(f"Error transcribing audio: {e}")
+                    transcription = None
+                timings.mark("transcript")
+                turn_span.set_attribute("speculative_stt", timings.speculative_stt)
+                await self.respond(transcription or None, timings)
+                timings.mark("done")
+        except asyncio.CancelledError:
+            timings.cancelled = True
+            raise
+        finally:
+            self.turns.append(timings)
+            print(f"Voice turn: {timings}")
+
+    def stage_percentiles(self, percentile: float = 50) -> Dict[str, float]:
+        """Latency of each stage (seconds after the endpoint) over the completed recent turns"""
+        result = {}
+        for stage in TurnTimings.STAGES:
+            values = sorted(t.marks[stage] for t in self.turns if stage in t.marks and not t.cancelled)
+            if values:
+                result[stage] = values[min(len(values) - 1, int(len(values) * percentile / 100))]
+        return result